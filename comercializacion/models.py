@@ -3,7 +3,7 @@ from django.conf import settings
 from django.utils import timezone
 from decimal import Decimal
 
-from produccion.models import Lote
+from produccion.models import Lote, generar_codigos
 
 
 class Cliente(models.Model):
@@ -73,18 +73,11 @@ class PedidoMayorista(models.Model):
         return self.codigo
 
     def save(self, *args, **kwargs):
-        if not self.pk and not self.codigo:
-            prefijo = "PM"
-            now = timezone.now()
-            year_month = now.strftime("%y%m")
-            ultimo = PedidoMayorista.objects.filter(codigo__startswith=f"{prefijo}{year_month}").order_by(
-                "codigo"
-            ).last()
-            correlativo = int(ultimo.codigo.split("-")[-1]) + 1 if ultimo else 1
-            self.codigo = f"{prefijo}{year_month}-{correlativo:03d}"
-
         self.total_venta = self.toneladas_solicitadas * self.precio_unitario_ton
-        super().save(*args, **kwargs)
+        with transaction.atomic():
+            if not self.pk and not self.codigo:
+                self.codigo = generar_codigos(PedidoMayorista, "codigo", "PM", 3)[0]
+            super().save(*args, **kwargs)
 
 
 class DetallePedidoMayorista(models.Model):
@@ -141,16 +134,10 @@ class VentaMinoristaPOS(VentaMinoristaBase):
         return self.codigo
 
     def save(self, *args, **kwargs):
-        if not self.pk and not self.codigo:
-            prefijo = "VP"
-            now = timezone.now()
-            year_month = now.strftime("%y%m")
-            ultimo = VentaMinoristaPOS.objects.filter(codigo__startswith=f"{prefijo}{year_month}").order_by(
-                "codigo"
-            ).last()
-            correlativo = int(ultimo.codigo.split("-")[-1]) + 1 if ultimo else 1
-            self.codigo = f"{prefijo}{year_month}-{correlativo:04d}"
-        super().save(*args, **kwargs)
+        with transaction.atomic():
+            if not self.pk and not self.codigo:
+                self.codigo = generar_codigos(VentaMinoristaPOS, "codigo", "VP", 4)[0]
+            super().save(*args, **kwargs)
 
 
 class DetalleVentaPOS(models.Model):
@@ -187,16 +174,10 @@ class VentaMinoristaPedido(VentaMinoristaBase):
         return self.codigo
 
     def save(self, *args, **kwargs):
-        if not self.pk and not self.codigo:
-            prefijo = "VR"
-            now = timezone.now()
-            year_month = now.strftime("%y%m")
-            ultimo = VentaMinoristaPedido.objects.filter(codigo__startswith=f"{prefijo}{year_month}").order_by(
-                "codigo"
-            ).last()
-            correlativo = int(ultimo.codigo.split("-")[-1]) + 1 if ultimo else 1
-            self.codigo = f"{prefijo}{year_month}-{correlativo:04d}"
-        super().save(*args, **kwargs)
+        with transaction.atomic():
+            if not self.pk and not self.codigo:
+                self.codigo = generar_codigos(VentaMinoristaPedido, "codigo", "VR", 4)[0]
+            super().save(*args, **kwargs)
 
 
 class DetalleVentaPedido(models.Model):
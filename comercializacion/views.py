@@ -10,6 +10,7 @@ from django.urls import reverse_lazy
 from django.views.generic import ListView, CreateView, UpdateView, DetailView
 
 from produccion.models import Lote
+from usuarios.roles import tiene_grupo
 
 from .forms import (
     ClienteForm,
@@ -36,7 +37,7 @@ class ComercializacionPermissionMixin(LoginRequiredMixin, UserPassesTestMixin):
     """Restringe acceso a usuarios del grupo Comercializacion o staff."""
 
     def test_func(self):
-        return self.request.user.is_staff or self.request.user.groups.filter(name="Comercializacion").exists()
+        return self.request.user.is_staff or tiene_grupo(self.request.user, "Comercializacion")
 
 
 @login_required
@@ -0,0 +1,85 @@
+from datetime import timedelta
+import numpy as np
+from .models import Insumo
+
+try:
+    from produccion.crecimiento import pronostico_crecimiento
+except ImportError:
+    pronostico_crecimiento = None
+
+# ================================================================
+# PROYECCIÓN DE DEMANDA DE ALIMENTO
+# ================================================================
+# Parte del pronóstico de crecimiento de produccion (peso, talla y peces por
+# lote y día) y aplica las mismas tablas que Lote.racion_alimentaria_porcentaje
+# y Lote.tipo_alimento como búsquedas sobre arreglos: la ración de todos los
+# lotes en todos los días se calcula de una vez y se suma por tipo de alimento.
+
+HORIZONTES = (30, 60, 90)
+
+# Misma tabla que Lote.racion_alimentaria_porcentaje (% de la biomasa según el peso en g)
+LIMITES_PESO_GR = np.array([20, 50, 100, 150, 250])
+RACION_PORCENTAJE = np.array([2.8, 2.5, 2.2, 1.9, 1.5, 1.2])
+
+# Misma tabla que Lote.tipo_alimento (según la talla máxima en cm)
+LIMITES_TALLA_CM = np.array([8, 10, 15, 20])
+TIPOS_ALIMENTO = ('Alevines 1', 'Alevines 2', 'Crecimiento 1', 'Crecimiento 2', 'Engorde')
+
+
+def demanda_diaria_por_tipo(pronostico):
+    """
+    Matriz tipo de alimento (en el orden de TIPOS_ALIMENTO) × día con los kg
+    que pide la granja. Como en Lote.alimento_diario_kg, los lotes sin talla
+    no suman ración.
+    """
+    # Con los mismos decimales que Lote: (raíz cúbica)³ deja restos como 50.000000001
+    peso = np.round(pronostico.peso_gr, 2)
+    talla = np.round(np.nan_to_num(pronostico.talla_cm), 2)
+    # side='left' reproduce los "<=" de las tablas
+    racion = RACION_PORCENTAJE[np.searchsorted(LIMITES_PESO_GR, peso, side='left')]
+    alimento = np.where(talla > 0, np.round(pronostico.biomasa_kg * racion / 100, 2), 0)
+    tipo = np.searchsorted(LIMITES_TALLA_CM, talla, side='left')
+
+    dias = peso.shape[1]
+    celdas = tipo * dias + np.arange(dias)
+    return np.bincount(
+        celdas.ravel(), weights=alimento.ravel(), minlength=len(TIPOS_ALIMENTO) * dias
+    ).reshape(len(TIPOS_ALIMENTO), dias)
+
+
+def proyectar_demanda_alimento(horizontes=HORIZONTES):
+    """
+    Demanda acumulada de cada tipo de alimento a `horizontes` días y los días
+    que cubre el stock actual del Insumo del mismo nombre (None si alcanza
+    para todo el pronóstico). El día 0 es hoy.
+    """
+    if pronostico_crecimiento is None:
+        return []
+    pronostico = pronostico_crecimiento()
+    demanda = demanda_diaria_por_tipo(pronostico)
+    acumulada = np.cumsum(demanda, axis=1)
+    dias = demanda.shape[1]
+    horizontes = [h for h in horizontes if h < dias]
+
+    insumos = Insumo.objects.in_bulk(list(TIPOS_ALIMENTO), field_name='nombre')
+    proyeccion = []
+    for j, nombre in enumerate(TIPOS_ALIMENTO):
+        if not acumulada[j, -1]:
+            continue
+        insumo = insumos.get(nombre)
+        stock = float(insumo.stock_actual) if insumo else 0.0
+        # Días completos que se pueden despachar antes de quedarse sin stock
+        cubiertos = int(np.searchsorted(acumulada[j], stock + 1e-9, side='right'))
+        proyeccion.append({
+            'insumo_id': insumo.id if insumo else None,
+            'nombre': nombre,
+            'stock_actual': stock,
+            'demanda_hoy_kg': round(float(demanda[j, 0]), 2),
+            # Consumo de los próximos h días, sin contar el de hoy
+            'demanda_kg': [
+                {'dias': h, 'kg': round(float(acumulada[j, h] - acumulada[j, 0]), 2)} for h in horizontes
+            ],
+            'dias_cobertura': cubiertos if cubiertos < dias else None,
+            'fecha_quiebre': pronostico.fecha + timedelta(days=cubiertos) if cubiertos < dias else None,
+        })
+    return proyeccion
@@ -7,13 +7,14 @@ from .models import Proveedor, CategoriaInsumo, Insumo, OrdenCompra, DetalleOrde
 class ProveedorForm(forms.ModelForm):
     class Meta:
         model = Proveedor
-        fields = ['nombre', 'ruc', 'direccion', 'telefono', 'email']
+        fields = ['nombre', 'ruc', 'direccion', 'telefono', 'email', 'dias_entrega']
         widgets = {
             'nombre': forms.TextInput(attrs={'class': 'form-control', 'placeholder': 'Ej: Proveedor S.A.C.'}),
             'ruc': forms.TextInput(attrs={'class': 'form-control', 'placeholder': 'Ej: 20123456789'}),
             'direccion': forms.TextInput(attrs={'class': 'form-control', 'placeholder': 'Ej: Av. Principal 123'}),
             'telefono': forms.TextInput(attrs={'class': 'form-control', 'placeholder': 'Ej: 987654321'}),
             'email': forms.EmailInput(attrs={'class': 'form-control', 'placeholder': 'Ej: contacto@proveedor.com'}),
+            'dias_entrega': forms.NumberInput(attrs={'class': 'form-control', 'placeholder': 'Ej: 7'}),
         }
 
 class CategoriaInsumoForm(forms.ModelForm):
@@ -0,0 +1,33 @@
+from datetime import date
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Min
+from django.utils import timezone
+from logistica.models import MovimientoInventario, SaldoMensualInsumo, reconstruir_saldos_mensuales
+
+class Command(BaseCommand):
+    help = 'Reconstruye los saldos mensuales de inventario (SaldoMensualInsumo) a partir de los movimientos'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--desde', help='Mes inicial en formato AAAA-MM. Por defecto, el mes del primer movimiento.')
+
+    def handle(self, *args, **options):
+        if options['desde']:
+            try:
+                year, month = (int(parte) for parte in options['desde'].split('-'))
+                desde = date(year, month, 1)
+            except ValueError:
+                raise CommandError("--desde debe tener el formato AAAA-MM")
+        else:
+            primero = MovimientoInventario.objects.aggregate(primero=Min('fecha'))['primero']
+            if primero is None:
+                self.stdout.write(self.style.WARNING("No hay movimientos de inventario."))
+                return
+            desde = timezone.localtime(primero).date()
+
+        with transaction.atomic():
+            if not options['desde']:
+                # Reconstrucción completa: se descartan las fotos existentes
+                SaldoMensualInsumo.objects.all().delete()
+            total = reconstruir_saldos_mensuales(desde)
+        self.stdout.write(self.style.SUCCESS(f"{total} saldos mensuales reconstruidos desde {desde.strftime('%m/%Y')}."))
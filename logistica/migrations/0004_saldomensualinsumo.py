@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-17 18:46
+
+import django.db.models.deletion
+from decimal import Decimal
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('logistica', '0003_remove_proveedor_activo_proveedor_estado'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SaldoMensualInsumo',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('periodo', models.DateField(help_text='Primer día del mes')),
+                ('saldo_inicial', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=12)),
+                ('entradas', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=12)),
+                ('salidas', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=12)),
+                ('saldo_final', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=12)),
+                ('insumo', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='saldos_mensuales', to='logistica.insumo')),
+            ],
+            options={
+                'ordering': ['-periodo'],
+                'indexes': [models.Index(fields=['periodo'], name='logistica_s_periodo_81c1e5_idx')],
+                'unique_together': {('insumo', 'periodo')},
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-17 19:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('logistica', '0004_saldomensualinsumo'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='proveedor',
+            name='dias_entrega',
+            field=models.PositiveIntegerField(default=7, help_text='Días habituales entre el pedido y la entrega; lo usa el plan de reposición', verbose_name='Plazo de Entrega (días)'),
+        ),
+        migrations.AlterField(
+            model_name='ordencompra',
+            name='estado',
+            field=models.CharField(choices=[('BORRADOR', 'Borrador'), ('PENDIENTE', 'Pendiente'), ('APROBADA', 'Aprobada'), ('RECIBIDA', 'Recibida'), ('CANCELADA', 'Cancelada')], default='PENDIENTE', max_length=10),
+        ),
+    ]
@@ -1,11 +1,14 @@
 from django.db import models, transaction
 from django.conf import settings
 from django.utils import timezone
-from django.db.models import F, Sum
-from django.db.models.functions import Coalesce
+from django.db.models import F, Q, Sum, Max, Min, OuterRef, Subquery
+from django.db.models.functions import Coalesce, TruncMonth
+from datetime import date, datetime, time, timedelta
 from decimal import Decimal
 from django.db.models.signals import post_save
-from django.dispatch import receiver
+from django.dispatch import Signal, receiver
+
+from produccion.models import generar_codigos
 
 # ================================================================
 # ACTIVIDAD 3: REGISTRAR PROVEEDORES
@@ -17,6 +20,7 @@ class Proveedor(models.Model):
     telefono = models.CharField(max_length=20, blank=True, null=True, verbose_name="Teléfono")
     email = models.EmailField(blank=True, null=True, verbose_name="Correo Electrónico")
     estado = models.BooleanField(default=True)
+    dias_entrega = models.PositiveIntegerField(default=7, verbose_name="Plazo de Entrega (días)", help_text="Días habituales entre el pedido y la entrega; lo usa el plan de reposición")
 
     def __str__(self):
         return self.nombre
@@ -58,6 +62,7 @@ class Insumo(models.Model):
 # ================================================================
 class OrdenCompra(models.Model):
     ESTADOS = (
+        ('BORRADOR', 'Borrador'),
         ('PENDIENTE', 'Pendiente'),
         ('APROBADA', 'Aprobada'),
         ('RECIBIDA', 'Recibida'),
@@ -72,40 +77,83 @@ class OrdenCompra(models.Model):
     creado_por = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, related_name="ordenes_creadas")
     total_costo = models.DecimalField(max_digits=12, decimal_places=2, default=Decimal('0.00'), editable=False)
 
+    # Solo se reciben órdenes emitidas: los borradores y las canceladas no entran al stock
+    ESTADOS_RECIBIBLES = ['PENDIENTE', 'APROBADA']
+
     def __str__(self):
         return self.codigo_orden
 
-    def save(self, *args, **kwargs):
-        if not self.pk:
-            prefijo = 'OC'
-            now = timezone.now()
-            year_month = now.strftime('%y%m')
-            ultimo = OrdenCompra.objects.filter(codigo_orden__startswith=f'{prefijo}{year_month}').order_by('codigo_orden').last()
-            correlativo = int(ultimo.codigo_orden.split('-')[-1]) + 1 if ultimo else 1
-            self.codigo_orden = f'{prefijo}{year_month}-{correlativo:03d}'
+    @property
+    def puede_recibirse(self):
+        return self.estado in self.ESTADOS_RECIBIBLES
 
+    def save(self, *args, **kwargs):
         # Recalcular total si no se está recibiendo
         if self.pk and self.estado != 'RECIBIDA':
             self.total_costo = self.detalles.aggregate(
                 total=Coalesce(Sum(F('cantidad') * F('precio_unitario')), Decimal('0.00'))
             )['total']
 
-        super().save(*args, **kwargs)
+        with transaction.atomic():
+            if not self.pk:
+                self.codigo_orden = generar_codigos(OrdenCompra, 'codigo_orden', 'OC', 3)[0]
+            super().save(*args, **kwargs)
+
+    def marcar_como_recibida(self, usuario=None):
+        """
+        Recibe la orden y registra todas sus entradas de inventario en una
+        sola operación. Devuelve False si la orden no estaba pendiente o aprobada.
+        """
+        recibidas = recibir_ordenes_compra([self.pk], usuario=usuario or self.creado_por)
+        if recibidas:
+            self.estado = 'RECIBIDA'
+        return bool(recibidas)
+
 
-    def marcar_como_recibida(self):
-        """Recibir la orden y actualizar inventario."""
-        if self.estado != 'RECIBIDA':
-            with transaction.atomic():
-                for detalle in self.detalles.all():
-                    MovimientoInventario.objects.create(
-                        insumo=detalle.insumo,
-                        tipo_movimiento='ENTRADA',
-                        cantidad=detalle.cantidad,
-                        usuario=self.creado_por,
-                        descripcion=f"Entrada automática por OC: {self.codigo_orden}"
-                    )
-                self.estado = 'RECIBIDA'
-                self.save()
+def recibir_ordenes_compra(orden_ids, usuario=None):
+    """
+    Recibe varias órdenes de compra a la vez (p. ej. el camión semanal de un
+    proveedor). Las consultas no dependen de la cantidad de líneas: un
+    SELECT de las órdenes, uno de sus detalles, un UPDATE de stock por
+    insumo, un bulk_create de movimientos y un UPDATE final que marca las
+    órdenes y recalcula su total. Solo se reciben órdenes PENDIENTE o
+    APROBADA; las recibidas, canceladas y en borrador se omiten.
+    Devuelve la lista de órdenes recibidas en esta llamada.
+    """
+    with transaction.atomic():
+        # Se bloquean las órdenes para que dos recepciones simultáneas no dupliquen las entradas
+        ordenes = list(
+            OrdenCompra.objects.select_for_update()
+            .filter(pk__in=orden_ids, estado__in=OrdenCompra.ESTADOS_RECIBIBLES)
+            .order_by('pk')
+        )
+        if not ordenes:
+            return []
+        codigos = {orden.pk: orden.codigo_orden for orden in ordenes}
+
+        detalles = DetalleOrdenCompra.objects.filter(orden_compra_id__in=codigos).order_by('orden_compra_id', 'pk')
+        registrar_movimientos([
+            MovimientoInventario(
+                insumo_id=detalle.insumo_id,
+                tipo_movimiento='ENTRADA',
+                cantidad=detalle.cantidad,
+                usuario=usuario,
+                descripcion=f"Entrada automática por OC: {codigos[detalle.orden_compra_id]}"
+            )
+            for detalle in detalles
+        ])
+
+        total = DetalleOrdenCompra.objects.filter(orden_compra=OuterRef('pk')).values('orden_compra').annotate(
+            total=Sum(F('cantidad') * F('precio_unitario'))
+        ).values('total')
+        OrdenCompra.objects.filter(pk__in=codigos).update(
+            estado='RECIBIDA',
+            total_costo=Coalesce(Subquery(total, output_field=models.DecimalField()), Decimal('0.00')),
+        )
+
+    for orden in ordenes:
+        orden.estado = 'RECIBIDA'
+    return ordenes
 
 
 class DetalleOrdenCompra(models.Model):
@@ -125,6 +173,26 @@ class DetalleOrdenCompra(models.Model):
 # ================================================================
 # ACTIVIDAD 1: REGISTRAR ENTRADAS Y SALIDAS
 # ================================================================
+TIPOS_ENTRADA = ['ENTRADA', 'AJUSTE_POS']
+TIPOS_SALIDA = ['SALIDA', 'AJUSTE_NEG']
+
+# Se envía cada vez que cambia stock_actual con un UPDATE directo (que no
+# dispara post_save de Insumo). Argumentos: insumo_ids.
+stock_actualizado = Signal()
+
+
+class StockInsuficienteError(Exception):
+    """Un movimiento dejaría el stock de un insumo en negativo."""
+    def __init__(self, insumo, cantidad, stock_actual):
+        self.insumo = insumo
+        self.cantidad = cantidad
+        self.stock_actual = stock_actual
+        super().__init__(
+            f"Stock insuficiente para '{insumo.nombre}'. Se necesitan {cantidad} {insumo.unidad_medida}, "
+            f"pero solo hay {stock_actual} {insumo.unidad_medida}."
+        )
+
+
 class MovimientoInventario(models.Model):
     TIPOS_MOVIMIENTO = (
         ('ENTRADA', 'Entrada (Compra/Ingreso)'),
@@ -143,5 +211,225 @@ class MovimientoInventario(models.Model):
     def __str__(self):
         return f"{self.get_tipo_movimiento_display()} de {self.cantidad} {self.insumo.unidad_medida} de {self.insumo.nombre}"
 
+    def save(self, *args, **kwargs):
+        # El stock se descuenta en pre_save (signals.py): UPDATE e INSERT van en la misma transacción
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
+    @property
+    def variacion_stock(self):
+        """Cantidad con signo: positiva para entradas, negativa para salidas."""
+        return self.cantidad if self.tipo_movimiento in TIPOS_ENTRADA else -self.cantidad
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Se guarda la fecha e insumo originales para recalcular los saldos si se editan
+        instance._original = (instance.__dict__.get('fecha'), instance.__dict__.get('insumo_id'))
+        return instance
+
     class Meta:
         ordering = ['-fecha']
+
+
+def aplicar_variaciones_stock(variaciones):
+    """
+    Aplica {insumo_id: variación} al stock con UPDATEs condicionales: una
+    salida solo se descuenta si `stock_actual >= cantidad` en ese mismo
+    UPDATE, así dos despachos simultáneos no pueden dejarlo en negativo.
+    Lanza StockInsuficienteError; llamar dentro de una transacción.
+    """
+    # Orden fijo por id para que dos operaciones concurrentes no se bloqueen mutuamente
+    for insumo_id in sorted(variaciones):
+        variacion = variaciones[insumo_id]
+        if not variacion:
+            continue
+        insumos = Insumo.objects.filter(pk=insumo_id)
+        if variacion < 0:
+            insumos = insumos.filter(stock_actual__gte=-variacion)
+        if not insumos.update(stock_actual=F('stock_actual') + variacion):
+            insumo = Insumo.objects.get(pk=insumo_id)
+            raise StockInsuficienteError(insumo, -variacion, insumo.stock_actual)
+    stock_actualizado.send(sender=Insumo, insumo_ids=[i for i, v in variaciones.items() if v])
+
+
+def registrar_movimientos(movimientos):
+    """
+    Registra varios movimientos (instancias sin guardar) como una sola
+    operación: un UPDATE condicional por insumo y un único bulk_create.
+    Si algún insumo no alcanza, no se aplica ninguno.
+    """
+    variaciones = {}
+    for movimiento in movimientos:
+        variaciones[movimiento.insumo_id] = variaciones.get(movimiento.insumo_id, Decimal('0')) + movimiento.variacion_stock
+
+    with transaction.atomic():
+        aplicar_variaciones_stock(variaciones)
+        # bulk_create no dispara las señales de stock, que ya se aplicó arriba
+        creados = MovimientoInventario.objects.bulk_create(movimientos)
+        programar_reconstruccion_saldos([m.fecha for m in creados], variaciones.keys())
+    return creados
+
+
+# ================================================================
+# SALDOS MENSUALES (CIERRE DE PERIODO)
+# ================================================================
+class SaldoMensualInsumo(models.Model):
+    """
+    Foto del inventario de un insumo al cierre de cada mes. Hay una fila por
+    insumo y mes desde su primer movimiento, de modo que el resumen de
+    cualquier mes es una sola lectura por `periodo`.
+    """
+    insumo = models.ForeignKey(Insumo, on_delete=models.CASCADE, related_name="saldos_mensuales")
+    periodo = models.DateField(help_text="Primer día del mes")
+    saldo_inicial = models.DecimalField(max_digits=12, decimal_places=2, default=Decimal('0.00'))
+    entradas = models.DecimalField(max_digits=12, decimal_places=2, default=Decimal('0.00'))
+    salidas = models.DecimalField(max_digits=12, decimal_places=2, default=Decimal('0.00'))
+    saldo_final = models.DecimalField(max_digits=12, decimal_places=2, default=Decimal('0.00'))
+
+    class Meta:
+        unique_together = ('insumo', 'periodo')
+        indexes = [models.Index(fields=['periodo'])]
+        ordering = ['-periodo']
+
+    def __str__(self):
+        return f"{self.insumo.nombre} {self.periodo.strftime('%m/%Y')}: {self.saldo_final}"
+
+
+def _inicio_mes(fecha):
+    return fecha.replace(day=1)
+
+
+def _mes_siguiente(periodo):
+    return (periodo + timedelta(days=32)).replace(day=1)
+
+
+def _inicio_dia(fecha):
+    # Límite "aware" en la zona horaria local, igual que fecha__date
+    return timezone.make_aware(datetime.combine(fecha, time.min))
+
+
+def reconstruir_saldos_mensuales(desde, hasta=None, insumo_ids=None):
+    """
+    Recalcula las fotos mensuales desde el mes de `desde` hasta el último mes
+    registrado (o el actual). El saldo de apertura sale del cierre del mes
+    anterior; solo si no existe se suma el historial previo. Se usa tanto
+    para avanzar de mes como para corregir movimientos con fecha atrasada.
+    """
+    desde = _inicio_mes(desde)
+    ultimo = SaldoMensualInsumo.objects.aggregate(ultimo=Max('periodo'))['ultimo']
+    hasta = max(p for p in (hasta and _inicio_mes(hasta), ultimo, _inicio_mes(timezone.localdate()), desde) if p)
+
+    insumos = Insumo.objects.all() if insumo_ids is None else Insumo.objects.filter(pk__in=insumo_ids)
+    ids = list(insumos.values_list('pk', flat=True))
+    cero = Decimal('0.00')
+
+    # 1. Saldo de apertura por insumo
+    mes_anterior = _inicio_mes(desde - timedelta(days=1))
+    apertura = dict(SaldoMensualInsumo.objects.filter(
+        insumo_id__in=ids, periodo=mes_anterior
+    ).values_list('insumo_id', 'saldo_final'))
+    faltantes = [pk for pk in ids if pk not in apertura]
+    if faltantes:
+        previos = MovimientoInventario.objects.filter(
+            insumo_id__in=faltantes, fecha__lt=_inicio_dia(desde)
+        ).values('insumo_id').annotate(
+            entradas=Coalesce(Sum('cantidad', filter=Q(tipo_movimiento__in=TIPOS_ENTRADA)), cero),
+            salidas=Coalesce(Sum('cantidad', filter=Q(tipo_movimiento__in=TIPOS_SALIDA)), cero)
+        )
+        for fila in previos:
+            apertura[fila['insumo_id']] = fila['entradas'] - fila['salidas']
+
+    # 2. Entradas y salidas por insumo y mes, en una sola consulta
+    movimientos = {}
+    por_mes = MovimientoInventario.objects.filter(
+        insumo_id__in=ids, fecha__gte=_inicio_dia(desde), fecha__lt=_inicio_dia(_mes_siguiente(hasta))
+    ).annotate(
+        mes=TruncMonth('fecha', output_field=models.DateField())
+    ).values('insumo_id', 'mes').annotate(
+        entradas=Coalesce(Sum('cantidad', filter=Q(tipo_movimiento__in=TIPOS_ENTRADA)), cero),
+        salidas=Coalesce(Sum('cantidad', filter=Q(tipo_movimiento__in=TIPOS_SALIDA)), cero)
+    ).order_by()
+    for fila in por_mes:
+        movimientos[(fila['insumo_id'], fila['mes'])] = (fila['entradas'], fila['salidas'])
+
+    # 3. Insumos a registrar: con saldo, con movimientos o con fotos previas que corregir
+    con_fotos = SaldoMensualInsumo.objects.filter(insumo_id__in=ids, periodo__gte=desde).values_list('insumo_id', flat=True)
+    activos = {pk for pk, saldo in apertura.items() if saldo} | {pk for pk, _ in movimientos} | set(con_fotos)
+
+    # 4. Se acumula mes a mes y se guarda con un único upsert
+    saldos = []
+    for insumo_id in activos:
+        saldo = apertura.get(insumo_id, cero)
+        periodo = desde
+        while periodo <= hasta:
+            entradas, salidas = movimientos.get((insumo_id, periodo), (cero, cero))
+            saldo_final = saldo + entradas - salidas
+            saldos.append(SaldoMensualInsumo(
+                insumo_id=insumo_id, periodo=periodo, saldo_inicial=saldo,
+                entradas=entradas, salidas=salidas, saldo_final=saldo_final
+            ))
+            saldo = saldo_final
+            periodo = _mes_siguiente(periodo)
+
+    SaldoMensualInsumo.objects.bulk_create(
+        saldos,
+        batch_size=500,
+        update_conflicts=True,
+        unique_fields=['insumo', 'periodo'],
+        update_fields=['saldo_inicial', 'entradas', 'salidas', 'saldo_final'],
+    )
+    return len(saldos)
+
+
+def programar_reconstruccion_saldos(fechas, insumo_ids):
+    """
+    Recalcula los saldos mensuales desde el mes más antiguo afectado, al
+    confirmarse la transacción. Si aún no hay fotos, se arman completas
+    en la primera consulta del resumen (asegurar_saldos_mensuales).
+    """
+    fechas = [fecha for fecha in fechas if fecha]
+    if not fechas or not SaldoMensualInsumo.objects.exists():
+        return
+    desde = min(timezone.localtime(fecha).date() for fecha in fechas)
+    insumo_ids = [pk for pk in set(insumo_ids) if pk]
+    transaction.on_commit(lambda: reconstruir_saldos_mensuales(desde, insumo_ids=insumo_ids))
+
+
+def asegurar_saldos_mensuales(periodo):
+    """Completa las fotos hasta `periodo` partiendo de la última existente (o del primer movimiento)."""
+    periodo = _inicio_mes(periodo)
+    ultimo = SaldoMensualInsumo.objects.aggregate(ultimo=Max('periodo'))['ultimo']
+    if ultimo is None:
+        primero = MovimientoInventario.objects.aggregate(primero=Min('fecha'))['primero']
+        if primero is not None:
+            reconstruir_saldos_mensuales(timezone.localtime(primero).date(), hasta=periodo)
+    elif ultimo < periodo:
+        reconstruir_saldos_mensuales(_mes_siguiente(ultimo), hasta=periodo)
+
+
+def resumen_inventario_mensual(year, month):
+    """
+    Balance de cada insumo para el mes: saldo inicial, entradas, salidas y
+    saldo final, leído de las fotos mensuales. Solo incluye los insumos con
+    movimientos en el mes o con saldo inicial.
+    """
+    periodo = date(year, month, 1)
+    asegurar_saldos_mensuales(periodo)
+
+    saldos = SaldoMensualInsumo.objects.filter(periodo=periodo).filter(
+        # REGLA DE VISIBILIDAD: Solo mostrar si hubo algún movimiento en el mes O si hay un saldo inicial
+        ~Q(entradas=0) | ~Q(salidas=0) | ~Q(saldo_inicial=0)
+    ).select_related('insumo').order_by('insumo__categoria', 'insumo__nombre')
+
+    return [
+        {
+            'nombre': saldo.insumo.nombre,
+            'unidad': saldo.insumo.get_unidad_medida_display(),
+            'saldo_inicial': saldo.saldo_inicial,
+            'total_entradas': saldo.entradas,
+            'total_salidas': saldo.salidas,
+            'saldo_final': saldo.saldo_final
+        }
+        for saldo in saldos
+    ]
@@ -0,0 +1,26 @@
+from datetime import date
+from .models import resumen_inventario_mensual
+
+
+def reporte_resumen(parametros):
+    """Resumen de movimientos de inventario del mes (ver TrabajoReporte.GENERADORES)."""
+    year, month = parametros['year'], parametros['month']
+
+    filas = (
+        [
+            item['nombre'],
+            item['unidad'],
+            float(item['saldo_inicial']),
+            float(item['total_entradas']),
+            float(item['total_salidas']),
+            float(item['saldo_final'])
+        ]
+        for item in resumen_inventario_mensual(year, month)
+    )
+
+    return {
+        'nombre_archivo': f"Resumen_Logistica_{date(year, month, 1).strftime('%B %Y')}",
+        'titulo': f"Resumen {month}_{year}",
+        'encabezados': ["Insumo", "Unidad", "Saldo Inicial", "Total Entradas", "Total Salidas", "Saldo Final"],
+        'filas': filas,
+    }
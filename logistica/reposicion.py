@@ -0,0 +1,159 @@
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+import numpy as np
+from django.db import transaction
+from django.db.models import DecimalField, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce, TruncDate
+from django.utils import timezone
+from produccion.models import generar_codigos
+from .models import DetalleOrdenCompra, Insumo, MovimientoInventario, OrdenCompra
+
+# ================================================================
+# PLAN DE REPOSICIÓN DE INSUMOS
+# ================================================================
+# Para todo el catálogo a la vez:
+#   consumo diario   = salidas (SALIDA) de los últimos DIAS_HISTORIA días
+#   stock seguridad  = máx(stock_minimo, Z × desviación diaria × √plazo)
+#   punto de reorden = consumo diario × plazo del proveedor + stock de seguridad
+#   posición         = stock_actual + lo pedido en órdenes abiertas
+# Si la posición queda bajo el punto de reorden se pide hasta cubrir además
+# DIAS_REVISION días de consumo. El proveedor y el precio son los de la última
+# compra del insumo; los insumos que nunca se compraron a un proveedor activo
+# no se pueden pedir y se informan aparte (insumos_sin_proveedor). Las órdenes
+# se crean como BORRADOR, una por proveedor, y cuentan como abiertas: volver a
+# ejecutar el plan no duplica pedidos.
+
+DIAS_HISTORIA = 90
+DIAS_REVISION = 30
+# Nivel de servicio del 95 %
+Z_SERVICIO = 1.65
+ESTADOS_ABIERTOS = ['BORRADOR', 'PENDIENTE', 'APROBADA']
+
+
+def _catalogo():
+    """Insumos con lo pedido en órdenes abiertas y su última compra, en una consulta."""
+    detalles = DetalleOrdenCompra.objects.filter(insumo=OuterRef('pk')).order_by()
+    en_camino = detalles.filter(orden_compra__estado__in=ESTADOS_ABIERTOS).values('insumo').annotate(
+        total=Sum('cantidad')
+    ).values('total')
+    # Solo proveedores activos: a uno desactivado no se le vuelve a pedir
+    ultima_compra = detalles.filter(orden_compra__proveedor__estado=True).exclude(
+        orden_compra__estado='CANCELADA'
+    ).order_by('-orden_compra__fecha_creacion', '-pk')
+    return list(
+        Insumo.objects.annotate(
+            en_camino=Coalesce(Subquery(en_camino, output_field=DecimalField()), Decimal('0')),
+            proveedor_id=Subquery(ultima_compra.values('orden_compra__proveedor')[:1]),
+            dias_entrega=Subquery(ultima_compra.values('orden_compra__proveedor__dias_entrega')[:1]),
+            precio=Subquery(ultima_compra.values('precio_unitario')[:1]),
+        ).order_by('pk')
+    )
+
+
+def _consumo_diario(insumos, desde):
+    """Media y desviación del consumo diario de cada insumo (los días sin salidas cuentan como 0)."""
+    indice = {insumo.pk: i for i, insumo in enumerate(insumos)}
+    salidas = MovimientoInventario.objects.filter(
+        tipo_movimiento='SALIDA', fecha__gte=desde,
+    ).annotate(dia=TruncDate('fecha')).values('insumo_id', 'dia').annotate(total=Sum('cantidad')).values_list('insumo_id', 'total')
+    filas, totales = [], []
+    for insumo_id, total in salidas:
+        filas.append(indice[insumo_id])
+        totales.append(float(total))
+    filas, totales = np.array(filas, dtype=int), np.array(totales, dtype=float)
+
+    suma = np.bincount(filas, totales, len(insumos))
+    suma_cuadrados = np.bincount(filas, totales ** 2, len(insumos))
+    media = suma / DIAS_HISTORIA
+    desviacion = np.sqrt(np.maximum(suma_cuadrados / DIAS_HISTORIA - media ** 2, 0))
+    return media, desviacion
+
+
+def calcular_plan_reposicion(hoy=None):
+    """
+    Devuelve una línea por insumo con su consumo, punto de reorden y la
+    cantidad a pedir (0 si no hace falta o si no tiene proveedor).
+    """
+    hoy = hoy or timezone.localdate()
+    insumos = _catalogo()
+    if not insumos:
+        return []
+    desde = timezone.make_aware(datetime.combine(hoy - timedelta(days=DIAS_HISTORIA), time.min))
+    consumo, desviacion = _consumo_diario(insumos, desde)
+
+    stock = np.array([float(insumo.stock_actual) for insumo in insumos])
+    minimo = np.array([float(insumo.stock_minimo) for insumo in insumos])
+    en_camino = np.array([float(insumo.en_camino) for insumo in insumos])
+    plazo = np.array([insumo.dias_entrega or 0 for insumo in insumos], dtype=float)
+    con_proveedor = np.array([insumo.proveedor_id is not None for insumo in insumos])
+
+    seguridad = np.maximum(minimo, Z_SERVICIO * desviacion * np.sqrt(plazo))
+    punto_reorden = consumo * plazo + seguridad
+    posicion = stock + en_camino
+    objetivo = punto_reorden + consumo * DIAS_REVISION
+    pedir = con_proveedor & (posicion < punto_reorden)
+    cantidad = np.where(pedir, np.ceil(objetivo - posicion), 0)
+
+    return [
+        {
+            'insumo': insumo,
+            'consumo_diario': round(float(consumo[i]), 2),
+            'stock_seguridad': round(float(seguridad[i]), 2),
+            'punto_reorden': round(float(punto_reorden[i]), 2),
+            'posicion': round(float(posicion[i]), 2),
+            'cantidad': Decimal(int(cantidad[i])),
+            'sin_proveedor': bool(not con_proveedor[i] and posicion[i] < punto_reorden[i]),
+        }
+        for i, insumo in enumerate(insumos)
+    ]
+
+
+def insumos_sin_proveedor(plan):
+    """Insumos del plan que están bajo su punto de reorden pero no tienen a quién pedirse."""
+    return [linea['insumo'] for linea in plan if linea['sin_proveedor']]
+
+
+def generar_borradores_reposicion(hoy=None, usuario=None):
+    """
+    Calcula el plan y crea las órdenes en BORRADOR con sus detalles en bloque:
+    un bulk_create de órdenes y uno de detalles. Devuelve (órdenes creadas, plan).
+    """
+    hoy = hoy or timezone.localdate()
+    with transaction.atomic():
+        # Se bloquea el catálogo para que dos ejecuciones simultáneas no pidan dos veces
+        list(Insumo.objects.select_for_update().order_by('pk').values_list('pk', flat=True))
+        plan = calcular_plan_reposicion(hoy)
+
+        por_proveedor = defaultdict(list)
+        for linea in plan:
+            if linea['cantidad'] > 0:
+                por_proveedor[linea['insumo'].proveedor_id].append(linea)
+        if not por_proveedor:
+            return [], plan
+
+        proveedores = sorted(por_proveedor)
+        codigos = generar_codigos(OrdenCompra, 'codigo_orden', 'OC', 3, cantidad=len(proveedores))
+        ordenes = OrdenCompra.objects.bulk_create([
+            OrdenCompra(
+                codigo_orden=codigo,
+                proveedor_id=proveedor_id,
+                fecha_esperada_entrega=hoy + timedelta(days=por_proveedor[proveedor_id][0]['insumo'].dias_entrega),
+                estado='BORRADOR',
+                creado_por=usuario,
+                # bulk_create no pasa por save(): el total se calcula aquí
+                total_costo=sum(linea['cantidad'] * linea['insumo'].precio for linea in por_proveedor[proveedor_id]),
+            )
+            for codigo, proveedor_id in zip(codigos, proveedores)
+        ])
+        DetalleOrdenCompra.objects.bulk_create([
+            DetalleOrdenCompra(
+                orden_compra=orden,
+                insumo=linea['insumo'],
+                cantidad=linea['cantidad'],
+                precio_unitario=linea['insumo'].precio,
+            )
+            for orden in ordenes
+            for linea in por_proveedor[orden.proveedor_id]
+        ])
+    return ordenes, plan
@@ -1,35 +1,48 @@
-from django.db.models.signals import post_save, post_delete
+from django.db.models.signals import pre_save, pre_delete, post_save, post_delete
+from django.db import transaction
 from django.dispatch import receiver
-from django.db.models import F
-from .models import MovimientoInventario
+from produccion.notificaciones import SECCION_LOGISTICA, invalidar_notificaciones
+from .models import Insumo, MovimientoInventario, aplicar_variaciones_stock, programar_reconstruccion_saldos, stock_actualizado
 
-@receiver(post_save, sender=MovimientoInventario)
-def actualizar_stock_on_save(sender, instance, created, **kwargs):
+@receiver(pre_save, sender=MovimientoInventario)
+def actualizar_stock_on_save(sender, instance, raw=False, **kwargs):
     """
     Actualiza el stock_actual del insumo CADA VEZ que se CREA un movimiento.
+    Se aplica antes del INSERT con un UPDATE condicional: si una salida
+    dejaría el stock en negativo se lanza StockInsuficienteError y el
+    movimiento no se guarda.
     """
-    if created:
-        insumo = instance.insumo
-        if instance.tipo_movimiento in ['ENTRADA', 'AJUSTE_POS']:
-            insumo.stock_actual = F('stock_actual') + instance.cantidad
-        elif instance.tipo_movimiento in ['SALIDA', 'AJUSTE_NEG']:
-            # Opcional: Validar que no quede en negativo
-            # if insumo.stock_actual < instance.cantidad:
-            #     # Manejar error de stock insuficiente
-            #     pass 
-            insumo.stock_actual = F('stock_actual') - instance.cantidad
-        
-        insumo.save(update_fields=['stock_actual'])
+    if instance._state.adding and not raw:
+        aplicar_variaciones_stock({instance.insumo_id: instance.variacion_stock})
 
-@receiver(post_delete, sender=MovimientoInventario)
+@receiver(pre_delete, sender=MovimientoInventario)
 def actualizar_stock_on_delete(sender, instance, **kwargs):
     """
-    Revierte el movimiento si este es eliminado (opcional pero recomendado).
+    Revierte el movimiento si este es eliminado. Tampoco se permite que la
+    reversión de una entrada ya consumida deje el stock en negativo.
+    """
+    aplicar_variaciones_stock({instance.insumo_id: -instance.variacion_stock})
+
+@receiver(post_save, sender=MovimientoInventario)
+def actualizar_saldos_mensuales_on_save(sender, instance, **kwargs):
+    """
+    Mantiene las fotos mensuales al crear o editar un movimiento, incluso
+    si tiene fecha atrasada (se recalcula desde su mes en adelante).
+    """
+    fecha_original, insumo_original = getattr(instance, '_original', (None, None))
+    programar_reconstruccion_saldos([instance.fecha, fecha_original], [instance.insumo_id, insumo_original])
+    instance._original = (instance.fecha, instance.insumo_id)
+
+@receiver(post_delete, sender=MovimientoInventario)
+def actualizar_saldos_mensuales_on_delete(sender, instance, **kwargs):
+    programar_reconstruccion_saldos([instance.fecha], [instance.insumo_id])
+
+@receiver(stock_actualizado)
+@receiver(post_save, sender=Insumo)
+@receiver(post_delete, sender=Insumo)
+def invalidar_alertas_stock(sender, **kwargs):
+    """
+    Las alertas de stock bajo se recalculan al confirmar la transacción,
+    para que otra petición no vuelva a guardar en caché el stock anterior.
     """
-    insumo = instance.insumo
-    if instance.tipo_movimiento in ['ENTRADA', 'AJUSTE_POS']:
-        insumo.stock_actual = F('stock_actual') - instance.cantidad
-    elif instance.tipo_movimiento in ['SALIDA', 'AJUSTE_NEG']:
-        insumo.stock_actual = F('stock_actual') + instance.cantidad
-    
-    insumo.save(update_fields=['stock_actual'])
\ No newline at end of file
+    transaction.on_commit(lambda: invalidar_notificaciones(SECCION_LOGISTICA))
@@ -0,0 +1,29 @@
+from celery import shared_task
+from django.utils import timezone
+from .models import asegurar_saldos_mensuales
+from .reposicion import generar_borradores_reposicion, insumos_sin_proveedor
+
+
+@shared_task
+def cerrar_periodo_inventario():
+    """
+    Tarea programada (diaria): lleva los saldos mensuales de inventario hasta
+    el mes actual, arrastrando el saldo final del último mes registrado.
+    """
+    asegurar_saldos_mensuales(timezone.localdate())
+    return "Saldos mensuales de inventario actualizados"
+
+
+@shared_task
+def planificar_reposicion_insumos():
+    """
+    Tarea programada (diaria): calcula el punto de reorden de todo el
+    catálogo y deja en BORRADOR las órdenes de compra necesarias.
+    """
+    ordenes, plan = generar_borradores_reposicion()
+    lineas = sum(1 for linea in plan if linea['cantidad'] > 0)
+    resultado = f"{len(ordenes)} órdenes en borrador con {lineas} insumos a reponer"
+    sin_proveedor = insumos_sin_proveedor(plan)
+    if sin_proveedor:
+        resultado += f"; sin proveedor para pedir: {', '.join(insumo.nombre for insumo in sin_proveedor)}"
+    return resultado
@@ -1,3 +1,234 @@
-from django.test import TestCase
+import math
+import threading
+from datetime import datetime, time, timedelta
+from decimal import Decimal
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import Client, TestCase, TransactionTestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from .models import (
+    DetalleOrdenCompra, Insumo, MovimientoInventario, OrdenCompra, Proveedor, SaldoMensualInsumo,
+    StockInsuficienteError, asegurar_saldos_mensuales, registrar_movimientos,
+)
+from .reposicion import (
+    DIAS_HISTORIA, DIAS_REVISION, Z_SERVICIO, calcular_plan_reposicion, generar_borradores_reposicion,
+    insumos_sin_proveedor,
+)
+
+
+class StockConcurrenteTests(TransactionTestCase):
+    """Despachos simultáneos no deben dejar el stock en negativo ni descontar de más."""
+
+    HILOS = 12
+    DESPACHOS_POR_HILO = 5
+
+    def setUp(self):
+        self.usuario = get_user_model().objects.create_user(username='logistica', password='x', is_staff=True)
+        self.alimento = Insumo.objects.create(nombre='Crecimiento 1')
+        self.vitamina = Insumo.objects.create(nombre='Vitamina C')
+        MovimientoInventario.objects.create(insumo=self.alimento, tipo_movimiento='ENTRADA', cantidad=Decimal('35.00'))
+        MovimientoInventario.objects.create(insumo=self.vitamina, tipo_movimiento='ENTRADA', cantidad=Decimal('1000.00'))
+
+    def despachar_en_paralelo(self):
+        # Cada despacho pide 7 kg de alimento: con 35 kg solo alcanzan 5
+        datos = {
+            'insumo_id': [self.alimento.pk, self.vitamina.pk],
+            'insumo_nombre': [self.alimento.nombre, self.vitamina.nombre],
+            'cantidad_kg': ['7,00', '3.00'],
+        }
+        barrera = threading.Barrier(self.HILOS, timeout=30)
+
+        def trabajador(client):
+            try:
+                barrera.wait()
+                for _ in range(self.DESPACHOS_POR_HILO):
+                    # Con SQLite algunos intentos fallan por bloqueo de tabla; el stock debe quedar igual de consistente
+                    client.post(reverse('despacho-produccion'), datos)
+            finally:
+                connection.close()
+
+        # El login se hace antes de lanzar los hilos para que solo compitan los despachos
+        clientes = []
+        for _ in range(self.HILOS):
+            client = Client(raise_request_exception=False)
+            client.force_login(self.usuario)
+            clientes.append(client)
+
+        hilos = [threading.Thread(target=trabajador, args=(client,)) for client in clientes]
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+
+    def test_despachos_concurrentes_no_dejan_stock_negativo(self):
+        self.despachar_en_paralelo()
+
+        self.alimento.refresh_from_db()
+        self.vitamina.refresh_from_db()
+        despachos = MovimientoInventario.objects.filter(insumo=self.alimento, tipo_movimiento='SALIDA').count()
+
+        self.assertGreater(despachos, 0)
+        self.assertLessEqual(despachos, 5)
+        self.assertGreaterEqual(self.alimento.stock_actual, Decimal('0'))
+        # El stock coincide exactamente con los movimientos registrados
+        self.assertEqual(self.alimento.stock_actual, Decimal('35.00') - despachos * Decimal('7.00'))
+        # El despacho es todo o nada: cada salida de alimento tiene su salida de vitamina
+        salidas_vitamina = MovimientoInventario.objects.filter(insumo=self.vitamina, tipo_movimiento='SALIDA').count()
+        self.assertEqual(salidas_vitamina, despachos)
+        self.assertEqual(self.vitamina.stock_actual, Decimal('1000.00') - despachos * Decimal('3.00'))
+
+    def test_registrar_movimientos_es_todo_o_nada(self):
+        with self.assertRaises(StockInsuficienteError):
+            registrar_movimientos([
+                MovimientoInventario(insumo=self.vitamina, tipo_movimiento='SALIDA', cantidad=Decimal('10.00')),
+                MovimientoInventario(insumo=self.alimento, tipo_movimiento='SALIDA', cantidad=Decimal('35.01')),
+            ])
+        self.alimento.refresh_from_db()
+        self.vitamina.refresh_from_db()
+        self.assertEqual(self.alimento.stock_actual, Decimal('35.00'))
+        self.assertEqual(self.vitamina.stock_actual, Decimal('1000.00'))
+        self.assertEqual(MovimientoInventario.objects.filter(tipo_movimiento='SALIDA').count(), 0)
+
+    def test_salida_individual_sin_stock_no_se_guarda(self):
+        with self.assertRaises(StockInsuficienteError):
+            MovimientoInventario.objects.create(insumo=self.alimento, tipo_movimiento='AJUSTE_NEG', cantidad=Decimal('50.00'))
+        self.alimento.refresh_from_db()
+        self.assertEqual(self.alimento.stock_actual, Decimal('35.00'))
+        self.assertFalse(MovimientoInventario.objects.filter(tipo_movimiento='AJUSTE_NEG').exists())
+
+
+class SaldosMensualesTests(TestCase):
+    """Las fotos mensuales se rehacen en cadena ante movimientos con fecha atrasada."""
+
+    def setUp(self):
+        hoy = timezone.localdate()
+        # Los cuatro meses que terminan en el actual, el más antiguo primero
+        self.meses = [hoy.replace(day=1)]
+        for _ in range(3):
+            self.meses.insert(0, (self.meses[0] - timedelta(days=1)).replace(day=1))
+        self.insumo = Insumo.objects.create(nombre='Crecimiento 2')
+        MovimientoInventario.objects.create(
+            insumo=self.insumo, tipo_movimiento='ENTRADA', cantidad=Decimal('100'), fecha=self.momento(0),
+        )
+        self.salida = MovimientoInventario.objects.create(
+            insumo=self.insumo, tipo_movimiento='SALIDA', cantidad=Decimal('30'), fecha=self.momento(2),
+        )
+        asegurar_saldos_mensuales(self.meses[-1])
+
+    def momento(self, mes):
+        return timezone.make_aware(datetime.combine(self.meses[mes].replace(day=15), time(12)))
+
+    def assertSaldos(self, esperados):
+        """`esperados` tiene (saldo_inicial, entradas, salidas, saldo_final) de cada mes."""
+        saldos = SaldoMensualInsumo.objects.filter(insumo=self.insumo).order_by('periodo')
+        self.assertEqual([saldo.periodo for saldo in saldos], self.meses)
+        self.assertEqual(
+            [(s.saldo_inicial, s.entradas, s.salidas, s.saldo_final) for s in saldos],
+            [tuple(Decimal(valor) for valor in fila) for fila in esperados],
+        )
+
+    def test_movimientos_con_fecha_atrasada(self):
+        self.assertSaldos([(0, 100, 0, 100), (100, 0, 0, 100), (100, 0, 30, 70), (70, 0, 0, 70)])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            MovimientoInventario.objects.create(
+                insumo=self.insumo, tipo_movimiento='ENTRADA', cantidad=Decimal('50'), fecha=self.momento(1),
+            )
+        self.assertSaldos([(0, 100, 0, 100), (100, 50, 0, 150), (150, 0, 30, 120), (120, 0, 0, 120)])
+
+        # La salida pasa a un mes anterior: se rehace desde ese mes y se vacía el original
+        salida = MovimientoInventario.objects.get(pk=self.salida.pk)
+        salida.fecha = self.momento(0)
+        with self.captureOnCommitCallbacks(execute=True):
+            salida.save()
+        self.assertSaldos([(0, 100, 30, 70), (70, 50, 0, 120), (120, 0, 0, 120), (120, 0, 0, 120)])
+
+
+class PlanReposicionTests(TestCase):
+    """Punto de reorden y cantidad a pedir calculados a mano para consumos conocidos."""
+
+    def setUp(self):
+        self.hoy = timezone.localdate()
+        self.proveedor = Proveedor.objects.create(nombre='Acuícola', ruc='20123456789', dias_entrega=10)
+
+    def crear_insumo(self, nombre, stock_minimo, consumos, precio=None):
+        """`consumos` es la salida de cada uno de los DIAS_HISTORIA días previos a hoy (el más antiguo primero)."""
+        insumo = Insumo.objects.create(nombre=nombre, stock_minimo=stock_minimo)
+        total = sum(consumos)
+        MovimientoInventario.objects.create(
+            insumo=insumo, tipo_movimiento='ENTRADA', cantidad=Decimal(total + 100),
+            fecha=self.momento(DIAS_HISTORIA + 1),
+        )
+        for dias, cantidad in zip(range(DIAS_HISTORIA, 0, -1), consumos):
+            if cantidad:
+                MovimientoInventario.objects.create(
+                    insumo=insumo, tipo_movimiento='SALIDA', cantidad=Decimal(cantidad), fecha=self.momento(dias),
+                )
+        if precio is not None:
+            self.crear_orden(insumo, 'RECIBIDA', 100, precio)
+        insumo.refresh_from_db()
+        return insumo
+
+    def crear_orden(self, insumo, estado, cantidad, precio):
+        orden = OrdenCompra.objects.create(
+            proveedor=self.proveedor, fecha_esperada_entrega=self.hoy, estado=estado,
+        )
+        DetalleOrdenCompra.objects.create(orden_compra=orden, insumo=insumo, cantidad=cantidad, precio_unitario=precio)
+        return orden
+
+    def momento(self, dias):
+        return timezone.make_aware(datetime.combine(self.hoy - timedelta(days=dias), time(12)))
+
+    def lineas(self):
+        return {linea['insumo'].nombre: linea for linea in calcular_plan_reposicion(self.hoy)}
+
+    def test_consumo_constante(self):
+        # 10 por día sin variación: el stock de seguridad es el mínimo
+        insumo = self.crear_insumo('Constante', 50, [10] * DIAS_HISTORIA, precio=Decimal('2.50'))
+        linea = self.lineas()['Constante']
+        self.assertEqual(insumo.stock_actual, Decimal('100.00'))
+        self.assertEqual(linea['consumo_diario'], 10)
+        self.assertEqual(linea['stock_seguridad'], 50)
+        self.assertEqual(linea['punto_reorden'], 10 * 10 + 50)
+        # Se pide hasta el punto de reorden más DIAS_REVISION días de consumo
+        self.assertEqual(linea['cantidad'], Decimal(150 + 10 * DIAS_REVISION - 100))
+        self.assertFalse(linea['sin_proveedor'])
+
+    def test_consumo_variable_y_pedidos_en_camino(self):
+        # 20 un día sí y otro no: media 10 y desviación 10
+        insumo = self.crear_insumo('Variable', 5, [20, 0] * (DIAS_HISTORIA // 2), precio=Decimal('1.00'))
+        self.crear_orden(insumo, 'PENDIENTE', 30, Decimal('1.00'))
+        linea = self.lineas()['Variable']
+        seguridad = Z_SERVICIO * 10 * math.sqrt(10)
+        self.assertAlmostEqual(linea['stock_seguridad'], seguridad, places=2)
+        self.assertAlmostEqual(linea['punto_reorden'], 100 + seguridad, places=2)
+        self.assertEqual(linea['posicion'], 100 + 30)
+        self.assertEqual(linea['cantidad'], Decimal(math.ceil(100 + seguridad + 10 * DIAS_REVISION - 130)))
+
+    def test_sobre_el_punto_de_reorden_y_sin_proveedor(self):
+        self.crear_insumo('Holgado', 0, [1] * DIAS_HISTORIA, precio=Decimal('1.00'))
+        sin_compras = self.crear_insumo('Sin compras', 500, [10] * DIAS_HISTORIA)
+        plan = calcular_plan_reposicion(self.hoy)
+        lineas = {linea['insumo'].nombre: linea for linea in plan}
+        self.assertEqual(lineas['Holgado']['cantidad'], 0)
+        self.assertEqual(lineas['Sin compras']['cantidad'], 0)
+        self.assertTrue(lineas['Sin compras']['sin_proveedor'])
+        self.assertEqual(insumos_sin_proveedor(plan), [sin_compras])
+
+    def test_borradores_no_se_duplican(self):
+        self.crear_insumo('Constante', 50, [10] * DIAS_HISTORIA, precio=Decimal('2.50'))
+        self.crear_insumo('Variable', 5, [20, 0] * (DIAS_HISTORIA // 2), precio=Decimal('1.00'))
+        ordenes, _ = generar_borradores_reposicion(self.hoy)
+        self.assertEqual(len(ordenes), 1)
+        orden = ordenes[0]
+        self.assertEqual(orden.estado, 'BORRADOR')
+        self.assertEqual(orden.fecha_esperada_entrega, self.hoy + timedelta(days=10))
+        self.assertEqual(orden.detalles.count(), 2)
+        self.assertEqual(orden.total_costo, sum(detalle.subtotal for detalle in orden.detalles.all()))
+        # Lo pedido en borrador cuenta como en camino
+        ordenes, plan = generar_borradores_reposicion(self.hoy)
+        self.assertEqual(ordenes, [])
+        self.assertTrue(all(linea['cantidad'] == 0 for linea in plan))
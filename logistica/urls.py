@@ -54,7 +54,8 @@ urlpatterns = [
     path('ordenes/nueva/', views.OrdenCompraCreateView.as_view(), name='ordencompra-create'),
     path('ordenes/<int:pk>/editar/', views.OrdenCompraUpdateView.as_view(), name='ordencompra-update'),
     path('ordenes/<int:pk>/', views.OrdenCompraDetailView.as_view(), name='ordencompra-detail'),
-    # path('ordenes/<int:pk>/recibir/', views.recibir_orden_compra, name='ordencompra-recibir'),
+    path('ordenes/<int:pk>/recibir/', views.recibir_orden_compra, name='ordencompra-recibir'),
+    path('ordenes/recibir/', views.recibir_ordenes_compra_view, name='ordencompra-recibir-lote'),
     path('proveedores/<int:pk>/toggle/', views.toggle_proveedor, name='proveedor-toggle'),
 
     # Movimientos (Actividad 1)
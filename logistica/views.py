@@ -11,13 +11,17 @@ from django.db.models.functions import Coalesce
 from django.views.decorators.http import require_POST
 
 
-import openpyxl
 from django.http import HttpResponse
 from django.db.models import Q
 
 
-from .models import Proveedor, Insumo, CategoriaInsumo, OrdenCompra, DetalleOrdenCompra, MovimientoInventario
+from .models import (
+    Proveedor, Insumo, CategoriaInsumo, OrdenCompra, DetalleOrdenCompra, MovimientoInventario,
+    StockInsuficienteError, recibir_ordenes_compra, registrar_movimientos, resumen_inventario_mensual
+)
 from .forms import ProveedorForm, InsumoForm, CategoriaInsumoForm, OrdenCompraForm, DetalleOrdenCompraFormSet, MovimientoManualForm
+from .demanda_alimento import HORIZONTES, proyectar_demanda_alimento
+from .reposicion import calcular_plan_reposicion, insumos_sin_proveedor
 
 # ... (al inicio de logistica/views.py, con las otras importaciones)
 from django.http import JsonResponse
@@ -25,6 +29,8 @@ from django.db.models.functions import TruncDay
 from datetime import datetime, timedelta
 from decimal import Decimal
 import calendar
+from produccion.reportes import solicitar_reporte
+from usuarios.roles import tiene_grupo
 
 # Importar el modelo Lote de PRODUCCION para leer la demanda
 try:
@@ -38,7 +44,7 @@ except ImportError:
 class LogisticaPermissionMixin(LoginRequiredMixin, UserPassesTestMixin):
     """Asegura que el usuario pertenezca al grupo 'Logistica' o sea staff."""
     def test_func(self):
-        return self.request.user.is_staff or self.request.user.groups.filter(name='Logistica').exists()
+        return self.request.user.is_staff or tiene_grupo(self.request.user, 'Logistica')
 
 # ================================================================
 # DASHBOARD
@@ -157,6 +163,12 @@ class OrdenCompraListView(LogisticaPermissionMixin, ListView):
     paginate_by = 20
     ordering = ['-fecha_creacion']
 
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        # El plan de reposición no puede generar borradores para estos insumos
+        context['insumos_sin_proveedor'] = insumos_sin_proveedor(calcular_plan_reposicion())
+        return context
+
 class OrdenCompraCreateView(LogisticaPermissionMixin, CreateView):
     model = OrdenCompra
     form_class = OrdenCompraForm
@@ -223,27 +235,34 @@ class OrdenCompraDetailView(LogisticaPermissionMixin, DetailView):
     context_object_name = 'orden'
 
 @login_required
-@transaction.atomic
 def recibir_orden_compra(request, pk):
     orden = get_object_or_404(OrdenCompra, pk=pk)
     if request.method == 'POST':
-        if orden.estado != 'RECIBIDA':
-            for detalle in orden.detalles.all():
-                MovimientoInventario.objects.create(
-                    insumo=detalle.insumo,
-                    tipo_movimiento='ENTRADA',
-                    cantidad=detalle.cantidad,
-                    usuario=request.user,
-                    descripcion=f"Entrada automática por OC: {orden.codigo_orden}"
-                )
-            orden.estado = 'RECIBIDA'
-            orden.save(update_fields=['estado'])
+        if orden.marcar_como_recibida(usuario=request.user):
             messages.success(request, f"Orden {orden.codigo_orden} marcada como RECIBIDA.")
         else:
-            messages.warning(request, f"La orden {orden.codigo_orden} ya había sido recibida.")
+            messages.warning(request, f"La orden {orden.codigo_orden} no está pendiente ni aprobada; no se recibió.")
         return redirect('ordencompra-detail', pk=pk)
     return redirect('ordencompra-list')
 
+@login_required
+@require_POST
+def recibir_ordenes_compra_view(request):
+    """Recibe de una vez todas las órdenes marcadas en el listado."""
+    orden_ids = [pk for pk in request.POST.getlist('ordenes') if pk.isdigit()]
+    if not orden_ids:
+        messages.warning(request, "Selecciona al menos una orden para recibir.")
+        return redirect('ordencompra-list')
+
+    recibidas = recibir_ordenes_compra(orden_ids, usuario=request.user)
+    if recibidas:
+        codigos = ", ".join(orden.codigo_orden for orden in recibidas)
+        messages.success(request, f"{len(recibidas)} orden(es) marcadas como RECIBIDA: {codigos}.")
+    omitidas = len(set(orden_ids)) - len(recibidas)
+    if omitidas:
+        messages.warning(request, f"{omitidas} orden(es) no estaban pendientes ni aprobadas y se omitieron.")
+    return redirect('ordencompra-list')
+
 # ================================================================
 # MOVIMIENTOS
 # ================================================================
@@ -262,8 +281,13 @@ class MovimientoManualCreateView(LogisticaPermissionMixin, CreateView):
 
     def form_valid(self, form):
         form.instance.usuario = self.request.user
+        try:
+            response = super().form_valid(form)
+        except StockInsuficienteError as e:
+            form.add_error('cantidad', str(e))
+            return self.form_invalid(form)
         messages.success(self.request, "Movimiento de inventario registrado exitosamente.")
-        return super().form_valid(form)
+        return response
 
 # ================================================================
 # DESPACHO A PRODUCCIÓN (VISTA CORREGIDA)
@@ -276,23 +300,18 @@ class DespachoProduccionView(LogisticaPermissionMixin, View):
             messages.error(request, "La app 'produccion' no está instalada.")
             return redirect('dashboard-logistica')
 
-        lotes_activos = Lote.objects.filter(activo=True)
-        
-        demanda_dict = {}
-        for lote in lotes_activos:
-            tipo_alimento = lote.tipo_alimento 
-            demanda_kg = lote.alimento_diario_kg
-
-            if demanda_kg > 0:
-                if tipo_alimento in demanda_dict:
-                    demanda_dict[tipo_alimento] += demanda_kg
-                else:
-                    demanda_dict[tipo_alimento] = demanda_kg
-        
+        # Demanda agrupada por tipo de alimento en una sola consulta
+        demanda = Lote.objects.filter(activo=True).with_kpis().values('kpi_tipo_alimento').annotate(
+            demanda_kg=Sum('kpi_alimento_diario_kg')
+        ).filter(demanda_kg__gt=0).order_by('kpi_tipo_alimento')
+        demanda_dict = {fila['kpi_tipo_alimento']: round(fila['demanda_kg'], 2) for fila in demanda}
+
+        insumos = Insumo.objects.in_bulk(list(demanda_dict), field_name='nombre')
+
         data_despacho = []
         for tipo_alimento, demanda_kg in demanda_dict.items():
             
-            insumo = Insumo.objects.filter(nombre=tipo_alimento).first()
+            insumo = insumos.get(tipo_alimento)
             
             if insumo:
                 stock_actual = insumo.stock_actual
@@ -313,7 +332,13 @@ class DespachoProduccionView(LogisticaPermissionMixin, View):
                     'suficiente': False,
                 })
 
-        return render(request, self.template_name, {'data_despacho': data_despacho, 'total_items': len(data_despacho)})
+        return render(request, self.template_name, {
+            'data_despacho': data_despacho,
+            'total_items': len(data_despacho),
+            # Demanda de los próximos días según el pronóstico de crecimiento
+            'proyeccion': proyectar_demanda_alimento(HORIZONTES),
+            'horizontes': HORIZONTES,
+        })
 
     @transaction.atomic
     def post(self, request, *args, **kwargs):
@@ -353,12 +378,8 @@ class DespachoProduccionView(LogisticaPermissionMixin, View):
 
                 insumo = Insumo.objects.get(id=insumo_id)
                 
-                # Error 2: Stock insuficiente
-                if insumo.stock_actual < cantidad:
-                    messages.error(request, f"Stock insuficiente para '{insumo.nombre}'. Se necesitan {cantidad} kg, pero solo hay {insumo.stock_actual} kg.")
-                    error_encontrado = True
-                    raise transaction.TransactionManagementError("Stock insuficiente detectado")
-                    
+                # El stock NO se valida aquí (lectura sin bloqueo): lo garantiza
+                # el UPDATE condicional de registrar_movimientos más abajo.
                 items_para_despachar.append({
                     'insumo': insumo,
                     'cantidad': cantidad
@@ -368,10 +389,6 @@ class DespachoProduccionView(LogisticaPermissionMixin, View):
                  messages.error(request, f"Error: El insumo ID {insumo_id} ('{nombre_insumo}') no existe.")
                  error_encontrado = True
                  break
-            except transaction.TransactionManagementError:
-                # Captura el error de stock insuficiente y detiene el bucle
-                error_encontrado = True
-                break
             except Exception as e:
                 # Aquí es donde fallaba antes, ahora mostrará el error de conversión
                 messages.error(request, f"Error inesperado al validar '{nombre_insumo}'. (Error: {e})")
@@ -387,14 +404,21 @@ class DespachoProduccionView(LogisticaPermissionMixin, View):
              messages.warning(request, "No se seleccionó ningún insumo para despachar.")
              return redirect('despacho-produccion')
 
-        for item in items_para_despachar:
-            MovimientoInventario.objects.create(
-                insumo=item['insumo'],
-                tipo_movimiento='SALIDA',
-                cantidad=item['cantidad'],
-                usuario=request.user,
-                descripcion="Despacho diario automático a Producción"
-            )
+        # Todo el despacho en una sola operación: si un insumo no alcanza, no se descuenta ninguno
+        try:
+            registrar_movimientos([
+                MovimientoInventario(
+                    insumo=item['insumo'],
+                    tipo_movimiento='SALIDA',
+                    cantidad=item['cantidad'],
+                    usuario=request.user,
+                    descripcion="Despacho diario automático a Producción"
+                )
+                for item in items_para_despachar
+            ])
+        except StockInsuficienteError as e:
+            messages.error(request, str(e))
+            return redirect('despacho-produccion')
             
         messages.success(request, f"Despacho de {len(items_para_despachar)} insumo(s) completado. El stock ha sido actualizado.")
         return redirect('despacho-produccion')
@@ -513,7 +537,8 @@ def api_reporte_grafico(request):
 @login_required
 def reporte_resumen_view(request):
     """
-    Muestra la tabla de resumen de balance mensual y calcula saldos históricamente.
+    Muestra la tabla de resumen de balance mensual a partir de los saldos
+    mensuales por insumo (SaldoMensualInsumo).
     """
     try:
         year = int(request.GET.get('year', datetime.now().year))
@@ -522,11 +547,6 @@ def reporte_resumen_view(request):
         year = datetime.now().year
         month = datetime.now().month
 
-    # Calcular fechas de inicio y fin del mes
-    _, num_dias_mes = calendar.monthrange(year, month) 
-    fecha_inicio_mes = datetime(year, month, 1).date()
-    fecha_fin_mes = datetime(year, month, num_dias_mes).date()
-
     # Preparar filtros (misma lógica que antes)
     anios = range(datetime.now().year, 2023, -1)
     meses = [
@@ -538,53 +558,17 @@ def reporte_resumen_view(request):
         {"id": 11, "nombre": "Noviembre"}, {"id": 12, "nombre": "Diciembre"},
     ]
 
-    # --- CONSULTA PRINCIPAL: Obtener movimientos consolidados del PERIODO ---
-    insumos = Insumo.objects.all()
+    # --- CONSULTA PRINCIPAL: Balance consolidado del PERIODO ---
     resumen_data = []
-
-    for insumo in insumos:
-        # A. Movimientos dentro del período (Entradas y Salidas en el mes filtrado)
-        
-        entradas_mes = MovimientoInventario.objects.filter(
-            insumo=insumo,
-            tipo_movimiento__in=['ENTRADA', 'AJUSTE_POS'],
-            fecha__date__range=(fecha_inicio_mes, fecha_fin_mes)
-        ).aggregate(total=Coalesce(Sum('cantidad'), Decimal(0.0)))['total']
-
-        salidas_mes = MovimientoInventario.objects.filter(
-            insumo=insumo,
-            tipo_movimiento__in=['SALIDA', 'AJUSTE_NEG'],
-            fecha__date__range=(fecha_inicio_mes, fecha_fin_mes)
-        ).aggregate(total=Coalesce(Sum('cantidad'), Decimal(0.0)))['total']
-        
-        # B. Movimientos ANTES del período (Para calcular el saldo inicial)
-        
-        # Necesitamos la suma de TODOS los movimientos de este insumo antes de la fecha_inicio_mes
-        movimientos_anteriores = MovimientoInventario.objects.filter(
-            insumo=insumo,
-            fecha__date__lt=fecha_inicio_mes # Menor que el primer día del mes filtrado
-        ).aggregate(
-            entradas_ant=Coalesce(Sum('cantidad', filter=Q(tipo_movimiento__in=['ENTRADA', 'AJUSTE_POS'])), Decimal(0.0)),
-            salidas_ant=Coalesce(Sum('cantidad', filter=Q(tipo_movimiento__in=['SALIDA', 'AJUSTE_NEG'])), Decimal(0.0))
-        )
-        
-        # Saldo Inicial = Entradas Anteriores - Salidas Anteriores
-        saldo_inicial = movimientos_anteriores['entradas_ant'] - movimientos_anteriores['salidas_ant']
-        
-        # Saldo Final del mes filtrado = Saldo Inicial + Entradas Mes - Salidas Mes
-        saldo_final = saldo_inicial + entradas_mes - salidas_mes
-
-
-        # REGLA DE VISIBILIDAD: Solo mostrar si hubo algún movimiento en el mes O si hay un saldo inicial
-        if entradas_mes != 0 or salidas_mes != 0 or saldo_inicial != 0:
-            resumen_data.append({
-                'nombre': insumo.nombre,
-                'unidad': insumo.get_unidad_medida_display(),
-                'saldo_inicial': float(saldo_inicial),
-                'total_entradas': float(entradas_mes),
-                'total_salidas': float(salidas_mes),
-                'saldo_final': float(saldo_final)
-            })
+    for item in resumen_inventario_mensual(year, month):
+        resumen_data.append({
+            'nombre': item['nombre'],
+            'unidad': item['unidad'],
+            'saldo_inicial': float(item['saldo_inicial']),
+            'total_entradas': float(item['total_entradas']),
+            'total_salidas': float(item['total_salidas']),
+            'saldo_final': float(item['saldo_final'])
+        })
             
     context = {
         'anios': anios,
@@ -601,7 +585,8 @@ def reporte_resumen_view(request):
 @login_required
 def exportar_resumen_excel(request):
     """
-    Genera un archivo Excel con el resumen de movimientos para el mes filtrado.
+    Solicita el archivo Excel con el resumen de movimientos para el mes filtrado.
+    Se genera en segundo plano (produccion.tasks.generar_reporte).
     """
     try:
         year = int(request.GET.get('year', datetime.now().year))
@@ -609,74 +594,4 @@ def exportar_resumen_excel(request):
     except ValueError:
         return HttpResponse("Filtros inválidos.", status=400)
 
-    # Reusamos la lógica de cálculo (llamamos a la misma lógica de resumen)
-    # NOTA: Debemos duplicar o modularizar la lógica de cálculo si no queremos
-    # pasar todo el request. Aquí, por simplicidad, replicamos el cálculo.
-    
-    _, num_dias_mes = calendar.monthrange(year, month) 
-    fecha_inicio_mes = datetime(year, month, 1).date()
-    fecha_fin_mes = datetime(year, month, num_dias_mes).date()
-    mes_nombre = datetime(year, month, 1).strftime('%B %Y')
-
-    insumos = Insumo.objects.all()
-    resumen_data = []
-
-    for insumo in insumos:
-        movimientos_anteriores = MovimientoInventario.objects.filter(
-            insumo=insumo,
-            fecha__date__lt=fecha_inicio_mes 
-        ).aggregate(
-            entradas_ant=Coalesce(Sum('cantidad', filter=Q(tipo_movimiento__in=['ENTRADA', 'AJUSTE_POS'])), Decimal(0.0)),
-            salidas_ant=Coalesce(Sum('cantidad', filter=Q(tipo_movimiento__in=['SALIDA', 'AJUSTE_NEG'])), Decimal(0.0))
-        )
-        saldo_inicial = movimientos_anteriores['entradas_ant'] - movimientos_anteriores['salidas_ant']
-        
-        entradas_mes = MovimientoInventario.objects.filter(
-            insumo=insumo,
-            tipo_movimiento__in=['ENTRADA', 'AJUSTE_POS'],
-            fecha__date__range=(fecha_inicio_mes, fecha_fin_mes)
-        ).aggregate(total=Coalesce(Sum('cantidad'), Decimal(0.0)))['total']
-
-        salidas_mes = MovimientoInventario.objects.filter(
-            insumo=insumo,
-            tipo_movimiento__in=['SALIDA', 'AJUSTE_NEG'],
-            fecha__date__range=(fecha_inicio_mes, fecha_fin_mes)
-        ).aggregate(total=Coalesce(Sum('cantidad'), Decimal(0.0)))['total']
-
-        saldo_final = saldo_inicial + entradas_mes - salidas_mes
-
-        if entradas_mes != 0 or salidas_mes != 0 or saldo_inicial != 0:
-            resumen_data.append({
-                'nombre': insumo.nombre,
-                'unidad': insumo.get_unidad_medida_display(),
-                'saldo_inicial': saldo_inicial,
-                'total_entradas': entradas_mes,
-                'total_salidas': salidas_mes,
-                'saldo_final': saldo_final
-            })
-
-    # Generación del archivo Excel
-    workbook = openpyxl.Workbook()
-    sheet = workbook.active
-    sheet.title = f"Resumen {month}_{year}"
-
-    # Encabezados
-    headers = ["Insumo", "Unidad", "Saldo Inicial", "Total Entradas", "Total Salidas", "Saldo Final"]
-    sheet.append(headers)
-
-    # Datos
-    for item in resumen_data:
-        sheet.append([
-            item['nombre'],
-            item['unidad'],
-            float(item['saldo_inicial']),
-            float(item['total_entradas']),
-            float(item['total_salidas']),
-            float(item['saldo_final'])
-        ])
-
-    response = HttpResponse(content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
-    response['Content-Disposition'] = f'attachment; filename="Resumen_Logistica_{mes_nombre}.xlsx"'
-    workbook.save(response)
-
-    return response
\ No newline at end of file
+    return solicitar_reporte(request, 'resumen_logistica', {'year': year, 'month': month})
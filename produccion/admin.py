@@ -3,7 +3,8 @@ from django.db.models import Sum, F
 from django.utils import timezone
 from .models import (
     Bastidor, Artesa, Jaula, Lote, RegistroDiario, 
-    RegistroMortalidad, HistorialMovimiento, RegistroUnidad,Enfermedad 
+    RegistroMortalidad, HistorialMovimiento, RegistroUnidad,Enfermedad,
+    DiagnosticoLote, ReglaAlerta, AlertaCondiciones,
 )
 
 
@@ -143,11 +144,11 @@ class RegistroMortalidadAdmin(admin.ModelAdmin):
 
 @admin.register(HistorialMovimiento)
 class HistorialMovimientoAdmin(admin.ModelAdmin):
-    list_display = ('lote', 'fecha', 'tipo_movimiento', 'descripcion', 'cantidad_afectada')
+    list_display = ('lote', 'fecha', 'tipo_movimiento', 'descripcion', 'cantidad_afectada', 'peso_promedio_gr')
     list_filter = ('tipo_movimiento',)
     search_fields = ('lote__codigo_lote', 'descripcion')
     list_select_related = ('lote',)
-    readonly_fields = ('lote', 'fecha', 'tipo_movimiento', 'descripcion', 'cantidad_afectada')
+    readonly_fields = ('lote', 'fecha', 'tipo_movimiento', 'descripcion', 'cantidad_afectada', 'peso_promedio_gr')
 
 @admin.register(RegistroUnidad)
 class RegistroUnidadAdmin(admin.ModelAdmin):
@@ -155,6 +156,30 @@ class RegistroUnidadAdmin(admin.ModelAdmin):
     list_filter = ('fecha',)
     readonly_fields = ('unidad', 'fecha', 'biomasa_kg', 'cantidad_peces', 'alimento_kg', 'mortalidad_total')
 
+@admin.register(DiagnosticoLote)
+class DiagnosticoLoteAdmin(admin.ModelAdmin):
+    # Aquí se corrige y confirma el diagnóstico para reentrenar el modelo
+    list_display = ('lote', 'fecha', 'diagnostico', 'nivel_riesgo', 'alertas', 'confirmado')
+    list_editable = ('diagnostico', 'confirmado')
+    list_filter = ('fecha', 'nivel_riesgo', 'confirmado')
+    search_fields = ('lote__codigo_lote', 'diagnostico')
+    list_select_related = ('lote',)
+    readonly_fields = ('lote', 'fecha', 'registro_condiciones', 'nivel_riesgo', 'alertas')
+
+@admin.register(ReglaAlerta)
+class ReglaAlertaAdmin(admin.ModelAdmin):
+    list_display = ('nombre', 'variable', 'tipo', 'umbral', 'ventana_minutos', 'minutos_despeje', 'activa')
+    list_editable = ('umbral', 'ventana_minutos', 'minutos_despeje', 'activa')
+    list_filter = ('variable', 'tipo', 'activa')
+
+@admin.register(AlertaCondiciones)
+class AlertaCondicionesAdmin(admin.ModelAdmin):
+    list_display = ('regla', 'lote', 'inicio', 'ultimo_disparo', 'valor', 'fin')
+    list_filter = ('regla', 'fin')
+    search_fields = ('lote__codigo_lote',)
+    list_select_related = ('regla', 'lote')
+    readonly_fields = ('regla', 'lote', 'inicio', 'ultimo_disparo', 'valor')
+
 @admin.register(Enfermedad)
 class EnfermedadAdmin(admin.ModelAdmin):
     list_display = ('nombre',)
@@ -0,0 +1,217 @@
+import threading
+import time as reloj
+from datetime import datetime, time, timedelta
+import numpy as np
+import pandas as pd
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+from .models import AlertaCondiciones, LecturaSensor, RegistroCondiciones, ReglaAlerta
+from .notificaciones import SECCION_ALERTAS, invalidar_notificaciones
+
+# ================================================================
+# MOTOR DE ALERTAS DE CALIDAD DEL AGUA
+# ================================================================
+# Las reglas (ReglaAlerta) se compilan una vez por proceso y se vuelven a
+# compilar cuando cambian: la versión vive en la caché y, si la caché no es
+# compartida entre procesos, además se releen cada REGLAS_ALERTA_SEGUNDOS. Cada
+# envío de lecturas se evalúa completo con pandas: una serie por lote y una
+# máscara por regla. El estado por lote es el incidente abierto
+# (AlertaCondiciones): mientras siga abierto no se genera otra alerta.
+
+CLAVE_VERSION_REGLAS = 'alertas:reglas:version'
+VARIABLES = ['temp_agua_c', 'ph', 'oxigeno_mg_l', 'amoniaco_mg_l']
+
+
+class ReglaCompilada:
+    def __init__(self, regla):
+        self.id = regla.pk
+        self.variable = regla.variable
+        self.umbral = regla.umbral
+        self.ventana = pd.Timedelta(minutes=regla.ventana_minutos)
+        self.despeje = timedelta(minutes=regla.minutos_despeje)
+        self.disparos = {
+            'MINIMO': self._minimo,
+            'MAXIMO': self._maximo,
+            'CAIDA': self._caida,
+            'SUBIDA': self._subida,
+        }[regla.tipo]
+        # Historia previa que hace falta leer para evaluar la primera lectura nueva
+        self.historia = self.ventana if regla.tipo in ('CAIDA', 'SUBIDA') else pd.Timedelta(0)
+
+    # Cada función recibe la serie de la variable (índice = momento) y
+    # devuelve la máscara de las lecturas que disparan la regla
+    def _minimo(self, serie):
+        return serie < self.umbral
+
+    def _maximo(self, serie):
+        return serie > self.umbral
+
+    def _caida(self, serie):
+        serie = serie.dropna()
+        previo = serie.rolling(self.ventana, closed='left').max()
+        return previo - serie >= self.umbral
+
+    def _subida(self, serie):
+        serie = serie.dropna()
+        previo = serie.rolling(self.ventana, closed='left').min()
+        return serie - previo >= self.umbral
+
+
+class _ReglasCompiladas:
+    def __init__(self):
+        self.version = None
+        self.reglas = []
+        self.compiladas_en = None
+        self._lock = threading.Lock()
+
+    def _vigentes(self, version):
+        if version != self.version:
+            return False
+        # Con caché local la invalidación solo llega al proceso que guardó la regla
+        vigencia = settings.REGLAS_ALERTA_SEGUNDOS
+        return vigencia is None or reloj.monotonic() - self.compiladas_en < vigencia
+
+    def obtener(self):
+        version = cache.get_or_set(CLAVE_VERSION_REGLAS, 1, None)
+        if not self._vigentes(version):
+            with self._lock:
+                if not self._vigentes(version):
+                    self.reglas = [ReglaCompilada(regla) for regla in ReglaAlerta.objects.filter(activa=True)]
+                    self.version = version
+                    self.compiladas_en = reloj.monotonic()
+        return self.reglas
+
+
+_compiladas = _ReglasCompiladas()
+
+
+def reglas_compiladas():
+    return _compiladas.obtener()
+
+
+def invalidar_reglas():
+    """Los procesos vuelven a compilar las reglas en su próxima evaluación."""
+    try:
+        cache.incr(CLAVE_VERSION_REGLAS)
+    except ValueError:
+        cache.set(CLAVE_VERSION_REGLAS, 2, None)
+
+
+def evaluar_series(series):
+    """
+    Evalúa las reglas sobre `series`: {lote_id: (DataFrame, nuevas)}, con el
+    DataFrame indexado por momento (ordenado) y `nuevas` la máscara de las
+    filas que recién llegan; el resto es historia para las reglas de ventana.
+    Abre, mantiene y cierra los incidentes de cada lote.
+    """
+    reglas = reglas_compiladas()
+    if not reglas or not series:
+        return
+
+    abiertas = {
+        (alerta.lote_id, alerta.regla_id): alerta
+        for alerta in AlertaCondiciones.objects.filter(fin__isnull=True, lote_id__in=list(series))
+    }
+    nuevas, modificadas = [], {}
+    hubo_cambios = False
+
+    for lote_id, (datos, filas_nuevas) in series.items():
+        for regla in reglas:
+            columna = datos[regla.variable]
+            disparos = regla.disparos(columna).reindex(columna.index, fill_value=False).to_numpy(dtype=bool)
+            abierta = abiertas.get((lote_id, regla.id))
+            if abierta is None and not disparos[filas_nuevas].any():
+                continue
+
+            valores = columna.to_numpy(dtype=float)
+            for i in np.flatnonzero(filas_nuevas):
+                if np.isnan(valores[i]):
+                    continue
+                momento = columna.index[i].to_pydatetime()
+                if disparos[i]:
+                    if abierta is None:
+                        abierta = AlertaCondiciones(
+                            regla_id=regla.id, lote_id=lote_id,
+                            inicio=momento, ultimo_disparo=momento, valor=float(valores[i]),
+                        )
+                        nuevas.append(abierta)
+                        hubo_cambios = True
+                    else:
+                        abierta.ultimo_disparo = max(abierta.ultimo_disparo, momento)
+                        if abierta.pk:
+                            modificadas[abierta.pk] = abierta
+                elif abierta is not None and momento - abierta.ultimo_disparo >= regla.despeje:
+                    abierta.fin = momento
+                    if abierta.pk:
+                        modificadas[abierta.pk] = abierta
+                    abierta = None
+                    hubo_cambios = True
+
+    # Un proceso paralelo pudo abrir el mismo incidente: la restricción lo descarta
+    AlertaCondiciones.objects.bulk_create(nuevas, ignore_conflicts=True)
+    AlertaCondiciones.objects.bulk_update(modificadas.values(), ['ultimo_disparo', 'fin'])
+    if hubo_cambios:
+        transaction.on_commit(lambda: invalidar_notificaciones(SECCION_ALERTAS))
+
+
+def _historia_necesaria():
+    return max((regla.historia for regla in reglas_compiladas()), default=pd.Timedelta(0))
+
+
+def evaluar_lecturas(rangos, lotes_por_unidad):
+    """
+    Evalúa un envío de lecturas de sensores. `rangos` es
+    {(content_type_id, object_id): (desde, hasta)} y `lotes_por_unidad` los
+    lotes activos de cada unidad; cada lote hereda la serie de su unidad.
+    """
+    rangos = {clave: rango for clave, rango in rangos.items() if lotes_por_unidad.get(clave)}
+    if not rangos or not reglas_compiladas():
+        return
+
+    # condiciones_agua importa este módulo al cargarse
+    from .condiciones_agua import filtros_rangos
+
+    historia = _historia_necesaria().to_pytimedelta()
+    # Desde la historia que piden las reglas hasta `hasta` inclusive
+    lecturas = pd.DataFrame.from_records(
+        [
+            fila
+            for filtro in filtros_rangos(
+                {clave: (desde - historia, hasta) for clave, (desde, hasta) in rangos.items()},
+                'momento', lambda momento: momento, timedelta(microseconds=1),
+            )
+            for fila in LecturaSensor.objects.filter(filtro).values_list('content_type_id', 'object_id', 'momento', *VARIABLES)
+        ],
+        columns=['content_type_id', 'object_id', 'momento', *VARIABLES],
+    )
+
+    series = {}
+    for (content_type_id, object_id), grupo in lecturas.groupby(['content_type_id', 'object_id']):
+        datos = grupo.set_index('momento').sort_index()[VARIABLES].astype(float)
+        filas_nuevas = (datos.index >= rangos[(content_type_id, object_id)][0])
+        for lote_id in lotes_por_unidad[(content_type_id, object_id)]:
+            series[lote_id] = (datos, filas_nuevas)
+    evaluar_series(series)
+
+
+def _momento_registro(fecha):
+    # Los registros manuales son diarios: se ubican al inicio del día local
+    return timezone.make_aware(datetime.combine(fecha, time.min))
+
+
+def evaluar_registro_condiciones(registro):
+    """Evalúa un RegistroCondiciones cargado a mano, con la historia previa del lote."""
+    if not reglas_compiladas():
+        return
+    momento = _momento_registro(registro.fecha)
+    desde = momento - _historia_necesaria().to_pytimedelta()
+    registros = RegistroCondiciones.objects.filter(
+        lote_id=registro.lote_id, fecha__gte=timezone.localtime(desde).date(), fecha__lte=registro.fecha,
+    ).values_list('fecha', *VARIABLES)
+    datos = pd.DataFrame.from_records(
+        [(_momento_registro(fecha), *valores) for fecha, *valores in registros],
+        columns=['momento', *VARIABLES],
+    ).set_index('momento').sort_index().astype(float)
+    evaluar_series({registro.lote_id: (datos, datos.index == momento)})
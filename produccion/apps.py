@@ -4,3 +4,15 @@ from django.apps import AppConfig
 class ProduccionConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'produccion'
+
+    def ready(self):
+        # Importar signals cuando la app esté lista
+        import produccion.signals
+
+        # Con IA_PRECARGAR_MODELOS=1 (workers web) los modelos se cargan al
+        # iniciar el proceso en lugar de en la primera predicción
+        from django.conf import settings
+        if settings.IA_PRECARGAR_MODELOS:
+            from .ia.diagnostico_service import RUTA_COLUMNAS, RUTA_MODELO
+            from .ia.registro_modelos import registro_modelos
+            registro_modelos.precargar([RUTA_MODELO, RUTA_COLUMNAS])
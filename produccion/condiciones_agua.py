@@ -0,0 +1,449 @@
+import io
+from functools import reduce
+from operator import or_
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+import pandas as pd
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.db import transaction
+from django.db.models import Count, Max, Min, Q, Sum
+from django.db.models.functions import TruncDay, TruncHour
+from django.utils import timezone
+from .alertas import evaluar_lecturas
+from .models import Artesa, Bastidor, Jaula, LecturaSensor, Lote, RegistroCondiciones, ResumenCondiciones
+
+# ================================================================
+# SERIES DE TIEMPO DE LAS CONDICIONES DEL AGUA
+# ================================================================
+# Las lecturas de los sensores se guardan crudas (LecturaSensor) y al
+# ingresarlas se recalculan solo las horas y los días que tocan
+# (ResumenCondiciones). Las consultas por rango leen el nivel más grueso
+# que alcanza para la resolución pedida, así un gráfico de varios meses
+# lee resúmenes por hora o por día y no cientos de miles de lecturas.
+
+VARIABLES = [variable for variable, _ in ResumenCondiciones.VARIABLES]
+CAMPOS_UNICOS_RESUMEN = ['content_type', 'object_id', 'variable', 'granularidad', 'inicio']
+CAMPOS_VALORES_RESUMEN = ['minimo', 'maximo', 'suma', 'conteo']
+
+GRANULARIDAD_CRUDA = 'CRUDO'
+DURACION_GRANULARIDAD = {'HORA': timedelta(hours=1), 'DIA': timedelta(days=1)}
+# Puntos que devuelve una consulta cuando no se pide un intervalo
+MAX_PUNTOS_SERIE = 500
+
+# Campo del lote que apunta a cada tipo de unidad
+UNIDADES_LOTE = ((Bastidor, 'bastidor_id'), (Artesa, 'artesa_id'), (Jaula, 'jaula_id'))
+
+# --- Ingesta masiva ---
+FORMATO_NDJSON = 'ndjson'
+FORMATO_CSV = 'csv'
+# Valores físicamente posibles; lo que queda fuera es una falla del sensor
+RANGOS_VALIDOS = {
+    'temp_agua_c': (-2.0, 40.0),
+    'ph': (0.0, 14.0),
+    'oxigeno_mg_l': (0.0, 30.0),
+    'amoniaco_mg_l': (0.0, 100.0),
+}
+TOLERANCIA_FUTURO = timedelta(minutes=5)
+MAX_ERRORES_REPORTADOS = 100
+# Condiciones unidas con OR en una misma consulta: SQLite rechaza expresiones
+# de más de 1000 niveles, así que los envíos con muchas unidades se consultan
+# en bloques
+MAX_CONDICIONES_CONSULTA = 100
+
+
+def clave_unidad(unidad):
+    return ContentType.objects.get_for_model(unidad).pk, unidad.pk
+
+
+def _inicio_hora(momento):
+    return timezone.localtime(momento).replace(minute=0, second=0, microsecond=0)
+
+
+def _inicio_dia(momento):
+    return timezone.make_aware(datetime.combine(timezone.localtime(momento).date(), time.min))
+
+
+def filtros_rangos(rangos, campo, redondear, duracion):
+    """
+    Filtros (Q) que cubren `rangos` ({(content_type_id, object_id): (desde,
+    hasta)}) desde redondear(desde) hasta redondear(hasta) + duracion. Las
+    unidades con el mismo rango comparten una condición object_id__in y cada
+    filtro une a lo sumo MAX_CONDICIONES_CONSULTA condiciones: hay que hacer
+    una consulta por filtro.
+    """
+    grupos = {}
+    for (content_type_id, object_id), (desde, hasta) in rangos.items():
+        clave = (content_type_id, redondear(desde), redondear(hasta) + duracion)
+        grupos.setdefault(clave, []).append(object_id)
+    condiciones = [
+        Q(
+            content_type_id=content_type_id,
+            object_id__in=object_ids,
+            **{f'{campo}__gte': desde, f'{campo}__lt': hasta},
+        )
+        for (content_type_id, desde, hasta), object_ids in grupos.items()
+    ]
+    return [
+        reduce(or_, condiciones[i:i + MAX_CONDICIONES_CONSULTA])
+        for i in range(0, len(condiciones), MAX_CONDICIONES_CONSULTA)
+    ]
+
+
+def _guardar_resumenes(resumenes):
+    ResumenCondiciones.objects.bulk_create(
+        resumenes,
+        batch_size=1000,
+        update_conflicts=True,
+        unique_fields=CAMPOS_UNICOS_RESUMEN,
+        update_fields=CAMPOS_VALORES_RESUMEN,
+    )
+
+
+def actualizar_resumenes(rangos):
+    """
+    Recalcula los resúmenes por hora y por día de las unidades indicadas.
+    `rangos` es {(content_type_id, object_id): (desde, hasta)}; solo se
+    tocan las horas y días que cubren esos momentos.
+    """
+    if not rangos:
+        return
+
+    # 1. Horas: se agregan las lecturas crudas de esas horas, todas las unidades a la vez
+    agregados = {}
+    for variable in VARIABLES:
+        agregados.update({
+            f'{variable}__min': Min(variable),
+            f'{variable}__max': Max(variable),
+            f'{variable}__suma': Sum(variable),
+            f'{variable}__conteo': Count(variable),
+        })
+    por_hora = [
+        fila
+        for filtro in filtros_rangos(rangos, 'momento', _inicio_hora, timedelta(hours=1))
+        for fila in LecturaSensor.objects.filter(filtro)
+        .annotate(hora=TruncHour('momento'))
+        .values('content_type_id', 'object_id', 'hora')
+        .annotate(**agregados)
+        .order_by()
+    ]
+    _guardar_resumenes([
+        ResumenCondiciones(
+            content_type_id=fila['content_type_id'],
+            object_id=fila['object_id'],
+            variable=variable,
+            granularidad='HORA',
+            inicio=fila['hora'],
+            minimo=fila[f'{variable}__min'],
+            maximo=fila[f'{variable}__max'],
+            suma=fila[f'{variable}__suma'],
+            conteo=fila[f'{variable}__conteo'],
+        )
+        for fila in por_hora
+        for variable in VARIABLES
+        if fila[f'{variable}__conteo']
+    ])
+
+    # 2. Días: se combinan los resúmenes por hora (no se vuelven a leer las lecturas)
+    por_dia = [
+        fila
+        for filtro in filtros_rangos(rangos, 'inicio', _inicio_dia, timedelta(days=1))
+        for fila in ResumenCondiciones.objects.filter(granularidad='HORA').filter(filtro)
+        .annotate(dia=TruncDay('inicio'))
+        .values('content_type_id', 'object_id', 'variable', 'dia')
+        .annotate(min=Min('minimo'), max=Max('maximo'), total=Sum('suma'), lecturas=Sum('conteo'))
+        .order_by()
+    ]
+    _guardar_resumenes([
+        ResumenCondiciones(
+            content_type_id=fila['content_type_id'],
+            object_id=fila['object_id'],
+            variable=fila['variable'],
+            granularidad='DIA',
+            inicio=fila['dia'],
+            minimo=fila['min'],
+            maximo=fila['max'],
+            suma=fila['total'],
+            conteo=fila['lecturas'],
+        )
+        for fila in por_dia
+    ])
+
+
+def lotes_por_unidad(claves):
+    """Lotes activos de cada unidad: {(content_type_id, object_id): [lote_id, ...]}."""
+    campo_por_tipo = {ContentType.objects.get_for_model(modelo).pk: campo for modelo, campo in UNIDADES_LOTE}
+    ids_por_tipo = {}
+    for content_type_id, object_id in claves:
+        if content_type_id in campo_por_tipo:
+            ids_por_tipo.setdefault(content_type_id, []).append(object_id)
+    if not ids_por_tipo:
+        return {}
+    # Una condición por tipo de unidad, no una por unidad
+    filtro_lotes = reduce(or_, (
+        Q(**{f'{campo_por_tipo[content_type_id]}__in': ids}) for content_type_id, ids in ids_por_tipo.items()
+    ))
+
+    lotes = {}
+    for lote in Lote.objects.filter(activo=True).filter(filtro_lotes).values('pk', *campo_por_tipo.values()):
+        for content_type_id, campo in campo_por_tipo.items():
+            if lote[campo]:
+                lotes.setdefault((content_type_id, lote[campo]), []).append(lote['pk'])
+    return lotes
+
+
+def actualizar_condiciones_diarias(rangos, lotes):
+    """
+    Vuelca el promedio diario de los sensores en el RegistroCondiciones de
+    los lotes activos que están en cada unidad (`lotes`, ver lotes_por_unidad),
+    con una sola escritura. Las variables sin lecturas ese día conservan lo
+    que se cargó a mano.
+    """
+    if not lotes:
+        return
+
+    promedios = {}
+    resumenes = [
+        fila
+        for filtro in filtros_rangos(rangos, 'inicio', _inicio_dia, timedelta(days=1))
+        for fila in ResumenCondiciones.objects.filter(granularidad='DIA').filter(filtro).values_list(
+            'content_type_id', 'object_id', 'variable', 'inicio', 'suma', 'conteo'
+        )
+    ]
+    for content_type_id, object_id, variable, inicio, suma, conteo in resumenes:
+        promedio = Decimal(suma / conteo).quantize(Decimal('0.01'))
+        fecha = timezone.localtime(inicio).date()
+        for lote_id in lotes.get((content_type_id, object_id), []):
+            promedios.setdefault((lote_id, fecha), {})[variable] = promedio
+    if not promedios:
+        return
+
+    existentes = {
+        (registro['lote_id'], registro['fecha']): registro
+        for registro in RegistroCondiciones.objects.filter(
+            lote_id__in={lote_id for lote_id, _ in promedios},
+            fecha__in={fecha for _, fecha in promedios},
+        ).values('lote_id', 'fecha', *VARIABLES)
+    }
+    RegistroCondiciones.objects.bulk_create(
+        [
+            RegistroCondiciones(
+                lote_id=lote_id,
+                fecha=fecha,
+                **{
+                    variable: valores.get(variable, existentes.get((lote_id, fecha), {}).get(variable))
+                    for variable in VARIABLES
+                },
+            )
+            for (lote_id, fecha), valores in promedios.items()
+        ],
+        update_conflicts=True,
+        unique_fields=['lote', 'fecha'],
+        update_fields=VARIABLES,
+    )
+
+
+def registrar_lecturas(lecturas):
+    """
+    Guarda en bloque lecturas de sensores (instancias de LecturaSensor sin
+    guardar), actualiza sus resúmenes y el RegistroCondiciones diario de los
+    lotes y evalúa las reglas de alerta. Una lectura repetida (misma unidad y momento) reemplaza a la
+    anterior. Devuelve la cantidad procesada.
+    """
+    lecturas = list(lecturas)
+    if not lecturas:
+        return 0
+
+    rangos = {}
+    for lectura in lecturas:
+        clave = (lectura.content_type_id, lectura.object_id)
+        desde, hasta = rangos.get(clave, (lectura.momento, lectura.momento))
+        rangos[clave] = (min(desde, lectura.momento), max(hasta, lectura.momento))
+
+    with transaction.atomic():
+        LecturaSensor.objects.bulk_create(
+            lecturas,
+            batch_size=1000,
+            update_conflicts=True,
+            unique_fields=['content_type', 'object_id', 'momento'],
+            update_fields=VARIABLES,
+        )
+        actualizar_resumenes(rangos)
+        lotes = lotes_por_unidad(rangos)
+        actualizar_condiciones_diarias(rangos, lotes)
+        evaluar_lecturas(rangos, lotes)
+    return len(lecturas)
+
+
+def leer_lecturas(contenido, formato):
+    """DataFrame con las filas del envío (NDJSON o CSV con encabezado)."""
+    archivo = io.BytesIO(contenido)
+    if formato == FORMATO_CSV:
+        df = pd.read_csv(archivo, dtype=str, skipinitialspace=True)
+    else:
+        df = pd.read_json(archivo, lines=True, dtype=False, convert_dates=False)
+    for columna in ('unidad', 'lote', 'momento', *VARIABLES):
+        if columna not in df.columns:
+            df[columna] = None
+    return df.reset_index(drop=True)
+
+
+def _claves_por_codigo(df):
+    """Clave (content_type_id, object_id) de cada fila según su `unidad` o su `lote`."""
+    por_unidad = {}
+    codigos = df['unidad'].dropna().astype(str).unique().tolist()
+    for modelo, _ in UNIDADES_LOTE:
+        content_type_id = ContentType.objects.get_for_model(modelo).pk
+        for pk, codigo in modelo.objects.filter(codigo__in=codigos).values_list('pk', 'codigo'):
+            por_unidad[codigo] = (content_type_id, pk)
+
+    # Un lote se traduce a la unidad en la que está ahora
+    por_lote = {}
+    codigos = df['lote'].dropna().astype(str).unique().tolist()
+    campos = [campo for _, campo in UNIDADES_LOTE]
+    for lote in Lote.objects.filter(codigo_lote__in=codigos).values('codigo_lote', *campos):
+        for modelo, campo in UNIDADES_LOTE:
+            if lote[campo]:
+                por_lote[lote['codigo_lote']] = (ContentType.objects.get_for_model(modelo).pk, lote[campo])
+
+    claves = df['unidad'].map(por_unidad, na_action='ignore')
+    return claves.where(claves.notna(), df['lote'].map(por_lote, na_action='ignore'))
+
+
+def _parsear_momentos(columna):
+    # Con zona horaria explícita se respeta; sin ella se toma la hora local
+    texto = columna.astype(str).str.strip()
+    con_zona = texto.str.contains(r'(?:Z|[+-]\d{2}:?\d{2})$', regex=True, na=False)
+    partes = []
+    if con_zona.any():
+        partes.append(pd.to_datetime(texto[con_zona], errors='coerce', utc=True, format='ISO8601'))
+    if (~con_zona).any():
+        locales = pd.to_datetime(texto[~con_zona], errors='coerce', format='ISO8601')
+        partes.append(locales.dt.tz_localize(settings.TIME_ZONE, ambiguous='NaT', nonexistent='NaT').dt.tz_convert('UTC'))
+    return pd.concat(partes).reindex(columna.index)
+
+
+def validar_lecturas(df):
+    """
+    Valida todas las filas a la vez con máscaras de pandas. Devuelve
+    (DataFrame de lecturas válidas, errores por fila). Cada fila inválida
+    queda con el primer problema encontrado.
+    """
+    motivos = pd.Series('', index=df.index, dtype=object)
+
+    def marcar(mascara, motivo):
+        motivos[mascara & (motivos == '')] = motivo
+
+    claves = _claves_por_codigo(df)
+    marcar(claves.isna(), "Unidad o lote desconocido")
+
+    momentos = _parsear_momentos(df['momento'])
+    marcar(momentos.isna(), "Momento inválido")
+    marcar(momentos > pd.Timestamp(timezone.now() + TOLERANCIA_FUTURO), "Momento en el futuro")
+
+    valores = {}
+    for variable in VARIABLES:
+        texto = df[variable].astype(object).where(df[variable].notna(), None)
+        numeros = pd.to_numeric(df[variable], errors='coerce')
+        marcar(texto.notna() & numeros.isna(), f"{variable} no es numérico")
+        minimo, maximo = RANGOS_VALIDOS[variable]
+        marcar((numeros < minimo) | (numeros > maximo), f"{variable} fuera de rango")
+        valores[variable] = numeros
+    marcar(pd.DataFrame(valores).isna().all(axis=1), "La lectura no trae valores")
+
+    validas = motivos == ''
+    lecturas = pd.DataFrame({'clave': claves[validas], 'momento': momentos[validas]})
+    for variable in VARIABLES:
+        lecturas[variable] = valores[variable][validas]
+    # Dentro del mismo envío, la última lectura de una unidad y momento es la que vale
+    lecturas = lecturas.drop_duplicates(subset=['clave', 'momento'], keep='last')
+    errores = [{'fila': int(indice) + 1, 'error': motivo} for indice, motivo in motivos[~validas].items()]
+    return lecturas, errores
+
+
+def ingresar_lecturas(contenido, formato):
+    """
+    Lee, valida y guarda un envío de lecturas de sensores. Las filas
+    válidas se guardan aunque otras se rechacen.
+    """
+    df = leer_lecturas(contenido, formato)
+    validas, errores = validar_lecturas(df)
+    columnas = {
+        variable: validas[variable].astype(object).where(validas[variable].notna(), None)
+        for variable in VARIABLES
+    }
+    registrar_lecturas(
+        LecturaSensor(
+            content_type_id=clave[0],
+            object_id=clave[1],
+            momento=momento.to_pydatetime(),
+            **dict(zip(VARIABLES, valores)),
+        )
+        for clave, momento, *valores in zip(validas['clave'], validas['momento'], *columnas.values())
+    )
+    return {
+        'recibidas': len(df),
+        'aceptadas': len(df) - len(errores),
+        'rechazadas': len(errores),
+        'errores': errores[:MAX_ERRORES_REPORTADOS],
+    }
+
+
+def _reagrupar(puntos, origen, intervalo):
+    """Combina puntos consecutivos en cubetas de `intervalo` contadas desde `origen`."""
+    cubetas = {}
+    for punto in puntos:
+        indice = (punto['inicio'] - origen) // intervalo
+        cubeta = cubetas.get(indice)
+        if cubeta is None:
+            cubetas[indice] = {**punto, 'inicio': origen + indice * intervalo}
+        else:
+            cubeta['minimo'] = min(cubeta['minimo'], punto['minimo'])
+            cubeta['maximo'] = max(cubeta['maximo'], punto['maximo'])
+            cubeta['suma'] += punto['suma']
+            cubeta['conteo'] += punto['conteo']
+    for cubeta in cubetas.values():
+        cubeta['promedio'] = cubeta.pop('suma') / cubeta['conteo']
+    return list(cubetas.values())
+
+
+def serie_condiciones(unidad, variable, desde, hasta, intervalo=None):
+    """
+    Serie de `variable` para la unidad entre `desde` (inclusive) y `hasta`,
+    en cubetas de `intervalo` (sin él, unas MAX_PUNTOS_SERIE cubetas). Se lee
+    el resumen más grueso que no supere el intervalo (día, hora o las
+    lecturas crudas). Cada punto trae inicio, mínimo, máximo, promedio y
+    cantidad de lecturas.
+    """
+    if variable not in VARIABLES:
+        raise ValueError(f"Variable desconocida: {variable}")
+    intervalo = intervalo or (hasta - desde) / MAX_PUNTOS_SERIE
+    content_type_id, object_id = clave_unidad(unidad)
+
+    granularidad = next(
+        (nombre for nombre in ('DIA', 'HORA') if intervalo >= DURACION_GRANULARIDAD[nombre]),
+        GRANULARIDAD_CRUDA,
+    )
+    if granularidad == GRANULARIDAD_CRUDA:
+        origen = desde
+        lecturas = LecturaSensor.objects.filter(
+            content_type_id=content_type_id, object_id=object_id,
+            momento__gte=desde, momento__lt=hasta, **{f'{variable}__isnull': False},
+        ).order_by('momento').values_list('momento', variable)
+        puntos = [
+            {'inicio': momento, 'minimo': valor, 'maximo': valor, 'suma': valor, 'conteo': 1}
+            for momento, valor in lecturas
+        ]
+    else:
+        # Se incluye el resumen que contiene a `desde` aunque empiece antes
+        origen = (_inicio_dia if granularidad == 'DIA' else _inicio_hora)(desde)
+        resumenes = ResumenCondiciones.objects.filter(
+            content_type_id=content_type_id, object_id=object_id, variable=variable,
+            granularidad=granularidad, inicio__gte=origen, inicio__lt=hasta,
+        ).order_by('inicio').values_list('inicio', 'minimo', 'maximo', 'suma', 'conteo')
+        puntos = [
+            {'inicio': inicio, 'minimo': minimo, 'maximo': maximo, 'suma': suma, 'conteo': conteo}
+            for inicio, minimo, maximo, suma, conteo in resumenes
+        ]
+    # Las cubetas del nivel elegido pueden ser más finas que el intervalo pedido
+    return {'variable': variable, 'granularidad': granularidad, 'puntos': _reagrupar(puntos, origen, intervalo)}
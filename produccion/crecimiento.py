@@ -0,0 +1,200 @@
+from dataclasses import dataclass
+from datetime import timedelta
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Sum
+from django.utils import timezone
+from .models import HistorialMovimiento, Lote, RegistroCondiciones, RegistroMortalidad
+
+# ================================================================
+# PRONÓSTICO DE CRECIMIENTO (PESO, BIOMASA Y FECHA DE COSECHA)
+# ================================================================
+# Modelo de coeficiente de crecimiento térmico (TGC), el habitual en trucha:
+#     peso^(1/3) = peso_0^(1/3) + TGC / 1000 × grados-día acumulados
+# El TGC de cada lote se ajusta por mínimos cuadrados con sus mediciones
+# (HistorialMovimiento MEDICION) y la temperatura diaria de RegistroCondiciones;
+# los lotes con menos de dos mediciones usan TGC_POR_DEFECTO. La proyección de
+# todos los lotes activos es una sola operación de matrices (lote × día) y el
+# resultado queda en caché hasta el final del día o hasta que cambie un lote
+# (con caché por proceso, como mucho PRONOSTICO_CACHE_SEGUNDOS).
+
+HORIZONTE_DIAS = 90
+PESO_COSECHA_GR = 250
+TGC_POR_DEFECTO = 2.0
+# Ajustes fuera de este rango vienen de mediciones inconsistentes
+TGC_MINIMO, TGC_MAXIMO = 0.5, 4.0
+TEMPERATURA_POR_DEFECTO = 12.0
+# Días de historia para la temperatura futura y la tasa de mortalidad
+DIAS_RECIENTES = 30
+
+CLAVE_VERSION = 'crecimiento:version'
+
+
+@dataclass(frozen=True)
+class PronosticoCrecimiento:
+    """
+    Proyección de `HORIZONTE_DIAS` días desde `fecha`. Las matrices tienen una
+    fila por lote (en el orden de `lote_ids`) y una columna por día, con el día
+    0 = hoy. Los arreglos son de solo lectura porque el objeto se comparte.
+    """
+    fecha: object
+    lote_ids: tuple
+    codigos: tuple
+    etapas: tuple
+    tgc: np.ndarray
+    ajustado: np.ndarray
+    temperatura: np.ndarray
+    peso_gr: np.ndarray
+    talla_cm: np.ndarray
+    peces: np.ndarray
+    dias_a_cosecha: np.ndarray
+
+    @property
+    def fechas(self):
+        return [self.fecha + timedelta(days=dia) for dia in range(self.peso_gr.shape[1])]
+
+    @property
+    def biomasa_kg(self):
+        return self.peso_gr * self.peces / 1000
+
+    def fecha_cosecha(self, i):
+        dias = self.dias_a_cosecha[i]
+        return None if np.isnan(dias) else self.fecha + timedelta(days=int(dias))
+
+
+def invalidar_pronostico():
+    """El próximo pronóstico se vuelve a calcular en lugar de leerse de la caché."""
+    try:
+        cache.incr(CLAVE_VERSION)
+    except ValueError:
+        cache.set(CLAVE_VERSION, 2, None)
+
+
+def pronostico_crecimiento(hoy=None):
+    """Pronóstico de la granja para `hoy`, calculado una vez por día y versión."""
+    hoy = hoy or timezone.localdate()
+    version = cache.get_or_set(CLAVE_VERSION, 1, None)
+    clave = f"crecimiento:pronostico:{hoy.isoformat()}:{version}"
+    pronostico = cache.get(clave)
+    if pronostico is None:
+        pronostico = calcular_pronostico(hoy)
+        cache.set(clave, pronostico, settings.PRONOSTICO_CACHE_SEGUNDOS)
+    return pronostico
+
+
+def _solo_lectura(*arreglos):
+    for arreglo in arreglos:
+        arreglo.setflags(write=False)
+
+
+def calcular_pronostico(hoy, horizonte=HORIZONTE_DIAS):
+    lotes = list(
+        Lote.objects.filter(activo=True, peso_promedio_pez_gr__gt=0, cantidad_total_peces__gt=0)
+        .order_by('pk')
+        .values_list(
+            'pk', 'codigo_lote', 'etapa_actual', 'cantidad_total_peces',
+            'peso_promedio_pez_gr', 'peso_promedio_inicial_gr', 'fecha_ingreso_etapa', 'talla_max_cm',
+        )
+    )
+    n = len(lotes)
+    indice = {fila[0]: i for i, fila in enumerate(lotes)}
+    peces_hoy = np.array([fila[3] for fila in lotes], dtype=float)
+    peso_hoy = np.array([float(fila[4]) for fila in lotes], dtype=float)
+    talla_hoy = np.array([float(fila[7]) if fila[7] else np.nan for fila in lotes], dtype=float)
+
+    # --- Puntos (lote, fecha, peso) para ajustar el TGC ---
+    puntos = [
+        (i, fila[6], float(fila[5])) for i, fila in enumerate(lotes) if fila[5] and fila[6] <= hoy
+    ]
+    mediciones = HistorialMovimiento.objects.filter(
+        lote_id__in=list(indice), tipo_movimiento='MEDICION', peso_promedio_gr__gt=0,
+    ).order_by('fecha').values_list('lote_id', 'fecha', 'peso_promedio_gr')
+    # Fecha de la última medición de cada lote; sin ella el peso actual se toma como de hoy
+    ancla = np.full(n, hoy.toordinal())
+    for lote_id, fecha, peso in mediciones:
+        i = indice[lote_id]
+        fecha = timezone.localdate(fecha)
+        if not lotes[i][6] <= fecha <= hoy:
+            # Mediciones de una etapa anterior (o con fecha futura)
+            continue
+        puntos.append((i, fecha, float(peso)))
+        ancla[i] = fecha.toordinal() if float(peso) == peso_hoy[i] else hoy.toordinal()
+
+    # --- Temperatura diaria (lote × día) desde la fecha más antigua necesaria ---
+    inicio = min([fecha for _, fecha, _ in puntos] + [hoy - timedelta(days=DIAS_RECIENTES)])
+    dias_historia = (hoy - inicio).days + 1
+    temperaturas = np.full((n, dias_historia), np.nan)
+    registros = RegistroCondiciones.objects.filter(
+        lote_id__in=list(indice), fecha__gte=inicio, fecha__lte=hoy, temp_agua_c__isnull=False,
+    ).values_list('lote_id', 'fecha', 'temp_agua_c')
+    for lote_id, fecha, temperatura in registros:
+        temperaturas[indice[lote_id], (fecha - inicio).days] = float(temperatura)
+
+    # Los días sin registro toman el promedio del lote, o de la granja, o el valor por defecto
+    con_datos = ~np.isnan(temperaturas)
+    conteo = con_datos.sum(axis=1)
+    suma = np.where(con_datos, temperaturas, 0).sum(axis=1)
+    promedio_granja = suma.sum() / conteo.sum() if conteo.sum() else TEMPERATURA_POR_DEFECTO
+    promedio_lote = np.where(conteo > 0, suma / np.maximum(conteo, 1), promedio_granja)
+    temperaturas = np.where(con_datos, temperaturas, promedio_lote[:, None])
+    # Grados-día acumulados al inicio de cada día (una medición no incluye el día en que se toma)
+    grados_dia = np.cumsum(temperaturas, axis=1) - temperaturas
+    temperatura_futura = temperaturas[:, -DIAS_RECIENTES:].mean(axis=1)
+
+    # --- Ajuste del TGC de todos los lotes a la vez (regresión lineal agrupada) ---
+    tgc = np.full(n, TGC_POR_DEFECTO)
+    ajustado = np.zeros(n, dtype=bool)
+    if puntos:
+        filas = np.array([i for i, _, _ in puntos])
+        x = grados_dia[filas, [(fecha - inicio).days for _, fecha, _ in puntos]] / 1000
+        y = np.cbrt([peso for _, _, peso in puntos])
+        cantidad = np.bincount(filas, minlength=n)
+        sx, sy = np.bincount(filas, x, n), np.bincount(filas, y, n)
+        sxx, sxy = np.bincount(filas, x * x, n), np.bincount(filas, x * y, n)
+        denominador = cantidad * sxx - sx * sx
+        with np.errstate(divide='ignore', invalid='ignore'):
+            pendiente = (cantidad * sxy - sx * sy) / denominador
+        ajustado = (cantidad >= 2) & (denominador > 1e-9) & (pendiente >= TGC_MINIMO) & (pendiente <= TGC_MAXIMO)
+        tgc = np.where(ajustado, pendiente, TGC_POR_DEFECTO)
+
+    # --- Mortalidad diaria según las bajas recientes ---
+    bajas = np.zeros(n)
+    for lote_id, total in (
+        RegistroMortalidad.objects.filter(lote_id__in=list(indice), fecha__gt=hoy - timedelta(days=DIAS_RECIENTES))
+        .values('lote_id').annotate(total=Sum('cantidad')).values_list('lote_id', 'total')
+    ):
+        bajas[indice[lote_id]] = total
+    mortalidad = bajas / np.maximum(peces_hoy + bajas, 1) / DIAS_RECIENTES
+
+    # --- Proyección (lote × día) ---
+    dias = np.arange(horizonte + 1)
+    # Grados-día ya transcurridos entre la última medición y hoy
+    columna_ancla = np.clip(ancla - inicio.toordinal(), 0, dias_historia - 1)
+    transcurridos = grados_dia[:, -1] - grados_dia[np.arange(n), columna_ancla]
+    raiz_ancla = np.cbrt(peso_hoy)
+    raiz = raiz_ancla[:, None] + tgc[:, None] / 1000 * (transcurridos[:, None] + temperatura_futura[:, None] * dias)
+    peso_gr = raiz ** 3
+    # Crecimiento isométrico: la talla crece con la raíz cúbica del peso (NaN si el lote no tiene talla)
+    talla_cm = talla_hoy[:, None] * raiz / raiz_ancla[:, None]
+    peces = np.floor(peces_hoy[:, None] * (1 - mortalidad[:, None]) ** dias)
+
+    # Días hasta el peso de cosecha, despejando la ecuación (también más allá del horizonte)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        faltan = ((np.cbrt(PESO_COSECHA_GR) - raiz_ancla) * 1000 / tgc - transcurridos) / temperatura_futura
+    dias_a_cosecha = np.where(temperatura_futura > 0, np.ceil(np.maximum(faltan, 0)), np.nan)
+
+    _solo_lectura(tgc, ajustado, temperatura_futura, peso_gr, talla_cm, peces, dias_a_cosecha)
+    return PronosticoCrecimiento(
+        fecha=hoy,
+        lote_ids=tuple(fila[0] for fila in lotes),
+        codigos=tuple(fila[1] for fila in lotes),
+        etapas=tuple(fila[2] for fila in lotes),
+        tgc=tgc,
+        ajustado=ajustado,
+        temperatura=temperatura_futura,
+        peso_gr=peso_gr,
+        talla_cm=talla_cm,
+        peces=peces,
+        dias_a_cosecha=dias_a_cosecha,
+    )
@@ -0,0 +1,83 @@
+import asyncio
+import json
+import threading
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+# ================================================================
+# CANAL DE EVENTOS EN VIVO (SSE)
+# ================================================================
+# Las señales publican aquí los cambios (notificaciones, biomasa de las
+# unidades, tareas del día) y cada conexión abierta en /produccion/eventos/
+# los recibe sin consultar la base de datos. El broker en memoria solo
+# reparte eventos dentro del mismo proceso: para varios procesos se puede
+# configurar otro en settings.EVENTOS_BROKER con la misma interfaz.
+
+TAMANO_COLA = 100
+
+
+class BrokerMemoria:
+    """Reparte los eventos a las colas asyncio de los suscriptores del proceso."""
+
+    def __init__(self):
+        self._suscriptores = set()
+        self._lock = threading.Lock()
+
+    def suscribir(self):
+        """Devuelve una cola nueva; llamar desde el event loop que la va a leer."""
+        cola = asyncio.Queue(maxsize=TAMANO_COLA)
+        with self._lock:
+            self._suscriptores.add((asyncio.get_running_loop(), cola))
+        return cola
+
+    def desuscribir(self, cola):
+        with self._lock:
+            self._suscriptores = {(loop, c) for loop, c in self._suscriptores if c is not cola}
+
+    def publicar(self, evento):
+        """Seguro de llamar desde cualquier hilo (vistas síncronas, señales)."""
+        with self._lock:
+            suscriptores = list(self._suscriptores)
+        for loop, cola in suscriptores:
+            try:
+                loop.call_soon_threadsafe(_encolar, cola, evento)
+            except RuntimeError:
+                # El loop de esa conexión ya se cerró
+                self.desuscribir(cola)
+
+
+def _encolar(cola, evento):
+    try:
+        cola.put_nowait(evento)
+    except asyncio.QueueFull:
+        # Un cliente lento pierde eventos en lugar de acumular memoria
+        pass
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def obtener_broker():
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                _broker = import_string(settings.EVENTOS_BROKER)()
+    return _broker
+
+
+def publicar_evento(tipo, datos):
+    """
+    Publica un evento para todas las conexiones abiertas. Quien lo llame desde
+    una señal debe hacerlo en transaction.on_commit.
+    """
+    obtener_broker().publicar({'tipo': tipo, 'datos': datos})
+
+
+def formatear_sse(tipo, datos, id_evento=None):
+    lineas = [f"event: {tipo}"]
+    if id_evento:
+        lineas.append(f"id: {id_evento}")
+    lineas.append(f"data: {json.dumps(datos, default=str)}")
+    return "\n".join(lineas) + "\n\n"
@@ -0,0 +1,43 @@
+import csv
+import io
+from openpyxl import Workbook
+
+# Filas que se leen de la base de datos por cada viaje (queryset.iterator)
+TAMANO_BLOQUE = 2000
+
+
+def iterar_en_bloques(queryset, tamano=TAMANO_BLOQUE):
+    """Recorre el queryset en bloques sin llenar la caché del queryset."""
+    return queryset.iterator(chunk_size=tamano)
+
+
+def _escribir_xlsx(destino, titulo, encabezados, filas):
+    """
+    Escribe el libro en modo write-only: openpyxl vuelca cada fila a disco
+    en lugar de mantener la hoja en memoria.
+    """
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet(title=titulo[:31])  # Excel limita el título a 31 caracteres
+    sheet.append(encabezados)
+    for fila in filas:
+        sheet.append(fila)
+    workbook.save(destino)
+
+
+def _escribir_csv(destino, encabezados, filas):
+    # utf-8-sig agrega el BOM para que Excel abra el archivo como UTF-8
+    texto = io.TextIOWrapper(destino, encoding='utf-8-sig', newline='')
+    escritor = csv.writer(texto)
+    escritor.writerow(encabezados)
+    escritor.writerows(filas)
+    texto.flush()
+    texto.detach()  # devuelve el archivo binario sin cerrarlo
+
+
+def escribir_archivo(destino, formato, titulo, encabezados, filas):
+    """Vuelca las filas en `destino` (archivo binario abierto) como xlsx o csv."""
+    if formato == 'csv':
+        _escribir_csv(destino, encabezados, filas)
+    else:
+        _escribir_xlsx(destino, titulo, encabezados, filas)
+
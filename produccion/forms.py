@@ -110,7 +110,7 @@ class DiagnosticoForm(forms.Form):
         # Carga los síntomas desde el archivo JSON para crear los campos
         from produccion.ia.predictores.diagnostico_experto import SistemaExpertoSalud
         sistema_experto = SistemaExpertoSalud()
-        sintomas_labels = sistema_experto.base_conocimiento['sintomas']
+        sintomas_labels = sistema_experto.sintomas
 
         for i, label in enumerate(sintomas_labels):
             self.fields[f'sintoma_{i}'] = forms.BooleanField(label=label, required=False)
@@ -0,0 +1,43 @@
+# --- Base de Conocimiento Ampliada con Enfermedades Típicas de Trucha ---
+KNOWLEDGE_BASE = {
+    "Sano": {
+        "explicacion": "La simulación de los parámetros del agua y la ausencia de síntomas indican que el lote se encuentra en condiciones óptimas y sin riesgo aparente.",
+        "plan_de_accion": [
+            "**Acción Inmediata:** No se requiere ninguna acción correctiva.",
+            "**Control Ambiental:** Continuar con las buenas prácticas de manejo y monitoreo de rutina.",
+            "**Monitoreo:** Mantener la frecuencia de medición de parámetros y observación del comportamiento."
+        ]
+    },
+    "Saprolegniasis": { # Hongo
+        "explicacion": "La simulación arrojó una combinación de baja temperatura y estrés (posiblemente por un pico de amoniaco), condiciones ideales para brotes de hongos como Saprolegniasis.",
+        "plan_de_accion": [
+            "**Acción Inmediata:** Realizar baños terapéuticos con sal (NaCl) al 2-3% durante 30 minutos.",
+            "**Control Ambiental:** Aumentar ligeramente la temperatura del agua si es posible y reducir la alimentación para bajar los niveles de amoniaco.",
+            "**Monitoreo:** Vigilar de cerca la aparición de lesiones algodonosas en otros peces del lote."
+        ]
+    },
+    "Punto Blanco (Ich)": { # Parásito
+        "explicacion": "El comportamiento anormal (frotamiento) y el estrés ambiental simulado sugieren una posible infestación por Ichthyophthirius multifiliis, el parásito causante del punto blanco.",
+        "plan_de_accion": [
+            "**Acción Inmediata:** Consultar a un especialista para aplicar un tratamiento antiparasitario (ej: formalina o verde de malaquita).",
+            "**Control Ambiental:** Aumentar gradualmente la temperatura del agua a 15-18°C por unos días para acelerar el ciclo de vida del parásito y hacerlo vulnerable al tratamiento.",
+            "**Monitoreo:** Observar la aparición de pequeños puntos blancos (como granos de sal) en la piel y aletas."
+        ]
+    },
+    "Columnaris": { # Bacteria
+        "explicacion": "Un evento de estrés simulado (como falta de limpieza) pudo haber elevado el amoniaco, favoreciendo una infección bacteriana por Flavobacterium columnare, que afecta piel y branquias.",
+        "plan_de_accion": [
+            "**Acción Inmediata:** Aplicar un tratamiento antibacteriano en el agua o alimento según recomendación experta (ej: Oxitetraciclina).",
+            "**Control Ambiental:** Realizar una limpieza profunda y un recambio de agua parcial para reducir la carga bacteriana.",
+            "**Monitoreo:** Buscar síntomas como aletas deshilachadas, lesiones de aspecto pálido en la piel o dificultad para respirar."
+        ]
+    },
+    "Estres_por_hipoxia": {
+        "explicacion": "La simulación generó un escenario de bajo oxígeno disuelto, crítico en piscigranjas de altura. Esto no es una enfermedad, sino una condición ambiental peligrosa.",
+        "plan_de_accion": [
+            "**¡ACCIÓN URGENTE!:** Incrementar la aireación inmediatamente. Activar aireadores de emergencia si están disponibles.",
+            "**Control Ambiental:** Reducir o detener la alimentación por completo hasta que los niveles de oxígeno se estabilicen (> 7 mg/L).",
+            "**Monitoreo:** Medir el oxígeno cada hora hasta que la situación se normalice."
+        ]
+    }
+}
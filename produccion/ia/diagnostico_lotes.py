@@ -0,0 +1,147 @@
+# En produccion/ia/diagnostico_lotes.py
+import numpy as np
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
+from django.utils import timezone
+from produccion.models import DiagnosticoLote, Lote, RegistroCondiciones
+
+# ================================================================
+# DIAGNÓSTICO MASIVO DE LOTES (TABLA DE RIESGO DE LA GRANJA)
+# ================================================================
+# Se leen las últimas condiciones de todos los lotes con una sola consulta
+# (función de ventana) y las reglas del sistema experto se evalúan sobre
+# arreglos NumPy, así la revisión de 300 lotes cuesta lo mismo que la de uno.
+
+# Rangos de las reglas (los mismos que usaba diagnostico_por_lote_view)
+TEMP_MINIMA_C = 6.0
+PH_MINIMO = 6.8
+PH_MAXIMO = 8.0
+OXIGENO_MINIMO_MG_L = 5.0
+
+NIVEL_POR_DIAGNOSTICO = {
+    'Estres_por_hipoxia': 'ALTO',
+    'Saprolegniasis': 'MEDIO',
+    'Columnaris': 'MEDIO',
+    'Sano': 'BAJO',
+}
+# Orden de la tabla: primero lo urgente, luego los lotes sin mediciones
+ORDEN_NIVELES = {'ALTO': 0, 'MEDIO': 1, 'SIN_DATOS': 2, 'BAJO': 3}
+
+CAMPOS_CONDICIONES = ['temp_agua_c', 'ph', 'oxigeno_mg_l', 'amoniaco_mg_l']
+
+
+def ultimas_condiciones(lotes):
+    """Último RegistroCondiciones de cada lote, en una sola consulta."""
+    return (
+        RegistroCondiciones.objects.filter(lote__in=lotes)
+        .annotate(orden=Window(
+            RowNumber(),
+            partition_by=[F('lote_id')],
+            order_by=[F('fecha').desc(), F('pk').desc()],
+        ))
+        .filter(orden=1)
+        .values('pk', 'lote_id', 'fecha', *CAMPOS_CONDICIONES)
+    )
+
+
+def evaluar_reglas(temp, ph, oxigeno):
+    """
+    Aplica las reglas a arreglos de igual largo (NaN = sin dato) y devuelve
+    (diagnósticos, cantidad de parámetros fuera de rango). Como en el
+    sistema experto, la primera regla que se cumple define el diagnóstico.
+    """
+    temp_baja = temp < TEMP_MINIMA_C
+    ph_fuera = (ph < PH_MINIMO) | (ph > PH_MAXIMO)
+    oxigeno_bajo = oxigeno < OXIGENO_MINIMO_MG_L
+
+    diagnosticos = np.select(
+        [temp_baja, ph_fuera, oxigeno_bajo],
+        ['Saprolegniasis', 'Columnaris', 'Estres_por_hipoxia'],
+        default='Sano',
+    )
+    alertas = temp_baja.astype(int) + ph_fuera.astype(int) + oxigeno_bajo.astype(int)
+    return diagnosticos, alertas
+
+
+def diagnosticar_lotes(lotes=None):
+    """
+    Devuelve la tabla de riesgo (lista de dicts) de los lotes indicados o de
+    todos los activos, ordenada de mayor a menor riesgo.
+    """
+    if lotes is None:
+        lotes = Lote.objects.filter(activo=True)
+    info_lotes = list(lotes.values('id', 'codigo_lote', 'etapa_actual').order_by())
+    condiciones = list(ultimas_condiciones(lotes.values('pk')))
+
+    columnas = {
+        campo: np.array([registro[campo] for registro in condiciones], dtype=float)
+        for campo in CAMPOS_CONDICIONES
+    }
+    diagnosticos, alertas = evaluar_reglas(columnas['temp_agua_c'], columnas['ph'], columnas['oxigeno_mg_l'])
+
+    por_lote = {}
+    for i, registro in enumerate(condiciones):
+        diagnostico = str(diagnosticos[i])
+        por_lote[registro['lote_id']] = {
+            'registro_condiciones_id': registro['pk'],
+            'fecha_condiciones': registro['fecha'],
+            **{campo: registro[campo] for campo in CAMPOS_CONDICIONES},
+            'diagnostico': diagnostico,
+            'nivel_riesgo': NIVEL_POR_DIAGNOSTICO[diagnostico],
+            'alertas': int(alertas[i]),
+        }
+
+    sin_datos = {
+        'registro_condiciones_id': None,
+        'fecha_condiciones': None,
+        **{campo: None for campo in CAMPOS_CONDICIONES},
+        'diagnostico': None,
+        'nivel_riesgo': 'SIN_DATOS',
+        'alertas': 0,
+    }
+    tabla = [
+        {
+            'lote_id': lote['id'],
+            'codigo_lote': lote['codigo_lote'],
+            'etapa_actual': lote['etapa_actual'],
+            **por_lote.get(lote['id'], sin_datos),
+        }
+        for lote in info_lotes
+    ]
+    tabla.sort(key=lambda fila: (ORDEN_NIVELES[fila['nivel_riesgo']], -fila['alertas'], fila['codigo_lote']))
+    return tabla
+
+
+def guardar_diagnosticos(tabla, fecha=None):
+    """
+    Guarda la tabla como DiagnosticoLote del día (reescribe si ya existía,
+    salvo los diagnósticos ya confirmados).
+    """
+    fecha = fecha or timezone.localdate()
+    confirmados = set(
+        DiagnosticoLote.objects.filter(fecha=fecha, confirmado=True).values_list('lote_id', flat=True)
+    )
+    return DiagnosticoLote.objects.bulk_create(
+        [
+            DiagnosticoLote(
+                lote_id=fila['lote_id'],
+                fecha=fecha,
+                registro_condiciones_id=fila['registro_condiciones_id'],
+                diagnostico=fila['diagnostico'] or '',
+                nivel_riesgo=fila['nivel_riesgo'],
+                alertas=fila['alertas'],
+            )
+            for fila in tabla
+            if fila['lote_id'] not in confirmados
+        ],
+        update_conflicts=True,
+        unique_fields=['lote', 'fecha'],
+        update_fields=['registro_condiciones', 'diagnostico', 'nivel_riesgo', 'alertas'],
+    )
+
+
+def resumen_por_nivel(tabla):
+    resumen = {nivel: 0 for nivel in ORDEN_NIVELES}
+    for fila in tabla:
+        resumen[fila['nivel_riesgo']] += 1
+    return resumen
@@ -1,26 +1,43 @@
 # En produccion/ia/diagnostico_service.py
 #import tensorflow as tf
-import joblib
 import numpy as np
 import os
+import warnings
 from django.conf import settings
-from django.utils import timezone
-from produccion.models import Lote, RegistroCondiciones
-from decimal import Decimal
+from .base_conocimiento import KNOWLEDGE_BASE
+from .diagnostico_lotes import ultimas_condiciones
+from .registro_modelos import registro_modelos
+
+# Rutas de los artefactos que genera `entrenar_modelo_diagnostico`
+DIRECTORIO_MODELOS = os.path.join(settings.BASE_DIR, 'produccion', 'ia', 'predictores')
+RUTA_MODELO = os.path.join(DIRECTORIO_MODELOS, 'diagnostico_model.joblib')
+RUTA_COLUMNAS = os.path.join(DIRECTORIO_MODELOS, 'diagnostico_features.joblib')
+
+# Columna del modelo -> campo de RegistroCondiciones. Los síntomas no se
+# registran en las condiciones del agua y se mantienen en 0.
+CAMPOS_POR_COLUMNA = {
+    'temp_agua': 'temp_agua_c',
+    'ph': 'ph',
+    'oxigeno': 'oxigeno_mg_l',
+    'amoniaco': 'amoniaco_mg_l',
+}
+
 
 class DiagnosticoService:
     def __init__(self):
         self.model = None
         self.scaler = None
         # La ruta al modelo debe estar en la carpeta 'ia/predictores'
-        self.model_path = os.path.join(settings.BASE_DIR, 'produccion', 'ia', 'predictores', 'diagnostico_model.joblib')
-        self.columns_path = os.path.join(settings.BASE_DIR, 'produccion', 'ia', 'predictores', 'diagnostico_features.joblib')
+        self.model_path = RUTA_MODELO
+        self.columns_path = RUTA_COLUMNAS
         self._load_model()
 
     def _load_model(self):
+        # El registro carga cada archivo una vez por proceso; aquí solo se
+        # comprueba que no haya cambiado desde entonces
         try:
-            self.model = joblib.load(self.model_path)
-            self.feature_columns = joblib.load(self.columns_path)
+            self.model = registro_modelos.obtener(self.model_path)
+            self.feature_columns = registro_modelos.obtener(self.columns_path)
         except FileNotFoundError:
             self.model = None
             self.feature_columns = None
@@ -29,38 +46,73 @@ class DiagnosticoService:
             self.feature_columns = None
             raise Exception(f"Error al cargar el modelo o las columnas: {e}")
 
-    def predecir(self, lote, registro_condiciones):
+    def _verificar_modelo(self):
         if not self.model or not self.feature_columns:
             raise FileNotFoundError("El modelo de predicción no está disponible. Por favor, entrene el modelo con datos.")
 
-        # Preparar los datos de entrada para la predicción, asegurando el orden correcto
-        input_data = {
-            'temp_agua': [float(registro_condiciones.temp_agua_c) if registro_condiciones.temp_agua_c else 0],
-            'ph': [float(registro_condiciones.ph) if registro_condiciones.ph else 0],
-            'oxigeno': [float(registro_condiciones.oxigeno_mg_l) if registro_condiciones.oxigeno_mg_l else 0],
-            'amoniaco': [float(registro_condiciones.amoniaco_mg_l) if registro_condiciones.amoniaco_mg_l else 0],
-            'sintoma_algodonoso': [0], # Suponemos que estos no están registrados y se mantienen en 0
-            'sintoma_aletas_deshilachadas': [0],
-            'comportamiento_anormal': [0]
-        }
-        
-        # Crear DataFrame y asegurar el orden de las columnas
-        input_df = pd.DataFrame(input_data)
-        input_df = input_df[self.feature_columns]
+    def _matriz_features(self, filas):
+        """
+        Arma la matriz (n_filas x n_columnas) en el orden de `feature_columns`
+        a partir de dicts con los campos de RegistroCondiciones. Los valores
+        vacíos cuentan como 0, igual que en el entrenamiento.
+        """
+        matriz = np.zeros((len(filas), len(self.feature_columns)), dtype=float)
+        for j, columna in enumerate(self.feature_columns):
+            campo = CAMPOS_POR_COLUMNA.get(columna)
+            if campo is None:
+                continue
+            matriz[:, j] = [float(fila[campo] or 0) for fila in filas]
+        return matriz
 
-        prediccion = self.model.predict(input_df)[0]
-        probabilidades = self.model.predict_proba(input_df)[0]
+    def _predecir_matriz(self, matriz):
+        """Una sola llamada a predict_proba; la etiqueta es la clase de mayor probabilidad."""
+        with warnings.catch_warnings():
+            # La matriz ya viene en el orden de feature_columns, así que se
+            # omite el DataFrame que sklearn pide para validar los nombres
+            warnings.filterwarnings('ignore', message='X does not have valid feature names')
+            probabilidades = self.model.predict_proba(matriz)
+        indices = probabilidades.argmax(axis=1)
+        etiquetas = self.model.classes_[indices]
+        confianzas = probabilidades[np.arange(len(indices)), indices] * 100
+        return etiquetas, confianzas
 
-        confianza = max(probabilidades) * 100
-        
+    def _resultado(self, lote, diagnostico_principal, confianza):
         # Mapeamos la predicción del modelo (que puede ser genérica) a un diagnóstico más rico
-        diagnostico_principal = prediccion
-        plan_de_accion_recomendado = KNOWLEDGE_BASE.get(diagnostico_principal, {}).get('plan_de_accion', ["No se encontró un plan de acción."])
-        
+        conocimiento = KNOWLEDGE_BASE.get(diagnostico_principal, {})
         return {
             'lote': lote,
-            'probabilidad': round(confianza, 2),
-            'recomendacion': KNOWLEDGE_BASE.get(diagnostico_principal, {}).get('explicacion', "No hay una explicación disponible."),
+            'probabilidad': round(float(confianza), 2),
+            'recomendacion': conocimiento.get('explicacion', "No hay una explicación disponible."),
             'nivel_riesgo': diagnostico_principal,
-            'plan_de_accion': plan_de_accion_recomendado,
-        }
\ No newline at end of file
+            'plan_de_accion': conocimiento.get('plan_de_accion', ["No se encontró un plan de acción."]),
+        }
+
+    def predecir(self, lote, registro_condiciones):
+        self._verificar_modelo()
+        fila = {campo: getattr(registro_condiciones, campo) for campo in CAMPOS_POR_COLUMNA.values()}
+        etiquetas, confianzas = self._predecir_matriz(self._matriz_features([fila]))
+        return self._resultado(lote, str(etiquetas[0]), confianzas[0])
+
+    def predecir_batch(self, lotes):
+        """
+        Diagnostica varios lotes con su último RegistroCondiciones: una consulta
+        para las condiciones y una sola predicción para todos. Devuelve los
+        resultados en el orden de `lotes`; los lotes sin condiciones registradas
+        no aparecen.
+        """
+        self._verificar_modelo()
+        lotes = list(lotes)
+        filas = list(ultimas_condiciones(lotes))
+        if not filas:
+            return []
+
+        etiquetas, confianzas = self._predecir_matriz(self._matriz_features(filas))
+        por_lote = {
+            fila['lote_id']: (str(etiqueta), confianza)
+            for fila, etiqueta, confianza in zip(filas, etiquetas, confianzas)
+        }
+        return [
+            self._resultado(lote, *por_lote[lote.pk])
+            for lote in lotes
+            if lote.pk in por_lote
+        ]
@@ -0,0 +1,241 @@
+# En produccion/ia/entrenamiento.py
+import filecmp
+import hashlib
+import json
+import logging
+import os
+import shutil
+import time
+import joblib
+import numpy as np
+import pandas as pd
+from django.conf import settings
+from django.utils import timezone
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.metrics import accuracy_score, classification_report
+from sklearn.model_selection import StratifiedKFold, cross_validate, train_test_split
+from produccion.models import DiagnosticoLote
+from .diagnostico_service import CAMPOS_POR_COLUMNA, DIRECTORIO_MODELOS, RUTA_COLUMNAS, RUTA_MODELO
+
+logger = logging.getLogger(__name__)
+
+# ================================================================
+# PIPELINE DE ENTRENAMIENTO DEL MODELO DE DIAGNÓSTICO
+# ================================================================
+# 1. Los datos (CSV o diagnósticos confirmados en la BD) se identifican por
+#    su sha1. La matriz de características extraída se guarda en un .npz
+#    con esa huella, así no se vuelve a leer ni a convertir.
+# 2. Cada combinación datos + parámetros + pliegues produce una versión en
+#    predictores/versiones/<version>/ con el modelo, las columnas y sus
+#    métricas. Si la versión ya existe no se vuelve a entrenar.
+# 3. La versión elegida se publica en RUTA_MODELO/RUTA_COLUMNAS, que es lo
+#    que lee DiagnosticoService.
+
+RUTA_CSV = os.path.join(settings.BASE_DIR, 'produccion', 'ia', 'datos_entrenamiento', 'datos_diagnostico.csv')
+DIRECTORIO_CACHE = os.path.join(DIRECTORIO_MODELOS, 'cache')
+DIRECTORIO_VERSIONES = os.path.join(DIRECTORIO_MODELOS, 'versiones')
+
+ORIGEN_CSV = 'csv'
+ORIGEN_BD = 'bd'
+
+COLUMNAS_FEATURES = [
+    'temp_agua', 'ph', 'oxigeno', 'amoniaco',
+    'sintoma_algodonoso', 'sintoma_aletas_deshilachadas', 'comportamiento_anormal',
+]
+
+
+def guardar_artefacto(objeto, ruta):
+    # Se escribe a un temporal y se reemplaza de una vez: los procesos que
+    # recargan el modelo en caliente nunca leen un archivo a medio escribir
+    temporal = f"{ruta}.tmp"
+    joblib.dump(objeto, temporal)
+    os.replace(temporal, ruta)
+
+
+def _copiar_artefacto(origen, destino):
+    temporal = f"{destino}.tmp"
+    shutil.copyfile(origen, temporal)
+    os.replace(temporal, destino)
+
+
+class DatosEntrenamiento:
+    def __init__(self, X, y, columnas, huella, origen, desde_cache=False):
+        self.X = X
+        self.y = y
+        self.columnas = columnas
+        self.huella = huella
+        self.origen = origen
+        self.desde_cache = desde_cache
+
+
+def _ruta_cache(origen, huella):
+    return os.path.join(DIRECTORIO_CACHE, f"{origen}-{huella[:16]}.npz")
+
+
+def _leer_cache(origen, huella):
+    ruta = _ruta_cache(origen, huella)
+    if not os.path.exists(ruta):
+        return None
+    with np.load(ruta, allow_pickle=False) as datos:
+        return DatosEntrenamiento(
+            datos['X'], datos['y'], datos['columnas'].tolist(), huella, origen, desde_cache=True
+        )
+
+
+def _guardar_cache(datos):
+    os.makedirs(DIRECTORIO_CACHE, exist_ok=True)
+    ruta = _ruta_cache(datos.origen, datos.huella)
+    # np.savez agrega la extensión si el nombre no la tiene
+    temporal = f"{ruta[:-len('.npz')]}.tmp.npz"
+    np.savez_compressed(temporal, X=datos.X, y=datos.y, columnas=np.array(datos.columnas))
+    os.replace(temporal, ruta)
+
+
+def datos_desde_csv(ruta=RUTA_CSV):
+    """Lee el CSV de entrenamiento; la huella es el sha1 del archivo."""
+    with open(ruta, 'rb') as archivo:
+        huella = hashlib.sha1(archivo.read()).hexdigest()
+    datos = _leer_cache(ORIGEN_CSV, huella)
+    if datos is not None:
+        return datos
+
+    df = pd.read_csv(ruta)
+    # Todas las columnas excepto las de identificación y el diagnóstico final
+    features = df.drop(columns=['fecha', 'lote_id', 'diagnostico_final'])
+    datos = DatosEntrenamiento(
+        features.to_numpy(dtype=float),
+        df['diagnostico_final'].to_numpy(dtype=str),
+        features.columns.tolist(),
+        huella,
+        ORIGEN_CSV,
+    )
+    _guardar_cache(datos)
+    return datos
+
+
+def datos_desde_bd():
+    """
+    Filas de RegistroCondiciones con un diagnóstico confirmado. Los síntomas
+    no se registran junto con las condiciones del agua y quedan en 0, igual
+    que al predecir.
+    """
+    campos = list(CAMPOS_POR_COLUMNA.values())
+    filas = list(
+        DiagnosticoLote.objects.filter(confirmado=True, registro_condiciones__isnull=False)
+        .exclude(diagnostico='')
+        .order_by('pk')
+        .values_list(*[f'registro_condiciones__{campo}' for campo in campos], 'diagnostico')
+    )
+    huella = hashlib.sha1(json.dumps(filas, default=str).encode()).hexdigest()
+    datos = _leer_cache(ORIGEN_BD, huella)
+    if datos is not None:
+        return datos
+
+    X = np.zeros((len(filas), len(COLUMNAS_FEATURES)), dtype=float)
+    for j, columna in enumerate(COLUMNAS_FEATURES):
+        if columna in CAMPOS_POR_COLUMNA:
+            i = campos.index(CAMPOS_POR_COLUMNA[columna])
+            X[:, j] = [float(fila[i] or 0) for fila in filas]
+    y = np.array([fila[-1] for fila in filas], dtype=str)
+    datos = DatosEntrenamiento(X, y, list(COLUMNAS_FEATURES), huella, ORIGEN_BD)
+    if filas:
+        _guardar_cache(datos)
+    return datos
+
+
+def _version(datos, parametros, pliegues):
+    # Los pliegues cambian las métricas guardadas, así que también definen la versión
+    clave = json.dumps({'datos': datos.huella, 'parametros': parametros, 'pliegues': pliegues}, sort_keys=True)
+    return hashlib.sha1(clave.encode()).hexdigest()[:12]
+
+
+def _validacion_cruzada(X, y, parametros, pliegues, n_jobs):
+    # Con pocas muestras los pliegues se limitan a la clase más chica
+    _, conteos = np.unique(y, return_counts=True)
+    pliegues = min(pliegues, int(conteos.min()))
+    if pliegues < 2:
+        return None
+    # El paralelismo va en los pliegues; cada bosque se entrena en un hilo
+    resultado = cross_validate(
+        RandomForestClassifier(**parametros, n_jobs=1),
+        X, y,
+        cv=StratifiedKFold(n_splits=pliegues, shuffle=True, random_state=parametros['random_state']),
+        scoring='accuracy',
+        n_jobs=n_jobs,
+    )
+    puntajes = resultado['test_score']
+    return {
+        'pliegues': pliegues,
+        'puntajes': [round(float(p), 4) for p in puntajes],
+        'media': round(float(puntajes.mean()), 4),
+        'desviacion': round(float(puntajes.std()), 4),
+    }
+
+
+def entrenar(datos, n_estimators=100, pliegues=5, n_jobs=-1, forzar=False):
+    """
+    Entrena (o reutiliza) la versión del modelo para estos datos y parámetros.
+    Devuelve (directorio de la versión, métricas, reutilizada).
+    """
+    if len(datos.y) == 0:
+        raise ValueError("No hay datos de entrenamiento.")
+
+    parametros = {'n_estimators': n_estimators, 'random_state': 42, 'class_weight': 'balanced'}
+    version = _version(datos, parametros, pliegues)
+    directorio = os.path.join(DIRECTORIO_VERSIONES, version)
+    ruta_metricas = os.path.join(directorio, 'metricas.json')
+    if not forzar and os.path.exists(ruta_metricas):
+        with open(ruta_metricas, encoding='utf-8') as archivo:
+            return directorio, json.load(archivo), True
+
+    inicio = time.perf_counter()
+    X_train, X_test, y_train, y_test = train_test_split(datos.X, datos.y, test_size=0.2, random_state=42)
+    model = RandomForestClassifier(**parametros, n_jobs=n_jobs)
+    model.fit(X_train, y_train)
+    y_pred = model.predict(X_test)
+    # En los workers web se predice de a pocas filas: un hilo basta
+    model.n_jobs = None
+
+    metricas = {
+        'version': version,
+        'fecha': timezone.now().isoformat(),
+        'origen': datos.origen,
+        'datos_sha1': datos.huella,
+        'muestras': int(len(datos.y)),
+        'columnas': datos.columnas,
+        'clases': model.classes_.tolist(),
+        'parametros': parametros,
+        'precision_prueba': round(float(accuracy_score(y_test, y_pred)), 4),
+        'reporte_prueba': classification_report(y_test, y_pred, output_dict=True, zero_division=0),
+        'validacion_cruzada': _validacion_cruzada(datos.X, datos.y, parametros, pliegues, n_jobs),
+    }
+    metricas['segundos_entrenamiento'] = round(time.perf_counter() - inicio, 3)
+
+    os.makedirs(directorio, exist_ok=True)
+    guardar_artefacto(datos.columnas, os.path.join(directorio, 'diagnostico_features.joblib'))
+    guardar_artefacto(model, os.path.join(directorio, 'diagnostico_model.joblib'))
+    # metricas.json va al final: su presencia marca la versión como completa
+    with open(f"{ruta_metricas}.tmp", 'w', encoding='utf-8') as archivo:
+        json.dump(metricas, archivo, ensure_ascii=False, indent=2)
+    os.replace(f"{ruta_metricas}.tmp", ruta_metricas)
+    logger.info("Modelo de diagnóstico %s entrenado en %.3f s", version, metricas['segundos_entrenamiento'])
+    return directorio, metricas, False
+
+
+def publicar(directorio):
+    """
+    Copia la versión a las rutas que lee DiagnosticoService. Si ya es la
+    publicada no se toca nada, para no forzar una recarga en los workers.
+    """
+    modelo = os.path.join(directorio, 'diagnostico_model.joblib')
+    columnas = os.path.join(directorio, 'diagnostico_features.joblib')
+    if all(
+        os.path.exists(destino) and filecmp.cmp(origen, destino, shallow=False)
+        for origen, destino in ((columnas, RUTA_COLUMNAS), (modelo, RUTA_MODELO))
+    ):
+        return False
+
+    # Primero las columnas y luego el modelo: el registro recarga ambos al detectar el cambio
+    _copiar_artefacto(columnas, RUTA_COLUMNAS)
+    _copiar_artefacto(modelo, RUTA_MODELO)
+    return True
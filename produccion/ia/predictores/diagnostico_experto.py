@@ -1,38 +1,94 @@
 # produccion/ia/predictores/diagnostico_experto.py
 import json
+from types import MappingProxyType
+import numpy as np
 from django.conf import settings
 import os
+from produccion.ia.registro_modelos import registro_modelos
+
+RUTA_BASE_CONOCIMIENTO = os.path.join(settings.BASE_DIR, 'produccion', 'ia', 'datos_entrenamiento', 'enfermedades_trucha.json')
+NOMBRE_SANO = "Sano / Estrés leve"
+
+
+class BaseCompilada:
+    """
+    La base de conocimiento convertida en una matriz enfermedad × síntoma de
+    0s y 1s. Contar coincidencias para N observaciones es un solo producto
+    de matrices. Todo queda en solo lectura porque se comparte entre peticiones.
+    """
+
+    def __init__(self, base_conocimiento):
+        self.sintomas = tuple(base_conocimiento['sintomas'])
+        enfermedades = base_conocimiento['enfermedades']
+        # Se conserva el orden del JSON: ante un empate gana la primera, como antes
+        self.nombres = tuple(nombre for nombre, detalles in enfermedades.items() if 'sintomas' in detalles)
+        self.matriz = np.array(
+            [enfermedades[nombre]['sintomas'] for nombre in self.nombres], dtype=np.int32
+        ).reshape(len(self.nombres), len(self.sintomas))
+        self.matriz.setflags(write=False)
+        self.detalles = MappingProxyType({
+            nombre: MappingProxyType({clave: valor for clave, valor in detalles.items() if clave != 'sintomas'})
+            for nombre, detalles in enfermedades.items()
+        })
+
+
+def compilar_base(ruta):
+    with open(ruta, 'r', encoding='utf-8') as f:
+        return BaseCompilada(json.load(f))
+
+
+def obtener_base():
+    """Base compilada una vez por proceso; se recompila solo si cambia el JSON."""
+    return registro_modelos.obtener(RUTA_BASE_CONOCIMIENTO, cargador=compilar_base)
+
 
 class SistemaExpertoSalud:
     def __init__(self):
-        ruta_json = os.path.join(settings.BASE_DIR, 'produccion', 'ia', 'datos_entrenamiento', 'enfermedades_trucha.json')
-        with open(ruta_json, 'r', encoding='utf-8') as f:
-            self.base_conocimiento = json.load(f)
+        self.base = obtener_base()
+
+    @property
+    def sintomas(self):
+        return self.base.sintomas
+
+    def _resultado(self, nombre, coincidencias, ranking):
+        # Copia nueva y de solo lectura: quien la use no altera la base compartida
+        empates = tuple(otro for otro, puntaje in ranking[1:] if puntaje == coincidencias)
+        return MappingProxyType({
+            **self.base.detalles[nombre],
+            'nombre': nombre,
+            'coincidencias': coincidencias,
+            'empates': empates,
+            'ranking': ranking,
+        })
+
+    def diagnosticar_varios(self, observaciones):
+        """
+        Recibe una matriz (o lista de listas) de 0s y 1s, una fila por
+        observación, y devuelve un diagnóstico por fila. Cada resultado trae
+        el ranking de enfermedades con al menos una coincidencia y las que
+        empatan con la elegida.
+        """
+        observaciones = np.asarray(observaciones, dtype=np.int32).reshape(-1, len(self.base.sintomas))
+        # Síntomas presentes y esperados a la vez, para todas las enfermedades
+        puntajes = (observaciones != 0).astype(np.int32) @ self.base.matriz.T
+        # argsort estable sobre el negativo: mayor puntaje primero y, en empate, el orden del JSON
+        ordenes = np.argsort(-puntajes, axis=1, kind='stable')
+
+        resultados = []
+        for fila, orden in zip(puntajes, ordenes):
+            ranking = tuple(
+                (self.base.nombres[j], int(fila[j])) for j in orden if fila[j] > 0
+            )
+            if ranking:
+                resultados.append(self._resultado(ranking[0][0], ranking[0][1], ranking))
+            else:
+                # Sin coincidencias es probable que esté sano
+                resultados.append(self._resultado(NOMBRE_SANO, 0, ()))
+        return resultados
 
     def diagnosticar(self, sintomas_observados: list):
         """
-        Recibe una lista de 0s y 1s correspondiente a los síntomas 
+        Recibe una lista de 0s y 1s correspondiente a los síntomas
         y devuelve el mejor diagnóstico.
         """
-        mejor_enfermedad = "Sano / Estrés leve"
-        max_coincidencias = 0
-
-        for nombre, detalles in self.base_conocimiento['enfermedades'].items():
-            if 'sintomas' not in detalles:
-                continue
-
-            sintomas_enfermedad = detalles['sintomas']
-            coincidencias = sum(1 for obs, esp in zip(sintomas_observados, sintomas_enfermedad) if obs == 1 and esp == 1)
-
-            # Lógica simple: la enfermedad con más síntomas coincidentes gana
-            if coincidencias > max_coincidencias:
-                max_coincidencias = coincidencias
-                mejor_enfermedad = nombre
-        
-        # Si hay al menos una coincidencia, devuelve la enfermedad. Si no, es probable que esté sano.
-        if max_coincidencias > 0:
-            resultado = self.base_conocimiento['enfermedades'][mejor_enfermedad]
-            resultado['nombre'] = mejor_enfermedad
-            return resultado
-        else:
-            return self.base_conocimiento['enfermedades']["Sano / Estrés leve"]
\ No newline at end of file
+        return self.diagnosticar_varios([sintomas_observados])[0]
@@ -0,0 +1,103 @@
+# En produccion/ia/registro_modelos.py
+import hashlib
+import logging
+import os
+import threading
+import time
+import joblib
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+# ================================================================
+# REGISTRO DE MODELOS (UNO POR PROCESO / WORKER)
+# ================================================================
+# Cada artefacto joblib se carga una sola vez por proceso y se comparte
+# entre todas las peticiones. En cada acceso solo se consulta os.stat: si
+# cambió la fecha de modificación o el tamaño (p. ej. después de
+# `entrenar_modelo_diagnostico`) se vuelve a cargar en caliente.
+
+
+class ArtefactoCargado:
+    def __init__(self, objeto, firma, sha1, segundos_carga):
+        self.objeto = objeto
+        self.firma = firma
+        self.sha1 = sha1
+        self.segundos_carga = segundos_carga
+        self.cargado_en = timezone.now()
+
+
+def _firma(ruta):
+    # Lanza FileNotFoundError si el artefacto todavía no existe
+    stat = os.stat(ruta)
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+def _sha1(ruta):
+    digest = hashlib.sha1()
+    with open(ruta, 'rb') as archivo:
+        for bloque in iter(lambda: archivo.read(1 << 20), b''):
+            digest.update(bloque)
+    return digest.hexdigest()
+
+
+class RegistroModelos:
+
+    def __init__(self):
+        self._artefactos = {}
+        self._lock = threading.Lock()
+
+    def obtener(self, ruta, mmap_mode='r', cargador=None):
+        """
+        Devuelve el objeto guardado en `ruta`. Con `mmap_mode='r'` los arreglos
+        NumPy del archivo se abren como memoria mapeada de solo lectura, de modo
+        que los workers que cargan el mismo archivo comparten esas páginas.
+        Los archivos que no son joblib pasan un `cargador(ruta)` propio.
+        """
+        firma = _firma(ruta)
+        artefacto = self._artefactos.get(ruta)
+        if artefacto is not None and artefacto.firma == firma:
+            return artefacto.objeto
+
+        with self._lock:
+            artefacto = self._artefactos.get(ruta)
+            if artefacto is None or artefacto.firma != firma:
+                artefacto = self._cargar(ruta, firma, mmap_mode, cargador)
+        return artefacto.objeto
+
+    def _cargar(self, ruta, firma, mmap_mode, cargador):
+        inicio = time.perf_counter()
+        objeto = cargador(ruta) if cargador else joblib.load(ruta, mmap_mode=mmap_mode)
+        segundos = time.perf_counter() - inicio
+
+        anterior = self._artefactos.get(ruta)
+        artefacto = ArtefactoCargado(objeto, firma, _sha1(ruta), segundos)
+        self._artefactos[ruta] = artefacto
+        logger.info(
+            "%s %s en %.3f s (sha1 %s)",
+            "Recargado" if anterior else "Cargado", os.path.basename(ruta), segundos, artefacto.sha1[:12],
+        )
+        return artefacto
+
+    def precargar(self, rutas):
+        """Carga por adelantado (al iniciar el worker) los artefactos que existan."""
+        for ruta in rutas:
+            try:
+                self.obtener(ruta)
+            except FileNotFoundError:
+                logger.warning("No se encontró el artefacto %s; se cargará cuando exista", ruta)
+
+    def estado(self):
+        """Artefactos cargados en este proceso, con su versión y tiempo de carga."""
+        return [
+            {
+                'archivo': os.path.basename(ruta),
+                'sha1': artefacto.sha1,
+                'segundos_carga': round(artefacto.segundos_carga, 4),
+                'cargado_en': artefacto.cargado_en,
+            }
+            for ruta, artefacto in self._artefactos.items()
+        ]
+
+
+registro_modelos = RegistroModelos()
@@ -1,53 +1,67 @@
-import pandas as pd
-import joblib
-import os
-from django.conf import settings
-from django.core.management.base import BaseCommand
-from sklearn.model_selection import train_test_split
-from sklearn.ensemble import RandomForestClassifier
-from sklearn.metrics import accuracy_score
+from django.core.management.base import BaseCommand, CommandError
+from produccion.ia.diagnostico_service import RUTA_MODELO
+from produccion.ia.entrenamiento import ORIGEN_BD, ORIGEN_CSV, datos_desde_bd, datos_desde_csv, entrenar, publicar
+
 
 class Command(BaseCommand):
     help = 'Entrena y guarda el modelo de clasificación para diagnóstico de enfermedades'
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--origen', choices=[ORIGEN_CSV, ORIGEN_BD], default=ORIGEN_CSV,
+            help="csv: datos_diagnostico.csv; bd: condiciones del agua con diagnóstico confirmado",
+        )
+        parser.add_argument('--n-jobs', type=int, default=-1, help="Núcleos para entrenar y validar (-1 = todos)")
+        parser.add_argument('--pliegues', type=int, default=5, help="Pliegues de la validación cruzada")
+        parser.add_argument('--arboles', type=int, default=100, help="Árboles del RandomForest")
+        parser.add_argument('--forzar', action='store_true', help="Reentrena aunque ya exista la versión")
+        parser.add_argument('--no-publicar', action='store_true', help="Solo genera la versión, sin activarla")
+
     def handle(self, *args, **options):
         self.stdout.write("Iniciando entrenamiento del modelo de diagnóstico...")
 
-        # --- Rutas para guardar el modelo ---
-        MODEL_DIR = os.path.join(settings.BASE_DIR, 'produccion', 'ia', 'predictores')
-        MODEL_PATH = os.path.join(MODEL_DIR, 'diagnostico_model.joblib')
-        COLUMNS_PATH = os.path.join(MODEL_DIR, 'diagnostico_features.joblib')
-        os.makedirs(MODEL_DIR, exist_ok=True)
-
         # --- Cargar y preparar los datos ---
         try:
-            data_path = os.path.join(settings.BASE_DIR, 'produccion', 'ia', 'datos_entrenamiento', 'datos_diagnostico.csv')
-            df = pd.read_csv(data_path)
-        except FileNotFoundError:
-            self.stdout.write(self.style.ERROR(f"Error: No se encontró el archivo de datos en {data_path}"))
-            return
-
-        # --- Definir características (features) y objetivo (target) ---
-        # Todas las columnas excepto las de identificación y el diagnóstico final
-        features = df.drop(columns=['fecha', 'lote_id', 'diagnostico_final'])
-        target = df['diagnostico_final']
-
-        # Guardar los nombres de las columnas para usarlos en la predicción
-        joblib.dump(features.columns.tolist(), COLUMNS_PATH)
-        
-        # LÍNEA MODIFICADA
-        X_train, X_test, y_train, y_test = train_test_split(features, target, test_size=0.2, random_state=42)
-
-        # --- Entrenar el modelo RandomForest ---
-        self.stdout.write("Entrenando el modelo RandomForestClassifier...")
-        model = RandomForestClassifier(n_estimators=100, random_state=42, class_weight='balanced')
-        model.fit(X_train, y_train)
+            datos = datos_desde_bd() if options['origen'] == ORIGEN_BD else datos_desde_csv()
+        except FileNotFoundError as e:
+            raise CommandError(f"Error: No se encontró el archivo de datos ({e.filename})")
+        self.stdout.write(
+            f"{len(datos.y)} muestras ({datos.origen}, sha1 {datos.huella[:12]})"
+            + (" leídas de la caché" if datos.desde_cache else "")
+        )
+
+        # --- Entrenar (o reutilizar) la versión ---
+        try:
+            directorio, metricas, reutilizada = entrenar(
+                datos,
+                n_estimators=options['arboles'],
+                pliegues=options['pliegues'],
+                n_jobs=options['n_jobs'],
+                forzar=options['forzar'],
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        if reutilizada:
+            self.stdout.write(f"Los datos no cambiaron: se reutiliza la versión {metricas['version']}.")
+        else:
+            self.stdout.write(f"Versión {metricas['version']} entrenada en {metricas['segundos_entrenamiento']} s.")
 
         # --- Evaluar el modelo ---
-        y_pred = model.predict(X_test)
-        accuracy = accuracy_score(y_test, y_pred)
-        self.stdout.write(f"Precisión del modelo en datos de prueba: {accuracy*100:.2f}%")
+        self.stdout.write(f"Precisión del modelo en datos de prueba: {metricas['precision_prueba']*100:.2f}%")
+        validacion = metricas['validacion_cruzada']
+        if validacion:
+            self.stdout.write(
+                f"Validación cruzada ({validacion['pliegues']} pliegues): "
+                f"{validacion['media']*100:.2f}% ± {validacion['desviacion']*100:.2f}%"
+            )
+        else:
+            self.stdout.write("Validación cruzada omitida: alguna clase tiene menos de 2 muestras.")
 
-        # --- Guardar el modelo entrenado ---
-        joblib.dump(model, MODEL_PATH)
-        self.stdout.write(self.style.SUCCESS(f"¡Modelo de diagnóstico guardado exitosamente en {MODEL_PATH}!"))
\ No newline at end of file
+        # --- Publicar la versión para DiagnosticoService ---
+        if options['no_publicar']:
+            self.stdout.write(f"Versión guardada en {directorio} (sin publicar).")
+        elif publicar(directorio):
+            self.stdout.write(self.style.SUCCESS(f"¡Modelo de diagnóstico guardado exitosamente en {RUTA_MODELO}!"))
+        else:
+            self.stdout.write(self.style.SUCCESS("El modelo publicado ya es esta versión."))
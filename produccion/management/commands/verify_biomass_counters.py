@@ -0,0 +1,44 @@
+from decimal import Decimal
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import F, Sum
+from django.db.models.functions import Coalesce
+from produccion.models import Artesa, Jaula, actualizar_contadores_biomasa
+
+class Command(BaseCommand):
+    help = 'Compara los contadores de biomasa de artesas y jaulas con la suma real de sus lotes y corrige las diferencias'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Solo reporta las diferencias, sin corregirlas.')
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        descuadres = {'artesa': [], 'jaula': []}
+
+        for modelo, clave in ((Artesa, 'artesa'), (Jaula, 'jaula')):
+            # Una consulta por modelo: contador guardado vs. suma real de sus lotes
+            unidades = modelo.objects.annotate(
+                biomasa_real=Coalesce(Sum(F('lotes__cantidad_total_peces') * F('lotes__peso_promedio_pez_gr') * Decimal('0.001')), Decimal(0)),
+                peces_reales=Coalesce(Sum('lotes__cantidad_total_peces'), 0),
+            ).values_list('pk', 'codigo', 'biomasa_actual_kg', 'cantidad_peces_actual', 'biomasa_real', 'peces_reales')
+
+            for pk, codigo, biomasa, peces, biomasa_real, peces_reales in unidades:
+                biomasa_real = round(Decimal(biomasa_real), 2)
+                if biomasa != biomasa_real or peces != peces_reales:
+                    descuadres[clave].append(pk)
+                    self.stdout.write(
+                        f"{codigo}: biomasa {biomasa} kg (real {biomasa_real} kg), peces {peces} (real {peces_reales})"
+                    )
+
+        total = len(descuadres['artesa']) + len(descuadres['jaula'])
+        if not total:
+            self.stdout.write(self.style.SUCCESS("Todos los contadores de biomasa están cuadrados."))
+            return
+
+        if dry_run:
+            self.stdout.write(self.style.WARNING(f"{total} unidad(es) con descuadre. No se realizaron cambios (--dry-run)."))
+            return
+
+        with transaction.atomic():
+            actualizar_contadores_biomasa(artesa_ids=descuadres['artesa'], jaula_ids=descuadres['jaula'])
+        self.stdout.write(self.style.SUCCESS(f"{total} unidad(es) corregidas."))
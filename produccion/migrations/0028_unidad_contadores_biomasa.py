@@ -0,0 +1,50 @@
+# Generated by Django 5.2.18 on 2026-10-17 18:31
+
+from decimal import Decimal
+from django.db import migrations, models
+from django.db.models import F, OuterRef, Subquery, Sum, DecimalField, IntegerField
+from django.db.models.functions import Coalesce
+
+
+def inicializar_contadores(apps, schema_editor):
+    Lote = apps.get_model('produccion', 'Lote')
+    for nombre, campo in (('Artesa', 'artesa'), ('Jaula', 'jaula')):
+        modelo = apps.get_model('produccion', nombre)
+        lotes = Lote.objects.filter(**{campo: OuterRef('pk')}).order_by().values(campo)
+        biomasa = lotes.annotate(total=Sum(F('cantidad_total_peces') * F('peso_promedio_pez_gr') * Decimal('0.001'))).values('total')
+        peces = lotes.annotate(total=Sum('cantidad_total_peces')).values('total')
+        modelo.objects.update(
+            biomasa_actual_kg=Coalesce(Subquery(biomasa, output_field=DecimalField()), Decimal(0)),
+            cantidad_peces_actual=Coalesce(Subquery(peces, output_field=IntegerField()), 0),
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('produccion', '0027_registrocondiciones'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='artesa',
+            name='biomasa_actual_kg',
+            field=models.DecimalField(decimal_places=2, default=Decimal('0.00'), editable=False, max_digits=10, verbose_name='Biomasa Actual (kg)'),
+        ),
+        migrations.AddField(
+            model_name='artesa',
+            name='cantidad_peces_actual',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Peces Actuales'),
+        ),
+        migrations.AddField(
+            model_name='jaula',
+            name='biomasa_actual_kg',
+            field=models.DecimalField(decimal_places=2, default=Decimal('0.00'), editable=False, max_digits=10, verbose_name='Biomasa Actual (kg)'),
+        ),
+        migrations.AddField(
+            model_name='jaula',
+            name='cantidad_peces_actual',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Peces Actuales'),
+        ),
+        migrations.RunPython(inicializar_contadores, migrations.RunPython.noop),
+    ]
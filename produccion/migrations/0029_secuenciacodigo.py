@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-17 18:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('produccion', '0028_unidad_contadores_biomasa'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SecuenciaCodigo',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('prefijo', models.CharField(max_length=10)),
+                ('periodo', models.CharField(help_text='Año y mes en formato AAMM', max_length=4)),
+                ('ultimo_valor', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'unique_together': {('prefijo', 'periodo')},
+            },
+        ),
+    ]
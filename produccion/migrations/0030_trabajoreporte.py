@@ -0,0 +1,36 @@
+# Generated by Django 5.2.18 on 2026-10-17 18:44
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('produccion', '0029_secuenciacodigo'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TrabajoReporte',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo', models.CharField(choices=[('historial', 'Historial de Trazabilidad'), ('lotes', 'Reporte de Lotes'), ('resumen_logistica', 'Resumen de Inventario')], max_length=30)),
+                ('parametros', models.JSONField(blank=True, default=dict)),
+                ('formato', models.CharField(choices=[('xlsx', 'Excel'), ('csv', 'CSV')], default='xlsx', max_length=4)),
+                ('clave', models.CharField(db_index=True, editable=False, help_text='Hash de tipo, parámetros y formato', max_length=64)),
+                ('estado', models.CharField(choices=[('PENDIENTE', 'Pendiente'), ('PROCESANDO', 'Procesando'), ('COMPLETADO', 'Completado'), ('ERROR', 'Error')], default='PENDIENTE', max_length=10)),
+                ('archivo', models.FileField(blank=True, upload_to='reportes/%Y/%m/')),
+                ('nombre_descarga', models.CharField(blank=True, max_length=255)),
+                ('error', models.TextField(blank=True)),
+                ('fecha_creacion', models.DateTimeField(auto_now_add=True)),
+                ('fecha_finalizacion', models.DateTimeField(blank=True, null=True)),
+                ('usuario', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-fecha_creacion'],
+            },
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-17 19:02
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('produccion', '0030_trabajoreporte'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DiagnosticoLote',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateField(default=django.utils.timezone.now)),
+                ('diagnostico', models.CharField(blank=True, max_length=50)),
+                ('nivel_riesgo', models.CharField(choices=[('ALTO', 'Alto'), ('MEDIO', 'Medio'), ('BAJO', 'Bajo'), ('SIN_DATOS', 'Sin datos')], max_length=10)),
+                ('alertas', models.PositiveSmallIntegerField(default=0, help_text='Parámetros del agua fuera de rango')),
+                ('lote', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='diagnosticos', to='produccion.lote')),
+                ('registro_condiciones', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='diagnosticos', to='produccion.registrocondiciones')),
+            ],
+            options={
+                'ordering': ['-fecha'],
+                'unique_together': {('lote', 'fecha')},
+            },
+        ),
+    ]
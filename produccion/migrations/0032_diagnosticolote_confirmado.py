@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 19:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('produccion', '0031_diagnosticolote'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='diagnosticolote',
+            name='confirmado',
+            field=models.BooleanField(default=False, help_text='Diagnóstico verificado en el lote; se usa para reentrenar el modelo'),
+        ),
+    ]
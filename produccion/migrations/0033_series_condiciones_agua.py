@@ -0,0 +1,51 @@
+# Generated by Django 5.2.18 on 2026-10-17 19:11
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('produccion', '0032_diagnosticolote_confirmado'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LecturaSensor',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('object_id', models.PositiveIntegerField()),
+                ('momento', models.DateTimeField()),
+                ('temp_agua_c', models.FloatField(blank=True, null=True, verbose_name='Temperatura del Agua (°C)')),
+                ('ph', models.FloatField(blank=True, null=True, verbose_name='Nivel de pH')),
+                ('oxigeno_mg_l', models.FloatField(blank=True, null=True, verbose_name='Oxígeno Disuelto (mg/L)')),
+                ('amoniaco_mg_l', models.FloatField(blank=True, null=True, verbose_name='Amoníaco (mg/L)')),
+                ('content_type', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='contenttypes.contenttype')),
+            ],
+            options={
+                'ordering': ['momento'],
+                'unique_together': {('content_type', 'object_id', 'momento')},
+            },
+        ),
+        migrations.CreateModel(
+            name='ResumenCondiciones',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('object_id', models.PositiveIntegerField()),
+                ('variable', models.CharField(choices=[('temp_agua_c', 'Temperatura del Agua (°C)'), ('ph', 'Nivel de pH'), ('oxigeno_mg_l', 'Oxígeno Disuelto (mg/L)'), ('amoniaco_mg_l', 'Amoníaco (mg/L)')], max_length=15)),
+                ('granularidad', models.CharField(choices=[('HORA', 'Por hora'), ('DIA', 'Por día')], max_length=4)),
+                ('inicio', models.DateTimeField()),
+                ('minimo', models.FloatField()),
+                ('maximo', models.FloatField()),
+                ('suma', models.FloatField()),
+                ('conteo', models.PositiveIntegerField()),
+                ('content_type', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='contenttypes.contenttype')),
+            ],
+            options={
+                'ordering': ['inicio'],
+                'unique_together': {('content_type', 'object_id', 'variable', 'granularidad', 'inicio')},
+            },
+        ),
+    ]
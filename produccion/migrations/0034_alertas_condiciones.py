@@ -0,0 +1,64 @@
+# Generated by Django 5.2.18 on 2026-10-17 19:17
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+# Reglas iniciales; se ajustan desde el admin
+REGLAS_INICIALES = [
+    ('Oxígeno bajo', 'oxigeno_mg_l', 'MINIMO', 5.0, 60),
+    ('Amoníaco alto', 'amoniaco_mg_l', 'MAXIMO', 0.05, 60),
+    ('Pico de amoníaco', 'amoniaco_mg_l', 'SUBIDA', 0.02, 60),
+    ('Caída de temperatura', 'temp_agua_c', 'CAIDA', 2.0, 60),
+]
+
+
+def crear_reglas_iniciales(apps, schema_editor):
+    ReglaAlerta = apps.get_model('produccion', 'ReglaAlerta')
+    ReglaAlerta.objects.bulk_create([
+        ReglaAlerta(nombre=nombre, variable=variable, tipo=tipo, umbral=umbral, ventana_minutos=ventana)
+        for nombre, variable, tipo, umbral, ventana in REGLAS_INICIALES
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('produccion', '0033_series_condiciones_agua'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReglaAlerta',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nombre', models.CharField(max_length=100)),
+                ('variable', models.CharField(choices=[('temp_agua_c', 'Temperatura del Agua (°C)'), ('ph', 'Nivel de pH'), ('oxigeno_mg_l', 'Oxígeno Disuelto (mg/L)'), ('amoniaco_mg_l', 'Amoníaco (mg/L)')], max_length=15)),
+                ('tipo', models.CharField(choices=[('MINIMO', 'Por debajo del umbral'), ('MAXIMO', 'Por encima del umbral'), ('CAIDA', 'Caída mayor al umbral en la ventana'), ('SUBIDA', 'Subida mayor al umbral en la ventana')], max_length=6)),
+                ('umbral', models.FloatField()),
+                ('ventana_minutos', models.PositiveIntegerField(default=60, help_text='Solo para caídas y subidas')),
+                ('minutos_despeje', models.PositiveIntegerField(default=30, help_text='Minutos sin dispararse para dar el incidente por cerrado')),
+                ('activa', models.BooleanField(default=True)),
+            ],
+            options={
+                'ordering': ['nombre'],
+            },
+        ),
+        migrations.CreateModel(
+            name='AlertaCondiciones',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('inicio', models.DateTimeField()),
+                ('ultimo_disparo', models.DateTimeField()),
+                ('valor', models.FloatField(help_text='Lectura que abrió el incidente')),
+                ('fin', models.DateTimeField(blank=True, null=True)),
+                ('lote', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='alertas_condiciones', to='produccion.lote')),
+                ('regla', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='alertas', to='produccion.reglaalerta')),
+            ],
+            options={
+                'ordering': ['-inicio'],
+                'constraints': [models.UniqueConstraint(condition=models.Q(('fin__isnull', True)), fields=('regla', 'lote'), name='alerta_abierta_unica')],
+            },
+        ),
+        migrations.RunPython(crear_reglas_iniciales, migrations.RunPython.noop),
+    ]
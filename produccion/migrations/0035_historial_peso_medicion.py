@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 19:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('produccion', '0034_alertas_condiciones'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='historialmovimiento',
+            name='peso_promedio_gr',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=7, null=True),
+        ),
+    ]
@@ -1,13 +1,73 @@
-from django.db import models
-from django.db.models import Sum, F
-from django.db.models.functions import Coalesce
+from django.db import models, transaction, IntegrityError
+from django.db.models import Sum, F, Q, OuterRef, Subquery, DecimalField, IntegerField, CharField, FloatField, Value, Case, When, Func
+from django.db.models.functions import Cast, Coalesce, Round
 from django.conf import settings
+from django.core.files import File
 from django.utils import timezone
+from django.utils.module_loading import import_string
+from datetime import timedelta
+import hashlib
+import json
 import math
+import tempfile
 from decimal import Decimal
+from .exportacion import escribir_archivo
 from django.contrib.contenttypes.fields import GenericForeignKey
 from django.contrib.contenttypes.models import ContentType
 
+# ----------------------------------------------------------------
+# CONTADOR DE CORRELATIVOS PARA LOS CÓDIGOS
+# ----------------------------------------------------------------
+class SecuenciaCodigo(models.Model):
+    prefijo = models.CharField(max_length=10)
+    periodo = models.CharField(max_length=4, help_text="Año y mes en formato AAMM")
+    ultimo_valor = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('prefijo', 'periodo')
+
+    def __str__(self):
+        return f"{self.prefijo}{self.periodo}: {self.ultimo_valor}"
+
+    @classmethod
+    def reservar(cls, prefijo, periodo, cantidad=1, semilla=None):
+        """
+        Reserva `cantidad` correlativos consecutivos y devuelve el rango reservado.
+        El incremento es un UPDATE atómico sobre la fila del contador, que queda
+        bloqueada hasta el fin de la transacción: dos peticiones concurrentes nunca
+        reciben el mismo número, y si la transacción se revierte el número se libera.
+        `semilla` devuelve el último correlativo ya usado cuando se crea el contador.
+        """
+        filtro = cls.objects.filter(prefijo=prefijo, periodo=periodo)
+        with transaction.atomic():
+            if not filtro.update(ultimo_valor=F('ultimo_valor') + cantidad):
+                try:
+                    with transaction.atomic():
+                        cls.objects.create(prefijo=prefijo, periodo=periodo, ultimo_valor=(semilla() if semilla else 0) + cantidad)
+                except IntegrityError:
+                    # Otra petición creó el contador al mismo tiempo
+                    filtro.update(ultimo_valor=F('ultimo_valor') + cantidad)
+            ultimo = filtro.values_list('ultimo_valor', flat=True).get()
+        return range(ultimo - cantidad + 1, ultimo + 1)
+
+
+def generar_codigos(modelo, campo, prefijo, digitos, cantidad=1):
+    """
+    Devuelve `cantidad` códigos consecutivos con el formato '<prefijo><AAMM>-<correlativo>'.
+    Debe llamarse dentro de la transacción que guarda los objetos para que no queden huecos.
+    """
+    year_month = timezone.now().strftime('%y%m')
+    inicio = f'{prefijo}{year_month}'
+
+    def ultimo_existente():
+        # Solo se usa la primera vez que aparece el periodo, para continuar la numeración existente
+        codigos = modelo.objects.filter(**{f'{campo}__startswith': inicio}).values_list(campo, flat=True)
+        return max((int(codigo.split('-')[-1]) for codigo in codigos), default=0)
+
+    correlativos = SecuenciaCodigo.reservar(prefijo, year_month, cantidad, semilla=ultimo_existente)
+    return [f'{inicio}-{correlativo:0{digitos}d}' for correlativo in correlativos]
+
+
 # ----------------------------------------------------------------
 # MODELO PARA BASTIDORES (OVAS)
 # ----------------------------------------------------------------
@@ -20,14 +80,10 @@ class Bastidor(models.Model):
         return self.codigo
 
     def save(self, *args, **kwargs):
-        if not self.pk:
-            prefijo = 'B'
-            now = timezone.now()
-            year_month = now.strftime('%y%m')
-            ultimo = Bastidor.objects.filter(codigo__startswith=f'{prefijo}{year_month}').order_by('codigo').last()
-            correlativo = int(ultimo.codigo.split('-')[-1]) + 1 if ultimo else 1
-            self.codigo = f'{prefijo}{year_month}-{correlativo:02d}'
-        super().save(*args, **kwargs)
+        with transaction.atomic():
+            if not self.pk:
+                self.codigo = generar_codigos(Bastidor, 'codigo', 'B', 2)[0]
+            super().save(*args, **kwargs)
 
 
 # ----------------------------------------------------------------
@@ -50,9 +106,21 @@ class UnidadProduccionBiomasa(models.Model):
     densidad_siembra_kg_m3 = models.FloatField(default=10.0, verbose_name="Densidad de Siembra (kg/m³)")
     capacidad_maxima_kg = models.DecimalField(max_digits=10, decimal_places=2, default=0.00, editable=False, verbose_name="Capacidad Máxima de Biomasa (kg)")
 
+    # --- Contadores desnormalizados (los mantiene actualizar_contadores_biomasa) ---
+    biomasa_actual_kg = models.DecimalField(max_digits=10, decimal_places=2, default=Decimal('0.00'), editable=False, verbose_name="Biomasa Actual (kg)")
+    cantidad_peces_actual = models.PositiveIntegerField(default=0, editable=False, verbose_name="Peces Actuales")
+
     class Meta:
         abstract = True
 
+    @property
+    def biomasa_actual(self):
+        return round(self.biomasa_actual_kg, 2)
+
+    @property
+    def biomasa_disponible(self):
+        return self.capacidad_maxima_kg - self.biomasa_actual
+
     def _calcular_volumen(self):
         volumen = 0
         h = self.alto_m or 0
@@ -72,7 +140,8 @@ class UnidadProduccionBiomasa(models.Model):
         densidad = Decimal(self.densidad_siembra_kg_m3 or 0)
         return round(volumen * densidad, 2)
 
-    def save(self, *args, **kwargs):
+    def calcular_dimensiones(self):
+        """Calcula lado_m y capacidad_maxima_kg. Se llama también antes de un bulk_create."""
         if self.forma in ['HEXAGONAL', 'DECAGONAL'] and self.diametro_m:
             num_lados = 6 if self.forma == 'HEXAGONAL' else 10
             apotema = (self.diametro_m or 0) / 2
@@ -80,6 +149,9 @@ class UnidadProduccionBiomasa(models.Model):
         else:
             self.lado_m = None
         self.capacidad_maxima_kg = self._calcular_capacidad_biomasa()
+
+    def save(self, *args, **kwargs):
+        self.calcular_dimensiones()
         super().save(*args, **kwargs)
 
 
@@ -89,15 +161,6 @@ class UnidadProduccionBiomasa(models.Model):
 class Artesa(UnidadProduccionBiomasa):
     codigo = models.CharField(max_length=50, unique=True, blank=True, editable=False)
 
-    @property
-    def biomasa_actual(self):
-        total = self.lotes.aggregate(total_biomasa=Coalesce(Sum(F('cantidad_total_peces') * F('peso_promedio_pez_gr') / Decimal(1000.0)), Decimal(0.0)))['total_biomasa']
-        return round(total, 2)
-
-    @property
-    def biomasa_disponible(self):
-        return self.capacidad_maxima_kg - self.biomasa_actual
-
     @property
     def alimento_diario_total_kg(self):
         return round(sum(lote.alimento_diario_kg for lote in self.lotes.all()), 2)
@@ -106,29 +169,16 @@ class Artesa(UnidadProduccionBiomasa):
         return self.codigo
 
     def save(self, *args, **kwargs):
-        if not self.pk:
-            prefijo = 'A'
-            now = timezone.now()
-            year_month = now.strftime('%y%m')
-            ultimo = Artesa.objects.filter(codigo__startswith=f'{prefijo}{year_month}').order_by('codigo').last()
-            correlativo = int(ultimo.codigo.split('-')[-1]) + 1 if ultimo else 1
-            self.codigo = f'{prefijo}{year_month}-{correlativo:02d}'
-        super().save(*args, **kwargs)
+        with transaction.atomic():
+            if not self.pk:
+                self.codigo = generar_codigos(Artesa, 'codigo', 'A', 2)[0]
+            super().save(*args, **kwargs)
 
 class Jaula(UnidadProduccionBiomasa):
     TIPO_JAULA = (('JUVENIL', 'Juvenil'), ('ENGORDE', 'Engorde'))
     codigo = models.CharField(max_length=50, unique=True, blank=True, editable=False)
     tipo = models.CharField(max_length=10, choices=TIPO_JAULA, default='ENGORDE', verbose_name="Tipo de Jaula")
 
-    @property
-    def biomasa_actual(self):
-        total = self.lotes.aggregate(total_biomasa=Coalesce(Sum(F('cantidad_total_peces') * F('peso_promedio_pez_gr') / Decimal(1000.0)), Decimal(0.0)))['total_biomasa']
-        return round(total, 2)
-
-    @property
-    def biomasa_disponible(self):
-        return self.capacidad_maxima_kg - self.biomasa_actual
-    
     @property
     def alimento_diario_total_kg(self):
         return round(sum(lote.alimento_diario_kg for lote in self.lotes.all()), 2)
@@ -137,14 +187,106 @@ class Jaula(UnidadProduccionBiomasa):
         return f"{self.codigo} ({self.get_tipo_display()})"
     
     def save(self, *args, **kwargs):
-        if not self.pk:
-            prefijo = 'J'
-            now = timezone.now()
-            year_month = now.strftime('%y%m')
-            ultimo = Jaula.objects.filter(codigo__startswith=f'{prefijo}{year_month}').order_by('codigo').last()
-            correlativo = int(ultimo.codigo.split('-')[-1]) + 1 if ultimo else 1
-            self.codigo = f'{prefijo}{year_month}-{correlativo:02d}'
-        super().save(*args, **kwargs)
+        with transaction.atomic():
+            if not self.pk:
+                self.codigo = generar_codigos(Jaula, 'codigo', 'J', 2)[0]
+            super().save(*args, **kwargs)
+
+# ----------------------------------------------------------------
+# KPIs DE LOTE CALCULADOS EN LA BASE DE DATOS
+# ----------------------------------------------------------------
+class DiasTranscurridos(Func):
+    """Días enteros desde la fecha del campo hasta `hasta` (equivale a (hasta - fecha).days)."""
+    output_field = IntegerField()
+    template = '(%(expressions)s)'
+    arg_joiner = ' - '
+
+    def __init__(self, campo, hasta, **extra):
+        super().__init__(Value(hasta, output_field=models.DateField()), campo, **extra)
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        return self.as_sql(compiler, connection, template='CAST(julianday(%(expressions)s) AS INTEGER)', arg_joiner=') - julianday(', **extra_context)
+
+    def as_mysql(self, compiler, connection, **extra_context):
+        return self.as_sql(compiler, connection, function='DATEDIFF', template='%(function)s(%(expressions)s)', arg_joiner=', ', **extra_context)
+
+
+def _decimal(expresion):
+    return models.ExpressionWrapper(expresion, output_field=DecimalField())
+
+
+class LoteQuerySet(models.QuerySet):
+    def with_kpis(self, hoy=None):
+        """
+        Anota en una sola consulta los mismos indicadores que calculan las propiedades
+        de Lote (biomasa, ración, alimento diario, tipo de alimento, ganancia de peso,
+        FCR) más el total de bajas y el % de mortalidad. Los nombres llevan el prefijo
+        `kpi_` para no chocar con las propiedades.
+        """
+        hoy = hoy or timezone.now().date()
+        cero = Value(Decimal(0), output_field=DecimalField())
+        sin_peso = Q(peso_promedio_pez_gr__isnull=True) | Q(peso_promedio_pez_gr=0)
+        sin_talla = Q(talla_max_cm__isnull=True) | Q(talla_max_cm=0)
+
+        bajas = RegistroMortalidad.objects.filter(lote=OuterRef('pk')).order_by().values('lote').annotate(total=Sum('cantidad')).values('total')
+
+        return self.annotate(
+            kpi_biomasa_kg=Case(
+                When(sin_peso | Q(cantidad_total_peces=0), then=cero),
+                default=_decimal(F('cantidad_total_peces') * F('peso_promedio_pez_gr') * Decimal('0.001')),
+                output_field=DecimalField(),
+            ),
+            # Misma tabla que Lote.racion_alimentaria_porcentaje (basada en peso)
+            kpi_racion_porcentaje=Case(
+                When(sin_talla | sin_peso, then=cero),
+                When(peso_promedio_pez_gr__lte=20, then=Value(Decimal('2.8'))),
+                When(peso_promedio_pez_gr__lte=50, then=Value(Decimal('2.5'))),
+                When(peso_promedio_pez_gr__lte=100, then=Value(Decimal('2.2'))),
+                When(peso_promedio_pez_gr__lte=150, then=Value(Decimal('1.9'))),
+                When(peso_promedio_pez_gr__lte=250, then=Value(Decimal('1.5'))),
+                default=Value(Decimal('1.2')),
+                output_field=DecimalField(),
+            ),
+            kpi_alimento_diario_kg=Round(_decimal(F('kpi_biomasa_kg') * F('kpi_racion_porcentaje') * Decimal('0.01')), 2, output_field=DecimalField()),
+            # Misma tabla que Lote.tipo_alimento (basada en talla)
+            kpi_tipo_alimento=Case(
+                When(sin_talla, then=Value('Alevines 1')),
+                When(talla_max_cm__lte=8, then=Value('Alevines 1')),
+                When(talla_max_cm__lte=10, then=Value('Alevines 2')),
+                When(talla_max_cm__lte=15, then=Value('Crecimiento 1')),
+                When(talla_max_cm__lte=20, then=Value('Crecimiento 2')),
+                default=Value('Engorde'),
+                output_field=CharField(),
+            ),
+            kpi_ganancia_peso_gr=Case(
+                When(sin_peso, then=cero),
+                default=_decimal(F('peso_promedio_pez_gr') - F('peso_promedio_inicial_gr')),
+                output_field=DecimalField(),
+            ),
+            kpi_dias_en_etapa=DiasTranscurridos('fecha_ingreso_etapa', hoy),
+            kpi_biomasa_ganada_kg=_decimal(F('kpi_ganancia_peso_gr') * F('cantidad_total_peces') * Decimal('0.001')),
+            kpi_conversion_alimenticia=Case(
+                When(
+                    Q(kpi_dias_en_etapa__gt=0, kpi_biomasa_ganada_kg__gt=0, kpi_alimento_diario_kg__gt=0),
+                    then=Round(_decimal(F('kpi_alimento_diario_kg') * F('kpi_dias_en_etapa') / F('kpi_biomasa_ganada_kg')), 2, output_field=DecimalField()),
+                ),
+                default=cero,
+                output_field=DecimalField(),
+            ),
+            kpi_peces_muertos=Coalesce(Subquery(bajas, output_field=IntegerField()), 0),
+            kpi_porcentaje_mortalidad=Case(
+                When(
+                    Q(cantidad_total_peces__gt=0) | Q(kpi_peces_muertos__gt=0),
+                    then=Cast(Round(models.ExpressionWrapper(
+                        Cast('kpi_peces_muertos', FloatField()) * 100.0 / (F('cantidad_total_peces') + F('kpi_peces_muertos')),
+                        output_field=FloatField(),
+                    ), 2), DecimalField(max_digits=5, decimal_places=2)),
+                ),
+                default=cero,
+                output_field=DecimalField(),
+            ),
+        )
+
 
 # ----------------------------------------------------------------
 # MODELO DE LOTE (CON LÓGICA DE ALIMENTO CORREGIDA)
@@ -171,6 +313,8 @@ class Lote(models.Model):
     fecha_ingreso_etapa = models.DateField(default=timezone.now)
     activo = models.BooleanField(default=True, help_text="Indica si el lote está activo o ha sido finalizado/cerrado")
 
+    objects = LoteQuerySet.as_manager()
+
     @property
     def tipo_alimento(self):
         """Determina el tipo de alimento recomendado según la talla."""
@@ -239,21 +383,44 @@ class Lote(models.Model):
         
     def __str__(self):
         return self.codigo_lote
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Guardamos la ubicación con la que se leyó el lote para saber qué
+        # unidades hay que recalcular si se mueve (ver produccion/signals.py)
+        instance._unidades_originales = tuple(instance.__dict__.get(campo) for campo in ('bastidor_id', 'artesa_id', 'jaula_id'))
+        return instance
         
     def save(self, *args, **kwargs):
         is_new = self.pk is None
         if is_new:
             self.cantidad_inicial = self.cantidad_total_peces
             self.peso_promedio_inicial_gr = self.peso_promedio_pez_gr or Decimal('0.00')
-            if not self.codigo_lote:
-                prefijo = 'L'
-                now = timezone.now()
-                year_month = now.strftime('%y%m')
-                ultimo = Lote.objects.filter(codigo_lote__startswith=f'{prefijo}{year_month}').order_by('codigo_lote').last()
-                correlativo = int(ultimo.codigo_lote.split('-')[-1]) + 1 if ultimo else 1
-                self.codigo_lote = f'{prefijo}{year_month}-{correlativo:03d}'
-        
-        super().save(*args, **kwargs)
+
+        with transaction.atomic():
+            if is_new and not self.codigo_lote:
+                self.codigo_lote = generar_codigos(Lote, 'codigo_lote', 'L', 3)[0]
+            super().save(*args, **kwargs)
+
+
+def actualizar_contadores_biomasa(artesa_ids=(), jaula_ids=()):
+    """
+    Recalcula biomasa_actual_kg y cantidad_peces_actual de las unidades indicadas
+    a partir de sus lotes. Es un UPDATE por modelo, así que debe llamarse dentro
+    de la misma transacción que modificó los lotes.
+    """
+    for modelo, campo, ids in ((Artesa, 'artesa', artesa_ids), (Jaula, 'jaula', jaula_ids)):
+        ids = {pk for pk in ids if pk}
+        if not ids:
+            continue
+        lotes = Lote.objects.filter(**{campo: OuterRef('pk')}).order_by().values(campo)
+        biomasa = lotes.annotate(total=Sum(F('cantidad_total_peces') * F('peso_promedio_pez_gr') * Decimal('0.001'))).values('total')
+        peces = lotes.annotate(total=Sum('cantidad_total_peces')).values('total')
+        modelo.objects.filter(pk__in=ids).update(
+            biomasa_actual_kg=Coalesce(Subquery(biomasa, output_field=DecimalField()), Decimal(0)),
+            cantidad_peces_actual=Coalesce(Subquery(peces, output_field=IntegerField()), 0),
+        )
 
 
 # ----------------------------------------------------------------
@@ -294,6 +461,8 @@ class HistorialMovimiento(models.Model):
     tipo_movimiento = models.CharField(max_length=20, choices=TIPO_MOVIMIENTO)
     descripcion = models.CharField(max_length=255)
     cantidad_afectada = models.IntegerField(null=True, blank=True)
+    # Peso promedio medido; lo usa el pronóstico de crecimiento (produccion/crecimiento.py)
+    peso_promedio_gr = models.DecimalField(max_digits=7, decimal_places=2, null=True, blank=True)
     
     # Puedes añadir más detalles si quieres
     # unidad_origen = models.CharField(max_length=50, blank=True)
@@ -354,4 +523,255 @@ class RegistroCondiciones(models.Model):
         ordering = ['-fecha']
 
     def __str__(self):
-        return f"Condiciones de {self.lote.codigo_lote} en {self.fecha}"
\ No newline at end of file
+        return f"Condiciones de {self.lote.codigo_lote} en {self.fecha}"
+
+
+class DiagnosticoLote(models.Model):
+    """
+    Resultado del diagnóstico masivo de lotes (ver produccion/ia/diagnostico_lotes.py).
+    La tarea programada guarda una fila por lote y día. Las filas confirmadas
+    (corregidas en el admin si hace falta) son datos de entrenamiento del
+    modelo y la tarea ya no las sobrescribe.
+    """
+    NIVELES_RIESGO = (
+        ('ALTO', 'Alto'),
+        ('MEDIO', 'Medio'),
+        ('BAJO', 'Bajo'),
+        ('SIN_DATOS', 'Sin datos'),
+    )
+
+    lote = models.ForeignKey(Lote, on_delete=models.CASCADE, related_name='diagnosticos')
+    fecha = models.DateField(default=timezone.now)
+    registro_condiciones = models.ForeignKey(RegistroCondiciones, on_delete=models.SET_NULL, null=True, blank=True, related_name='diagnosticos')
+    diagnostico = models.CharField(max_length=50, blank=True)
+    nivel_riesgo = models.CharField(max_length=10, choices=NIVELES_RIESGO)
+    alertas = models.PositiveSmallIntegerField(default=0, help_text="Parámetros del agua fuera de rango")
+    confirmado = models.BooleanField(default=False, help_text="Diagnóstico verificado en el lote; se usa para reentrenar el modelo")
+
+    class Meta:
+        unique_together = ('lote', 'fecha')
+        ordering = ['-fecha']
+
+    def __str__(self):
+        return f"{self.lote.codigo_lote} {self.fecha}: {self.diagnostico or self.get_nivel_riesgo_display()}"
+
+# ----------------------------------------------------------------
+# SERIES DE TIEMPO DE LAS CONDICIONES DEL AGUA (SENSORES)
+# ----------------------------------------------------------------
+# RegistroCondiciones guarda una medición manual por lote y día; los
+# sensores de cada unidad envían lecturas cada pocos minutos y van aquí.
+# La lógica de ingestión y consulta está en produccion/condiciones_agua.py.
+
+class LecturaSensor(models.Model):
+    """Lectura cruda de los sensores de una unidad (bastidor, artesa o jaula)."""
+    content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE)
+    object_id = models.PositiveIntegerField()
+    unidad = GenericForeignKey('content_type', 'object_id')
+    momento = models.DateTimeField()
+    # Float y no Decimal: son muchas filas y solo se agregan (min/max/promedio)
+    temp_agua_c = models.FloatField(null=True, blank=True, verbose_name="Temperatura del Agua (°C)")
+    ph = models.FloatField(null=True, blank=True, verbose_name="Nivel de pH")
+    oxigeno_mg_l = models.FloatField(null=True, blank=True, verbose_name="Oxígeno Disuelto (mg/L)")
+    amoniaco_mg_l = models.FloatField(null=True, blank=True, verbose_name="Amoníaco (mg/L)")
+
+    class Meta:
+        # Una lectura por unidad y momento: reenviar el mismo lote de lecturas no duplica datos
+        unique_together = ('content_type', 'object_id', 'momento')
+        ordering = ['momento']
+
+    def __str__(self):
+        return f"Lectura de {self.unidad} en {self.momento}"
+
+
+class ResumenCondiciones(models.Model):
+    """
+    Mínimo, máximo, suma y cantidad de lecturas de una variable por unidad
+    en cada hora o día. Se guarda la suma y no el promedio para poder
+    combinar resúmenes (las horas forman el día) sin perder exactitud.
+    """
+    VARIABLES = (
+        ('temp_agua_c', 'Temperatura del Agua (°C)'),
+        ('ph', 'Nivel de pH'),
+        ('oxigeno_mg_l', 'Oxígeno Disuelto (mg/L)'),
+        ('amoniaco_mg_l', 'Amoníaco (mg/L)'),
+    )
+    GRANULARIDADES = (
+        ('HORA', 'Por hora'),
+        ('DIA', 'Por día'),
+    )
+
+    content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE)
+    object_id = models.PositiveIntegerField()
+    unidad = GenericForeignKey('content_type', 'object_id')
+    variable = models.CharField(max_length=15, choices=VARIABLES)
+    granularidad = models.CharField(max_length=4, choices=GRANULARIDADES)
+    inicio = models.DateTimeField()
+    minimo = models.FloatField()
+    maximo = models.FloatField()
+    suma = models.FloatField()
+    conteo = models.PositiveIntegerField()
+
+    class Meta:
+        unique_together = ('content_type', 'object_id', 'variable', 'granularidad', 'inicio')
+        ordering = ['inicio']
+
+    def __str__(self):
+        return f"{self.get_variable_display()} de {self.unidad} ({self.get_granularidad_display()}) {self.inicio}"
+
+    @property
+    def promedio(self):
+        return self.suma / self.conteo if self.conteo else None
+
+
+class ReglaAlerta(models.Model):
+    """
+    Regla de alerta sobre las condiciones del agua, editable desde el admin.
+    MINIMO/MAXIMO comparan cada lectura con el umbral; CAIDA/SUBIDA comparan
+    con el máximo/mínimo de los `ventana_minutos` anteriores. El motor está
+    en produccion/alertas.py.
+    """
+    TIPOS = (
+        ('MINIMO', 'Por debajo del umbral'),
+        ('MAXIMO', 'Por encima del umbral'),
+        ('CAIDA', 'Caída mayor al umbral en la ventana'),
+        ('SUBIDA', 'Subida mayor al umbral en la ventana'),
+    )
+
+    nombre = models.CharField(max_length=100)
+    variable = models.CharField(max_length=15, choices=ResumenCondiciones.VARIABLES)
+    tipo = models.CharField(max_length=6, choices=TIPOS)
+    umbral = models.FloatField()
+    ventana_minutos = models.PositiveIntegerField(default=60, help_text="Solo para caídas y subidas")
+    minutos_despeje = models.PositiveIntegerField(
+        default=30, help_text="Minutos sin dispararse para dar el incidente por cerrado"
+    )
+    activa = models.BooleanField(default=True)
+
+    class Meta:
+        ordering = ['nombre']
+
+    def __str__(self):
+        return self.nombre
+
+
+class AlertaCondiciones(models.Model):
+    """
+    Incidente de una regla en un lote: se abre con la primera lectura que la
+    dispara y se cierra cuando pasa `minutos_despeje` sin dispararse. Mientras
+    está abierto, las nuevas lecturas fuera de rango no generan otra alerta.
+    """
+    regla = models.ForeignKey(ReglaAlerta, on_delete=models.CASCADE, related_name='alertas')
+    lote = models.ForeignKey(Lote, on_delete=models.CASCADE, related_name='alertas_condiciones')
+    inicio = models.DateTimeField()
+    ultimo_disparo = models.DateTimeField()
+    valor = models.FloatField(help_text="Lectura que abrió el incidente")
+    fin = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-inicio']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['regla', 'lote'], condition=Q(fin__isnull=True), name='alerta_abierta_unica'
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.regla} en {self.lote.codigo_lote} desde {self.inicio}"
+
+    @property
+    def abierta(self):
+        return self.fin is None
+
+
+# ----------------------------------------------------------------
+# REPORTES GENERADOS EN SEGUNDO PLANO
+# ----------------------------------------------------------------
+class TrabajoReporte(models.Model):
+    """
+    Exportación que genera una tarea de Celery y queda guardada en disco.
+    Las solicitudes con los mismos parámetros reutilizan el mismo trabajo
+    mientras esté vigente (REPORTES_CACHE_MINUTOS).
+    """
+    TIPOS = (
+        ('historial', 'Historial de Trazabilidad'),
+        ('lotes', 'Reporte de Lotes'),
+        ('resumen_logistica', 'Resumen de Inventario'),
+    )
+    # Función que arma cada reporte: recibe los parámetros y devuelve
+    # nombre_archivo, titulo, encabezados y filas (iterable perezoso)
+    GENERADORES = {
+        'historial': 'produccion.reportes.reporte_historial',
+        'lotes': 'produccion.reportes.reporte_lotes',
+        'resumen_logistica': 'logistica.reportes.reporte_resumen',
+    }
+    ESTADOS = (
+        ('PENDIENTE', 'Pendiente'),
+        ('PROCESANDO', 'Procesando'),
+        ('COMPLETADO', 'Completado'),
+        ('ERROR', 'Error'),
+    )
+    FORMATOS = (('xlsx', 'Excel'), ('csv', 'CSV'))
+
+    tipo = models.CharField(max_length=30, choices=TIPOS)
+    parametros = models.JSONField(default=dict, blank=True)
+    formato = models.CharField(max_length=4, choices=FORMATOS, default='xlsx')
+    clave = models.CharField(max_length=64, db_index=True, editable=False, help_text="Hash de tipo, parámetros y formato")
+    estado = models.CharField(max_length=10, choices=ESTADOS, default='PENDIENTE')
+    archivo = models.FileField(upload_to='reportes/%Y/%m/', blank=True)
+    nombre_descarga = models.CharField(max_length=255, blank=True)
+    error = models.TextField(blank=True)
+    usuario = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True)
+    fecha_creacion = models.DateTimeField(auto_now_add=True)
+    fecha_finalizacion = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-fecha_creacion']
+
+    def __str__(self):
+        return f"{self.get_tipo_display()} ({self.formato}) - {self.get_estado_display()}"
+
+    @staticmethod
+    def calcular_clave(tipo, parametros, formato):
+        contenido = json.dumps([tipo, parametros, formato], sort_keys=True, default=str)
+        return hashlib.sha256(contenido.encode()).hexdigest()
+
+    @property
+    def archivo_disponible(self):
+        return bool(self.archivo) and self.archivo.storage.exists(self.archivo.name)
+
+    @classmethod
+    def obtener_o_crear(cls, tipo, parametros, formato='xlsx', usuario=None):
+        """
+        Devuelve (trabajo, creado). Si el mismo usuario tiene un trabajo vigente
+        con los mismos parámetros (en curso, o terminado con su archivo en disco)
+        se reutiliza; cada usuario solo puede ver y descargar sus reportes.
+        """
+        clave = cls.calcular_clave(tipo, parametros, formato)
+        vigencia = timezone.now() - timedelta(minutes=settings.REPORTES_CACHE_MINUTOS)
+        existente = cls.objects.filter(
+            clave=clave, usuario=usuario, fecha_creacion__gte=vigencia
+        ).exclude(estado='ERROR').first()
+        if existente and (existente.estado != 'COMPLETADO' or existente.archivo_disponible):
+            return existente, False
+
+        trabajo = cls.objects.create(tipo=tipo, parametros=parametros, formato=formato, clave=clave, usuario=usuario)
+        return trabajo, True
+
+    def generar(self):
+        """Arma el reporte y lo guarda en `archivo`. Los errores quedan registrados en el trabajo."""
+        self.estado = 'PROCESANDO'
+        self.save(update_fields=['estado'])
+        try:
+            reporte = import_string(self.GENERADORES[self.tipo])(self.parametros)
+            with tempfile.TemporaryFile() as temporal:
+                escribir_archivo(temporal, self.formato, reporte['titulo'], reporte['encabezados'], reporte['filas'])
+                temporal.seek(0)
+                self.nombre_descarga = f"{reporte['nombre_archivo']}.{self.formato}"
+                self.archivo.save(f"{reporte['nombre_archivo']}_{self.pk}.{self.formato}", File(temporal), save=False)
+            self.estado = 'COMPLETADO'
+            self.error = ''
+        except Exception as e:
+            self.estado = 'ERROR'
+            self.error = str(e)
+        self.fecha_finalizacion = timezone.now()
+        self.save()
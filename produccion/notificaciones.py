@@ -0,0 +1,176 @@
+import hashlib
+import json
+from datetime import timedelta
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import F, Q
+from django.urls import reverse
+from django.utils import timezone
+from .eventos import publicar_evento
+from .models import AlertaCondiciones, Lote
+from usuarios.roles import grupos_usuario
+
+try:
+    from logistica.models import Insumo
+except ImportError:
+    Insumo = None
+
+# ================================================================
+# FEED DE NOTIFICACIONES EN CACHÉ
+# ================================================================
+# Cada sección se calcula una sola vez y queda en caché hasta que una señal
+# la invalida (cambios en Lote, en el stock de Insumo o en las alertas del
+# agua). La clave incluye la fecha porque la alerta de ovas depende de los
+# días transcurridos.
+
+SECCION_ALERTAS = 'alertas'
+SECCION_PRODUCCION = 'produccion'
+SECCION_COMERCIALIZACION = 'comercializacion'
+SECCION_LOGISTICA = 'logistica'
+
+# Secciones que ve cada grupo (el staff las ve todas)
+SECCIONES_POR_GRUPO = {
+    'Produccion': [SECCION_ALERTAS, SECCION_PRODUCCION, SECCION_COMERCIALIZACION],
+    'Comercializacion': [SECCION_COMERCIALIZACION],
+    'Logistica': [SECCION_LOGISTICA],
+}
+ORDEN_SECCIONES = [SECCION_ALERTAS, SECCION_PRODUCCION, SECCION_COMERCIALIZACION, SECCION_LOGISTICA]
+
+
+def _clave(seccion):
+    return f"notificaciones:{seccion}:{timezone.localdate().isoformat()}"
+
+
+def secciones_visibles(user):
+    if user.is_staff:
+        secciones = set(ORDEN_SECCIONES)
+    else:
+        secciones = set()
+        for grupo in grupos_usuario(user):
+            secciones.update(SECCIONES_POR_GRUPO.get(grupo, []))
+    if Insumo is None:
+        secciones.discard(SECCION_LOGISTICA)
+    return [seccion for seccion in ORDEN_SECCIONES if seccion in secciones]
+
+
+def _notificaciones_lotes():
+    """Alertas de producción y comercialización con una sola consulta de Lote."""
+    hoy = timezone.localdate()
+    lotes = Lote.objects.filter(
+        Q(etapa_actual='OVAS', fecha_ingreso_etapa__lte=hoy - timedelta(days=15))
+        | Q(etapa_actual='ALEVINES', talla_max_cm__gte=8)
+        | Q(etapa_actual='JUVENILES', talla_max_cm__gte=15)
+        | Q(etapa_actual='ENGORDE', talla_max_cm__gte=25)
+    ).select_related('bastidor', 'artesa', 'jaula').order_by('pk')
+
+    # Se agrupa por etapa para mantener el orden de siempre en el menú
+    por_etapa = {'OVAS': [], 'ALEVINES': [], 'JUVENILES': [], 'ENGORDE': []}
+    for lote in lotes:
+        por_etapa[lote.etapa_actual].append(lote)
+
+    produccion = [
+        {
+            'area': 'Producción',
+            'message': f"El lote {lote.codigo_lote} en {lote.bastidor} debe ser movido a artesa.",
+            'url': reverse('bastidor-list')
+        }
+        for lote in por_etapa['OVAS']
+    ] + [
+        {
+            'area': 'Producción',
+            'message': f"El lote {lote.codigo_lote} en {lote.artesa} está listo para mover a jaula de juveniles.",
+            'url': reverse('artesa-list')
+        }
+        for lote in por_etapa['ALEVINES']
+    ] + [
+        {
+            'area': 'Producción',
+            'message': f"El lote {lote.codigo_lote} en {lote.jaula} está listo para mover a jaula de engorde.",
+            'url': reverse('juvenil-list')
+        }
+        for lote in por_etapa['JUVENILES']
+    ]
+    comercializacion = [
+        {
+            'area': 'Comercialización',
+            'message': f"El lote {lote.codigo_lote} en {lote.jaula} está listo para la venta.",
+            'url': reverse('engorde-list')
+        }
+        for lote in por_etapa['ENGORDE']
+    ]
+    return {SECCION_PRODUCCION: produccion, SECCION_COMERCIALIZACION: comercializacion}
+
+
+def _notificaciones_alertas():
+    # Incidentes abiertos del motor de alertas (produccion/alertas.py)
+    alertas = AlertaCondiciones.objects.filter(fin__isnull=True).select_related('regla', 'lote').order_by('-inicio')
+    return {SECCION_ALERTAS: [
+        {
+            'area': 'Calidad del agua',
+            'message': (
+                f"{alerta.regla.nombre} en el lote {alerta.lote.codigo_lote}: "
+                f"{alerta.regla.get_variable_display()} {alerta.valor:g} "
+                f"desde {timezone.localtime(alerta.inicio):%d/%m %H:%M}"
+            ),
+            'url': reverse('riesgo-sanitario')
+        }
+        for alerta in alertas
+    ]}
+
+
+def _notificaciones_logistica():
+    # Insumos con stock por debajo del mínimo (F compara dos campos del modelo)
+    return {SECCION_LOGISTICA: [
+        {
+            'area': 'Logística',
+            'message': f"¡Stock bajo! {insumo.nombre} (Actual: {insumo.stock_actual})",
+            'url': reverse('inventario-list')
+        }
+        for insumo in Insumo.objects.filter(stock_actual__lt=F('stock_minimo')).order_by('pk')
+    ]}
+
+
+def _entrada_cache(notificaciones):
+    contenido = json.dumps(notificaciones, sort_keys=True, default=str)
+    return {'notificaciones': notificaciones, 'huella': hashlib.sha1(contenido.encode()).hexdigest()}
+
+
+def obtener_notificaciones(secciones):
+    """
+    Devuelve (notificaciones, etag) para las secciones pedidas. Las que no
+    están en caché se calculan y se guardan; el ETag cambia solo si cambia
+    el contenido de alguna sección.
+    """
+    claves = {seccion: _clave(seccion) for seccion in secciones}
+    entradas = cache.get_many(claves.values())
+
+    faltantes = [seccion for seccion in secciones if claves[seccion] not in entradas]
+    calculadas = {}
+    if SECCION_PRODUCCION in faltantes or SECCION_COMERCIALIZACION in faltantes:
+        calculadas.update(_notificaciones_lotes())
+    if SECCION_ALERTAS in faltantes:
+        calculadas.update(_notificaciones_alertas())
+    if SECCION_LOGISTICA in faltantes:
+        calculadas.update(_notificaciones_logistica())
+
+    nuevas = {claves[seccion]: _entrada_cache(calculadas[seccion]) for seccion in faltantes}
+    if nuevas:
+        cache.set_many(nuevas, settings.NOTIFICACIONES_CACHE_SEGUNDOS)
+        entradas.update(nuevas)
+
+    notificaciones, huellas = [], []
+    for seccion in secciones:
+        entrada = entradas[claves[seccion]]
+        notificaciones.extend(entrada['notificaciones'])
+        huellas.append(f"{seccion}:{entrada['huella']}")
+    etag = hashlib.sha1("|".join(huellas).encode()).hexdigest()
+    return notificaciones, etag
+
+
+def invalidar_notificaciones(*secciones):
+    """
+    Descarta las secciones indicadas; se recalculan en la siguiente consulta.
+    Las conexiones del canal de eventos reciben el aviso y reenvían el feed.
+    """
+    cache.delete_many([_clave(seccion) for seccion in secciones])
+    publicar_evento('notificaciones', {'secciones': list(secciones)})
@@ -0,0 +1,122 @@
+from django.http import FileResponse
+from django.shortcuts import redirect
+from django.utils import timezone
+from kombu.exceptions import OperationalError
+from .exportacion import iterar_en_bloques
+from .models import HistorialMovimiento, Lote, TrabajoReporte
+from .tasks import generar_reporte
+
+
+# ================================================================
+# DEFINICIÓN DE REPORTES (ver TrabajoReporte.GENERADORES)
+# ================================================================
+
+def reporte_historial(parametros):
+    queryset = HistorialMovimiento.objects.select_related('lote')
+    if parametros.get('year'):
+        queryset = queryset.filter(fecha__year=parametros['year'])
+    if parametros.get('month'):
+        queryset = queryset.filter(fecha__month=parametros['month'])
+
+    def filas():
+        for item in iterar_en_bloques(queryset):
+            yield [
+                # La fecha se pasa a "naive" (sin zona horaria): Excel no admite tz
+                timezone.make_naive(item.fecha),
+                item.lote.codigo_lote,
+                item.get_tipo_movimiento_display(),
+                item.descripcion,
+                item.cantidad_afectada
+            ]
+
+    return {
+        'nombre_archivo': "historial_trazabilidad",
+        'titulo': "Historial de Trazabilidad",
+        'encabezados': ["Fecha", "Lote", "Tipo de Movimiento", "Descripción", "Cantidad Afectada"],
+        'filas': filas(),
+    }
+
+
+def reporte_lotes(parametros):
+    # Filtramos los lotes activos que no sean ovas
+    lotes = Lote.objects.filter(etapa_actual__in=['ALEVINES', 'JUVENILES', 'ENGORDE']).with_kpis()
+    if parametros.get('year'):
+        lotes = lotes.filter(fecha_ingreso_etapa__year=parametros['year'])
+    if parametros.get('month'):
+        lotes = lotes.filter(fecha_ingreso_etapa__month=parametros['month'])
+
+    def filas():
+        for lote in iterar_en_bloques(lotes):
+            # Todos los KPIs (incluida la mortalidad) vienen de with_kpis()
+            biomasa_kg = float(lote.kpi_biomasa_kg)
+            peso_unitario_gr = float(lote.peso_promedio_pez_gr or 0)
+            promedio_gr_kg = (peso_unitario_gr * 1000) / biomasa_kg if biomasa_kg > 0 else 0
+
+            yield [
+                lote.codigo_lote,
+                lote.get_etapa_actual_display(),
+                lote.fecha_ingreso_etapa,
+                biomasa_kg,
+                round(promedio_gr_kg, 2),
+                peso_unitario_gr,
+                float(lote.talla_max_cm or 0),
+                lote.cantidad_total_peces,
+                float(lote.kpi_racion_porcentaje),
+                float(lote.kpi_alimento_diario_kg),
+                float(lote.kpi_conversion_alimenticia),
+                float(lote.kpi_ganancia_peso_gr),
+                float(lote.kpi_porcentaje_mortalidad),
+                lote.kpi_peces_muertos,
+                lote.kpi_tipo_alimento,
+            ]
+
+    return {
+        'nombre_archivo': "reporte_lotes",
+        'titulo': "Reporte de Lotes",
+        'encabezados': [
+            "LOTE", "ETAPA", "FECHA", "BIOMASA (Kg)", "PROMEDIO (gr/Kg)", "PESO UNITARIO (Gr)", "TALLA UNITARIA (Cm)",
+            "NUMERO TOTAL DE PECES", "% DE RAC. ALI", "CONSUMO ALIMENTO (Kg)",
+            "CONV. ALIM (FCR)", "GANANCIA EN PESO (Gr)", "% MORT", "PECES MUERTOS (Unid)",
+            "TIPO DE DIETA"
+        ],
+        'filas': filas(),
+    }
+
+
+# ================================================================
+# SOLICITUD Y DESCARGA DE TRABAJOS
+# ================================================================
+
+def parametros_periodo(request):
+    """Año y mes de los filtros (?year=&month=), solo si son válidos."""
+    parametros = {}
+    for campo in ('year', 'month'):
+        valor = request.GET.get(campo, '')
+        if valor.isdigit():
+            parametros[campo] = int(valor)
+    return parametros
+
+
+def respuesta_descarga(trabajo):
+    return FileResponse(trabajo.archivo.open('rb'), as_attachment=True, filename=trabajo.nombre_descarga)
+
+
+def solicitar_reporte(request, tipo, parametros):
+    """
+    Encola (o reutiliza) el trabajo del reporte. Si el archivo ya está listo
+    se descarga de inmediato; si no, se redirige a la página de espera.
+    """
+    formato = 'csv' if request.GET.get('formato') == 'csv' else 'xlsx'
+    trabajo, creado = TrabajoReporte.obtener_o_crear(tipo, parametros, formato, usuario=request.user)
+
+    if creado:
+        try:
+            generar_reporte.delay(trabajo.pk)
+        except OperationalError:
+            # Sin broker disponible se genera en la misma petición
+            trabajo.generar()
+        trabajo.refresh_from_db()  # en modo eager la tarea ya terminó
+
+    if trabajo.estado == 'COMPLETADO':
+        return respuesta_descarga(trabajo)
+    return redirect('reporte-estado', pk=trabajo.pk)
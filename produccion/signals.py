@@ -0,0 +1,123 @@
+from django.db.models.signals import post_save, post_delete
+from django.db import transaction
+from django.dispatch import receiver
+from django.utils import timezone
+from .alertas import evaluar_registro_condiciones, invalidar_reglas
+from .crecimiento import invalidar_pronostico
+from .eventos import publicar_evento
+from .models import (
+    AlertaCondiciones, Artesa, Jaula, Lote, RegistroCondiciones, RegistroDiario, ReglaAlerta,
+    actualizar_contadores_biomasa,
+)
+from .notificaciones import SECCION_ALERTAS, SECCION_COMERCIALIZACION, SECCION_PRODUCCION, invalidar_notificaciones
+
+@receiver(post_save, sender=Lote)
+def actualizar_biomasa_unidades_on_save(sender, instance, **kwargs):
+    """
+    Mantiene los contadores de biomasa de la unidad de origen y de destino
+    cada vez que un lote se crea, se mueve, se fusiona, se vende o registra bajas.
+    """
+    bastidor_original, artesa_original, jaula_original = getattr(instance, '_unidades_originales', (None, None, None))
+    actualizar_contadores_biomasa(
+        artesa_ids=[artesa_original, instance.artesa_id],
+        jaula_ids=[jaula_original, instance.jaula_id],
+    )
+    publicar_cambios_unidades(
+        bastidor_ids=[bastidor_original, instance.bastidor_id],
+        artesa_ids=[artesa_original, instance.artesa_id],
+        jaula_ids=[jaula_original, instance.jaula_id],
+    )
+    instance._unidades_originales = (instance.bastidor_id, instance.artesa_id, instance.jaula_id)
+
+@receiver(post_delete, sender=Lote)
+def actualizar_biomasa_unidades_on_delete(sender, instance, **kwargs):
+    """
+    Descuenta el lote eliminado de la unidad en la que estaba.
+    """
+    actualizar_contadores_biomasa(artesa_ids=[instance.artesa_id], jaula_ids=[instance.jaula_id])
+    publicar_cambios_unidades(
+        bastidor_ids=[instance.bastidor_id], artesa_ids=[instance.artesa_id], jaula_ids=[instance.jaula_id]
+    )
+
+@receiver(post_save, sender=Lote)
+@receiver(post_delete, sender=Lote)
+def invalidar_notificaciones_lotes(sender, **kwargs):
+    """
+    Cualquier cambio de etapa, talla o unidad de un lote puede cambiar las
+    alertas; se descartan al confirmar la transacción.
+    """
+    transaction.on_commit(lambda: invalidar_notificaciones(SECCION_PRODUCCION, SECCION_COMERCIALIZACION))
+
+@receiver(post_save, sender=Lote)
+@receiver(post_delete, sender=Lote)
+@receiver(post_save, sender=RegistroCondiciones)
+def invalidar_pronostico_crecimiento(sender, **kwargs):
+    """
+    Mediciones, bajas, movimientos y temperaturas cambian el pronóstico de
+    crecimiento; se recalcula en la siguiente consulta.
+    """
+    transaction.on_commit(invalidar_pronostico)
+
+@receiver(post_save, sender=RegistroDiario)
+def publicar_tareas_del_dia(sender, instance, **kwargs):
+    """
+    Avisa a las pantallas abiertas cuando se marca la alimentación o la
+    limpieza de un lote (marcar_tarea_json).
+    """
+    datos = {
+        'lote_id': instance.lote_id,
+        'alimentacion_hoy': instance.alimentacion_realizada,
+        'limpieza_hoy': instance.limpieza_realizada,
+    }
+    transaction.on_commit(lambda: publicar_evento('tarea', datos))
+
+@receiver(post_save, sender=RegistroCondiciones)
+def evaluar_alertas_condiciones(sender, instance, **kwargs):
+    """
+    Evalúa las reglas de alerta al guardar las condiciones de un lote a mano
+    (save_condiciones_json). La ingesta de sensores evalúa por su cuenta.
+    """
+    evaluar_registro_condiciones(instance)
+
+@receiver(post_save, sender=ReglaAlerta)
+@receiver(post_delete, sender=ReglaAlerta)
+def recompilar_reglas_alerta(sender, instance, **kwargs):
+    """
+    Los procesos recompilan las reglas en la siguiente evaluación. Una regla
+    desactivada cierra sus incidentes abiertos (al borrarla se eliminan).
+    """
+    if not instance.activa and instance.pk:
+        AlertaCondiciones.objects.filter(regla=instance, fin__isnull=True).update(fin=timezone.now())
+
+    def invalidar():
+        invalidar_reglas()
+        invalidar_notificaciones(SECCION_ALERTAS)
+    transaction.on_commit(invalidar)
+
+
+def publicar_cambios_unidades(bastidor_ids=(), artesa_ids=(), jaula_ids=()):
+    """
+    Al confirmar la transacción publica un evento 'unidad' por cada unidad
+    afectada, con los contadores de biomasa ya recalculados.
+    """
+    bastidor_ids = {pk for pk in bastidor_ids if pk}
+    artesa_ids = {pk for pk in artesa_ids if pk}
+    jaula_ids = {pk for pk in jaula_ids if pk}
+    if not (bastidor_ids or artesa_ids or jaula_ids):
+        return
+
+    def publicar():
+        for pk in bastidor_ids:
+            publicar_evento('unidad', {'tipo_unidad': 'bastidor', 'id': pk})
+        for tipo_unidad, modelo, ids in (('artesa', Artesa, artesa_ids), ('jaula', Jaula, jaula_ids)):
+            if not ids:
+                continue
+            for unidad in modelo.objects.filter(pk__in=ids).values('id', 'biomasa_actual_kg', 'cantidad_peces_actual'):
+                publicar_evento('unidad', {
+                    'tipo_unidad': tipo_unidad,
+                    'id': unidad['id'],
+                    'biomasa_actual_kg': float(unidad['biomasa_actual_kg']),
+                    'cantidad_peces': unidad['cantidad_peces_actual'],
+                })
+
+    transaction.on_commit(publicar)
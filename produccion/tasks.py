@@ -1,57 +1,133 @@
 from celery import shared_task
 from django.utils import timezone
-from datetime import timedelta
+from datetime import date, timedelta
+from decimal import Decimal
 from django.contrib.contenttypes.models import ContentType
-from django.db.models import Sum
-from .models import Artesa, Jaula, RegistroMortalidad, RegistroUnidad
+from django.db.models import Q, Sum
+from .models import Artesa, Jaula, Lote, RegistroMortalidad, RegistroUnidad, TrabajoReporte
+
+
+def _parse_fecha(valor):
+    # Celery serializa en JSON, por lo que las fechas pueden llegar como 'YYYY-MM-DD'
+    if valor is None or isinstance(valor, date):
+        return valor
+    return date.fromisoformat(valor)
+
 
 @shared_task
-def generar_registros_diarios_de_unidades():
+def generar_registros_diarios_de_unidades(fecha_inicio=None, fecha_fin=None):
     """
     Tarea programada para ejecutarse una vez al día (ej. a la 1 AM).
-    Recopila los datos del día anterior para cada unidad y crea un registro de resumen.
+    Recopila los datos de cada unidad y crea un registro de resumen por día.
+
+    Sin argumentos procesa el día anterior. Con `fecha_inicio`/`fecha_fin`
+    (inclusive) rellena todo el rango en una sola ejecución: la ocupación de
+    la unidad es la foto actual de sus lotes y la mortalidad es la de cada día.
+    Como esa foto no es la de días pasados, los días anteriores a ayer solo
+    se completan donde falta el registro; los existentes no se tocan. Todo se
+    calcula con un número fijo de consultas, sin importar cuántas unidades o
+    días haya.
+    """
+    ayer = timezone.now().date() - timedelta(days=1)
+    fecha_fin = _parse_fecha(fecha_fin) or ayer
+    fecha_inicio = _parse_fecha(fecha_inicio) or fecha_fin
+    if fecha_inicio > fecha_fin:
+        fecha_inicio, fecha_fin = fecha_fin, fecha_inicio
+
+    print(f"Iniciando generación de registros del {fecha_inicio} al {fecha_fin}")
+
+    ct_artesa = ContentType.objects.get_for_model(Artesa)
+    ct_jaula = ContentType.objects.get_for_model(Jaula)
+
+    # 1. Una sola consulta con todos los lotes ubicados en artesas o jaulas
+    totales = {}
+    lotes = Lote.objects.filter(Q(artesa__isnull=False) | Q(jaula__isnull=False)).only(
+        'artesa_id', 'jaula_id', 'cantidad_total_peces', 'peso_promedio_pez_gr', 'talla_max_cm'
+    )
+    for lote in lotes:
+        clave = (ct_artesa.pk, lote.artesa_id) if lote.artesa_id else (ct_jaula.pk, lote.jaula_id)
+        acumulado = totales.setdefault(clave, {'peces': 0, 'biomasa': Decimal(0), 'alimento': Decimal(0)})
+        acumulado['peces'] += lote.cantidad_total_peces
+        acumulado['biomasa'] += lote.biomasa_kg
+        acumulado['alimento'] += lote.alimento_diario_kg
+
+    # Si la unidad estaba vacía, no se crea registro.
+    if not totales:
+        return f"Sin unidades ocupadas entre el {fecha_inicio} y el {fecha_fin}"
+
+    # 2. Mortalidad agrupada por unidad y día para todo el rango
+    bajas = {}
+    mortalidad = RegistroMortalidad.objects.filter(
+        fecha__range=(fecha_inicio, fecha_fin)
+    ).filter(
+        Q(lote__artesa__isnull=False) | Q(lote__jaula__isnull=False)
+    ).values('lote__artesa_id', 'lote__jaula_id', 'fecha').annotate(total_bajas=Sum('cantidad'))
+    for fila in mortalidad:
+        if fila['lote__artesa_id']:
+            clave = (ct_artesa.pk, fila['lote__artesa_id'], fila['fecha'])
+        else:
+            clave = (ct_jaula.pk, fila['lote__jaula_id'], fila['fecha'])
+        bajas[clave] = bajas.get(clave, 0) + fila['total_bajas']
+
+    # 3. Inserción masiva de todos los registros (unidad x día)
+    registros = []
+    dias = (fecha_fin - fecha_inicio).days + 1
+    for offset in range(dias):
+        fecha_registro = fecha_inicio + timedelta(days=offset)
+        for (content_type_id, object_id), acumulado in totales.items():
+            registros.append(RegistroUnidad(
+                content_type_id=content_type_id,
+                object_id=object_id,
+                fecha=fecha_registro,
+                cantidad_peces=acumulado['peces'],
+                biomasa_kg=round(acumulado['biomasa'], 2),
+                alimento_kg=round(acumulado['alimento'], 2),
+                mortalidad_total=bajas.get((content_type_id, object_id, fecha_registro), 0),
+            ))
+
+    # Ayer y hoy se actualizan si ya existen (volver a correr la tarea corrige el día)
+    RegistroUnidad.objects.bulk_create(
+        [registro for registro in registros if registro.fecha >= ayer],
+        batch_size=500,
+        update_conflicts=True,
+        unique_fields=['content_type', 'object_id', 'fecha'],
+        update_fields=['cantidad_peces', 'biomasa_kg', 'alimento_kg', 'mortalidad_total'],
+    )
+    # Días pasados: solo los que faltan, sin pisar registros históricos
+    RegistroUnidad.objects.bulk_create(
+        [registro for registro in registros if registro.fecha < ayer],
+        batch_size=500,
+        ignore_conflicts=True,
+    )
+    print(f"{len(registros)} registros procesados para {len(totales)} unidades")
+
+    return f"Registros diarios generados con éxito del {fecha_inicio} al {fecha_fin}"
+
+
+@shared_task
+def generar_reporte(trabajo_id):
+    """
+    Genera el archivo de un TrabajoReporte y lo deja en disco para su descarga.
+    """
+    trabajo = TrabajoReporte.objects.get(pk=trabajo_id)
+    if trabajo.estado == 'COMPLETADO':
+        return f"El reporte {trabajo_id} ya estaba generado"
+
+    trabajo.generar()
+    if trabajo.estado == 'ERROR':
+        return f"Error al generar el reporte {trabajo_id}: {trabajo.error}"
+    return f"Reporte {trabajo_id} generado: {trabajo.archivo.name}"
+
+
+@shared_task
+def diagnosticar_lotes_activos():
+    """
+    Diagnóstico sanitario de todos los lotes activos para la revisión de la
+    mañana. Guarda la tabla de riesgo del día en DiagnosticoLote.
     """
-    # Se calcula sobre los datos del día que acaba de terminar.
-    fecha_registro = timezone.now().date() - timedelta(days=1)
-    
-    print(f"Iniciando generación de registros para la fecha: {fecha_registro}")
-
-    # Unificar los modelos de unidad para no repetir código
-    unidades_a_procesar = list(Artesa.objects.prefetch_related('lotes').all()) + \
-                          list(Jaula.objects.prefetch_related('lotes').all())
-
-    for unidad in unidades_a_procesar:
-        lotes_en_unidad = unidad.lotes.all()
-        
-        # Si la unidad estaba vacía, no se crea registro.
-        if not lotes_en_unidad:
-            continue
-
-        # Cálculos consolidados para la unidad en ese día
-        total_peces = sum(lote.cantidad_total_peces for lote in lotes_en_unidad)
-        total_biomasa = sum(lote.biomasa_kg for lote in lotes_en_unidad)
-        total_alimento = sum(lote.alimento_diario_kg for lote in lotes_en_unidad)
-        
-        mortalidad_del_dia = RegistroMortalidad.objects.filter(
-            lote__in=lotes_en_unidad, 
-            fecha=fecha_registro
-        ).aggregate(total_bajas=Sum('cantidad'))['total_bajas'] or 0
-
-        # Obtener el ContentType para el modelo de la unidad (Artesa o Jaula)
-        content_type = ContentType.objects.get_for_model(unidad)
-
-        # Crea o actualiza el registro para esa unidad y esa fecha
-        RegistroUnidad.objects.update_or_create(
-            content_type=content_type,
-            object_id=unidad.pk,
-            fecha=fecha_registro,
-            defaults={
-                'cantidad_peces': total_peces,
-                'biomasa_kg': total_biomasa,
-                'alimento_kg': total_alimento,
-                'mortalidad_total': mortalidad_del_dia,
-            }
-        )
-        print(f"Registro creado/actualizado para {unidad.codigo} - {fecha_registro}")
-
-    return f"Registros diarios generados con éxito para el {fecha_registro}"
\ No newline at end of file
+    from .ia.diagnostico_lotes import diagnosticar_lotes, guardar_diagnosticos, resumen_por_nivel
+
+    tabla = diagnosticar_lotes()
+    guardar_diagnosticos(tabla)
+    resumen = resumen_por_nivel(tabla)
+    return f"Diagnóstico de {len(tabla)} lotes: " + ", ".join(f"{nivel}={cantidad}" for nivel, cantidad in resumen.items())
@@ -1,3 +1,612 @@
+import itertools
+import json
+import os
+import random
+import tempfile
+from datetime import datetime, timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
+
+import numpy as np
+from comercializacion.models import descontar_biomasa_lote
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db.models import Sum
 from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+from sklearn.ensemble import RandomForestClassifier
+
+from .alertas import invalidar_reglas
+from .condiciones_agua import clave_unidad, registrar_lecturas
+from .crecimiento import calcular_pronostico
+from .ia.diagnostico_service import DiagnosticoService
+from .ia import entrenamiento
+from .ia.entrenamiento import COLUMNAS_FEATURES, datos_desde_csv, entrenar
+from .ia.predictores import diagnostico_experto
+from .ia.predictores.diagnostico_experto import NOMBRE_SANO, SistemaExpertoSalud, obtener_base
+from .models import (
+    AlertaCondiciones, Artesa, HistorialMovimiento, Jaula, LecturaSensor, Lote, RegistroCondiciones,
+    RegistroMortalidad, ReglaAlerta, ResumenCondiciones, SecuenciaCodigo, generar_codigos,
+)
+from .transiciones import aplicar_plan_movimientos
+from .ubicacion import sugerir_ubicacion
+
+
+class LoteKpisTests(TestCase):
+    """Verifica que las anotaciones SQL de with_kpis() coinciden con las propiedades de Lote."""
+
+    TOLERANCIA = Decimal('0.01')
+
+    def crear_lote(self, peso, talla, cantidad, dias, peso_inicial=Decimal('0.00'), bajas=0):
+        hoy = timezone.now().date()
+        lote = Lote.objects.create(
+            etapa_actual='ENGORDE',
+            cantidad_total_peces=cantidad,
+            peso_promedio_pez_gr=peso,
+            talla_max_cm=talla,
+            fecha_ingreso_etapa=hoy - timedelta(days=dias),
+        )
+        # peso_promedio_inicial_gr no es editable desde el formulario, se fija directamente
+        Lote.objects.filter(pk=lote.pk).update(peso_promedio_inicial_gr=peso_inicial)
+        if bajas:
+            RegistroMortalidad.objects.create(lote=lote, cantidad=bajas)
+        return lote
+
+    def assertKpisCoinciden(self, lote):
+        peces_muertos = lote.registros_mortalidad.aggregate(total=Sum('cantidad'))['total'] or 0
+        cantidad_inicial = lote.cantidad_total_peces + peces_muertos
+        porc_mort = Decimal(peces_muertos * 100) / cantidad_inicial if cantidad_inicial else Decimal(0)
+
+        pares = (
+            ('biomasa_kg', lote.biomasa_kg, lote.kpi_biomasa_kg),
+            ('racion', lote.racion_alimentaria_porcentaje, lote.kpi_racion_porcentaje),
+            ('alimento_diario', lote.alimento_diario_kg, lote.kpi_alimento_diario_kg),
+            ('ganancia_peso', lote.ganancia_en_peso_gr, lote.kpi_ganancia_peso_gr),
+            ('conversion', lote.conversion_alimenticia, lote.kpi_conversion_alimenticia),
+            ('porc_mortalidad', porc_mort, lote.kpi_porcentaje_mortalidad),
+        )
+        for nombre, python, sql in pares:
+            self.assertLessEqual(
+                abs(Decimal(python) - Decimal(sql)), self.TOLERANCIA,
+                f"{nombre} difiere en {lote.codigo_lote}: Python={python} SQL={sql}"
+            )
+        self.assertEqual(lote.kpi_peces_muertos, peces_muertos)
+        self.assertEqual(lote.kpi_tipo_alimento, lote.tipo_alimento)
+
+    def test_casos_limite(self):
+        self.crear_lote(None, None, 1000, 10)                      # sin peso ni talla
+        self.crear_lote(Decimal('0'), Decimal('0'), 1000, 10)      # peso y talla en cero
+        self.crear_lote(Decimal('35.50'), Decimal('9.00'), 0, 10)  # sin peces
+        self.crear_lote(Decimal('120.00'), Decimal('18.00'), 500, 0, Decimal('80.00'))   # ingresó hoy
+        self.crear_lote(Decimal('120.00'), Decimal('18.00'), 500, -3, Decimal('80.00'))  # fecha futura
+        self.crear_lote(Decimal('260.00'), Decimal('25.00'), 800, 45, Decimal('150.00'), bajas=200)
+        self.crear_lote(Decimal('10.00'), Decimal('8.00'), 0, 30, bajas=50)  # todos muertos
+        for talla in ('8.00', '10.00', '15.00', '20.00', '20.01'):  # límites del tipo de alimento
+            self.crear_lote(Decimal('50.00'), Decimal(talla), 100, 5)
+
+        for lote in Lote.objects.with_kpis():
+            self.assertKpisCoinciden(lote)
+
+    def test_lotes_aleatorios(self):
+        aleatorio = random.Random(2024)
+        for _ in range(150):
+            self.crear_lote(
+                peso=aleatorio.choice([None, Decimal('0'), Decimal(aleatorio.randint(1, 40000)) / 100]),
+                talla=aleatorio.choice([None, Decimal('0'), Decimal(aleatorio.randint(1, 3000)) / 100]),
+                cantidad=aleatorio.choice([0, aleatorio.randint(1, 50000)]),
+                dias=aleatorio.randint(-3, 200),
+                peso_inicial=Decimal(aleatorio.randint(0, 5000)) / 100,
+                bajas=aleatorio.choice([0, aleatorio.randint(1, 300)]),
+            )
+
+        for lote in Lote.objects.with_kpis():
+            self.assertKpisCoinciden(lote)
+
+    def test_una_sola_consulta(self):
+        for i in range(5):
+            self.crear_lote(Decimal('100.00'), Decimal('12.00'), 1000, i, bajas=i)
+        with self.assertNumQueries(1):
+            lotes = list(Lote.objects.with_kpis())
+        self.assertEqual(len(lotes), 5)
+
+
+class EntrenamientoTests(TestCase):
+    """Versiones y caché del pipeline de entrenamiento en un directorio temporal."""
+
+    def setUp(self):
+        directorio = tempfile.TemporaryDirectory()
+        self.addCleanup(directorio.cleanup)
+        for nombre, ruta in (
+            ('DIRECTORIO_MODELOS', directorio.name),
+            ('DIRECTORIO_CACHE', os.path.join(directorio.name, 'cache')),
+            ('DIRECTORIO_VERSIONES', os.path.join(directorio.name, 'versiones')),
+        ):
+            parche = mock.patch.object(entrenamiento, nombre, ruta)
+            parche.start()
+            self.addCleanup(parche.stop)
+
+        self.ruta_csv = os.path.join(directorio.name, 'datos.csv')
+        generador = random.Random(7)
+        with open(self.ruta_csv, 'w', encoding='utf-8') as archivo:
+            archivo.write(','.join(['fecha', 'lote_id', *COLUMNAS_FEATURES, 'diagnostico_final']) + '\n')
+            for i in range(40):
+                enfermo = i % 2
+                valores = [generador.uniform(8, 16), 7, 8 - 3 * enfermo, 0.02, enfermo, 0, enfermo]
+                diagnostico = 'Saprolegniasis' if enfermo else 'Sano'
+                archivo.write(','.join(map(str, ['2026-01-01', i, *valores, diagnostico])) + '\n')
+
+    def test_reentrenar_con_los_mismos_datos_usa_la_cache(self):
+        datos = datos_desde_csv(self.ruta_csv)
+        self.assertFalse(datos.desde_cache)
+        directorio, metricas, reutilizada = entrenar(datos, n_estimators=5, pliegues=3, n_jobs=1)
+        self.assertFalse(reutilizada)
+        self.assertEqual(metricas['validacion_cruzada']['pliegues'], 3)
+
+        datos = datos_desde_csv(self.ruta_csv)
+        self.assertTrue(datos.desde_cache)
+        self.assertEqual(datos.columnas, COLUMNAS_FEATURES)
+        self.assertEqual(entrenar(datos, n_estimators=5, pliegues=3, n_jobs=1), (directorio, metricas, True))
+
+        # Otros pliegues son otra versión, con su propia validación cruzada
+        otro, metricas, reutilizada = entrenar(datos, n_estimators=5, pliegues=2, n_jobs=1)
+        self.assertFalse(reutilizada)
+        self.assertNotEqual(otro, directorio)
+        self.assertEqual(metricas['validacion_cruzada']['pliegues'], 2)
+
+
+def diagnostico_bucle(base_conocimiento, sintomas_observados):
+    """El recorrido enfermedad por enfermedad que usaba el sistema experto antes de la matriz."""
+    mejor_enfermedad, max_coincidencias = NOMBRE_SANO, 0
+    for nombre, detalles in base_conocimiento['enfermedades'].items():
+        if 'sintomas' not in detalles:
+            continue
+        coincidencias = sum(1 for obs, esp in zip(sintomas_observados, detalles['sintomas']) if obs == 1 and esp == 1)
+        if coincidencias > max_coincidencias:
+            max_coincidencias, mejor_enfermedad = coincidencias, nombre
+    return mejor_enfermedad, max_coincidencias
+
+
+class SistemaExpertoTests(TestCase):
+
+    def test_igual_al_bucle_en_todas_las_combinaciones(self):
+        with open(diagnostico_experto.RUTA_BASE_CONOCIMIENTO, encoding='utf-8') as f:
+            base_conocimiento = json.load(f)
+        sistema = SistemaExpertoSalud()
+        combinaciones = list(itertools.product([0, 1], repeat=len(sistema.sintomas)))
+        self.assertEqual(len(combinaciones), 256)
+
+        resultados = sistema.diagnosticar_varios(combinaciones)
+        for observacion, resultado in zip(combinaciones, resultados):
+            nombre, coincidencias = diagnostico_bucle(base_conocimiento, observacion)
+            self.assertEqual((resultado['nombre'], resultado['coincidencias']), (nombre, coincidencias), observacion)
+            esperado = {k: v for k, v in base_conocimiento['enfermedades'][nombre].items() if k != 'sintomas'}
+            self.assertEqual({k: resultado[k] for k in esperado}, esperado)
+            self.assertEqual(sistema.diagnosticar(list(observacion))['nombre'], nombre)
+
+    def test_resultados_de_solo_lectura(self):
+        sistema = SistemaExpertoSalud()
+        resultado = sistema.diagnosticar([1] * len(sistema.sintomas))
+        with self.assertRaises(TypeError):
+            resultado['nombre'] = 'Otra'
+        with self.assertRaises(TypeError):
+            sistema.base.detalles[resultado['nombre']]['descripcion'] = ''
+        with self.assertRaises(ValueError):
+            sistema.base.matriz[0, 0] = 1
+        # Diagnosticar no agrega claves a la base compartida (antes se le escribía 'nombre')
+        self.assertNotIn('nombre', sistema.base.detalles[resultado['nombre']])
+        self.assertNotIn('nombre', sistema.base.detalles[NOMBRE_SANO])
+
+    def test_recompila_si_cambia_el_json(self):
+        with tempfile.TemporaryDirectory() as directorio:
+            ruta = os.path.join(directorio, 'enfermedades.json')
+
+            def escribir(enfermedades):
+                with open(ruta, 'w', encoding='utf-8') as f:
+                    json.dump({'sintomas': ['a', 'b'], 'enfermedades': enfermedades}, f)
+
+            escribir({NOMBRE_SANO: {'descripcion': 'Sano'}, 'Primera': {'sintomas': [1, 0]}})
+            with mock.patch.object(diagnostico_experto, 'RUTA_BASE_CONOCIMIENTO', ruta):
+                base = obtener_base()
+                self.assertIs(obtener_base(), base)
+                self.assertEqual(SistemaExpertoSalud().diagnosticar([1, 0])['nombre'], 'Primera')
+
+                escribir({NOMBRE_SANO: {'descripcion': 'Sano'}, 'Segunda enfermedad': {'sintomas': [1, 1]}})
+                self.assertIsNot(obtener_base(), base)
+                self.assertEqual(obtener_base().nombres, ('Segunda enfermedad',))
+                self.assertEqual(SistemaExpertoSalud().diagnosticar([1, 0])['nombre'], 'Segunda enfermedad')
+
+
+class SecuenciaCodigoTests(TestCase):
+
+    def codigos_lote(self, cantidad=1):
+        return generar_codigos(Lote, 'codigo_lote', 'L', 3, cantidad=cantidad)
+
+    def test_bloques_consecutivos_sin_reutilizar(self):
+        periodo = timezone.now().strftime('%y%m')
+        self.assertEqual(self.codigos_lote(3), [f'L{periodo}-001', f'L{periodo}-002', f'L{periodo}-003'])
+        lote = Lote.objects.create(etapa_actual='ALEVINES', cantidad_total_peces=10)
+        self.assertEqual(lote.codigo_lote, f'L{periodo}-004')
+        # Un código de un lote eliminado no se vuelve a entregar
+        lote.delete()
+        self.assertEqual(self.codigos_lote(2), [f'L{periodo}-005', f'L{periodo}-006'])
+        self.assertEqual(list(SecuenciaCodigo.reservar('X', periodo, 4)), [1, 2, 3, 4])
+        self.assertEqual(list(SecuenciaCodigo.reservar('X', periodo, 1)), [5])
+
+    def test_semilla_desde_codigos_existentes(self):
+        # Lotes creados antes de que existiera el contador del periodo
+        periodo = timezone.now().strftime('%y%m')
+        for codigo in (f'L{periodo}-007', f'L{periodo}-012', 'L9901-500'):
+            Lote.objects.create(codigo_lote=codigo, etapa_actual='ALEVINES', cantidad_total_peces=10)
+        self.assertFalse(SecuenciaCodigo.objects.filter(prefijo='L', periodo=periodo).exists())
+        self.assertEqual(self.codigos_lote(2), [f'L{periodo}-013', f'L{periodo}-014'])
+
+    def test_cambio_de_mes_y_de_anio(self):
+        for momento, esperado in (
+            (datetime(2026, 11, 30, 23, 0), ['L2611-001', 'L2611-002']),
+            (datetime(2026, 12, 1, 8, 0), ['L2612-001', 'L2612-002']),
+            (datetime(2027, 1, 1, 8, 0), ['L2701-001', 'L2701-002']),
+        ):
+            with mock.patch('produccion.models.timezone.now', return_value=timezone.make_aware(momento)):
+                self.assertEqual(self.codigos_lote(2), esperado)
+        self.assertEqual(
+            sorted(SecuenciaCodigo.objects.filter(prefijo='L').values_list('periodo', 'ultimo_valor')),
+            [('2611', 2), ('2612', 2), ('2701', 2)],
+        )
+
+
+class ContadoresBiomasaTests(TestCase):
+    """Los contadores de artesas y jaulas siguen a sus lotes (pesos enteros incluidos)."""
+
+    def setUp(self):
+        self.client.force_login(get_user_model().objects.create_user('operario', password='x'))
+        self.artesa = crear_unidad(Artesa, 500)
+        self.jaula = crear_unidad(Jaula, 500, tipo='JUVENIL')
+
+    def assertContadores(self, unidad, biomasa, peces):
+        unidad.refresh_from_db()
+        self.assertEqual((unidad.biomasa_actual_kg, unidad.cantidad_peces_actual), (Decimal(biomasa), peces))
+
+    def crear_alevines(self, cantidad, peso):
+        return Lote.objects.create(
+            etapa_actual='ALEVINES', cantidad_total_peces=cantidad, peso_promedio_pez_gr=Decimal(peso),
+            talla_min_cm=Decimal(3), talla_max_cm=Decimal(4), artesa=self.artesa,
+        )
+
+    def mover_a_jaula(self, lote, cantidad):
+        respuesta = self.client.post(
+            reverse('mover-lote-a-jaula', args=[lote.pk]), {'jaula_destino': self.jaula.pk, 'cantidad': cantidad},
+        )
+        self.assertEqual(respuesta.status_code, 200, respuesta.content)
+
+    def test_contadores_en_todo_el_ciclo(self):
+        # 1234 peces de 10 g: SQLite guarda el peso como entero y 12340 / 1000 no debe truncarse
+        lote = self.crear_alevines(1234, '10')
+        self.assertContadores(self.artesa, '12.34', 1234)
+        otro = self.crear_alevines(500, '12.5')
+        self.assertContadores(self.artesa, '18.59', 1734)
+
+        # Parte a la jaula vacía (lote nuevo) y luego el otro lote completo (fusión)
+        self.mover_a_jaula(lote, 234)
+        self.assertContadores(self.artesa, '16.25', 1500)
+        self.assertContadores(self.jaula, '2.34', 234)
+        self.mover_a_jaula(otro, 500)
+        self.assertFalse(Lote.objects.filter(pk=otro.pk).exists())
+        self.assertContadores(self.artesa, '10.00', 1000)
+        # 734 peces de (234 × 10 + 500 × 12.5) / 734 = 11.70 g
+        self.assertContadores(self.jaula, '8.59', 734)
+
+        respuesta = self.client.post(reverse('registrar-mortalidad-json', args=[lote.pk]), {'cantidad': 100})
+        self.assertEqual(respuesta.status_code, 200, respuesta.content)
+        self.assertContadores(self.artesa, '9.00', 900)
+
+        descontar_biomasa_lote(self.jaula.lotes.get(), Decimal('1.17'))  # 100 peces de 11.70 g
+        self.assertContadores(self.jaula, '7.42', 634)
+
+        lote.delete()
+        self.assertContadores(self.artesa, '0.00', 0)
+
+    def test_verify_biomass_counters(self):
+        self.crear_alevines(1234, '10')
+        Artesa.objects.filter(pk=self.artesa.pk).update(biomasa_actual_kg=Decimal('12.00'), cantidad_peces_actual=1200)
+
+        salida = StringIO()
+        call_command('verify_biomass_counters', '--dry-run', stdout=salida)
+        self.assertIn('biomasa 12.00 kg (real 12.34 kg), peces 1200 (real 1234)', salida.getvalue())
+        self.assertIn('1 unidad(es) con descuadre', salida.getvalue())
+        self.assertContadores(self.artesa, '12.00', 1200)
+
+        call_command('verify_biomass_counters', stdout=StringIO())
+        self.assertContadores(self.artesa, '12.34', 1234)
+        salida = StringIO()
+        call_command('verify_biomass_counters', '--dry-run', stdout=salida)
+        self.assertIn('Todos los contadores de biomasa están cuadrados.', salida.getvalue())
+
+
+class PronosticoCrecimientoTests(TestCase):
+    """Agua a 10 °C todos los días: 10 grados-día por día."""
+
+    def setUp(self):
+        self.hoy = timezone.localdate()
+
+    def crear_lote(self, peso_actual, dias_en_etapa, peso_inicial, medicion=None):
+        lote = Lote.objects.create(
+            etapa_actual='ENGORDE', cantidad_total_peces=1000, peso_promedio_pez_gr=Decimal(peso_actual),
+            fecha_ingreso_etapa=self.hoy - timedelta(days=dias_en_etapa),
+        )
+        # peso_promedio_inicial_gr no es editable: se fija aparte
+        Lote.objects.filter(pk=lote.pk).update(peso_promedio_inicial_gr=Decimal(peso_inicial))
+        if medicion:
+            dias, peso = medicion
+            HistorialMovimiento.objects.create(
+                lote=lote, tipo_movimiento='MEDICION', descripcion='Medición', peso_promedio_gr=Decimal(peso),
+                fecha=timezone.now() - timedelta(days=dias),
+            )
+        return lote
+
+    def test_tgc_ancla_y_dias_a_cosecha(self):
+        # 8 g al entrar y 27 g 50 días (500 grados-día) después: (3 - 2) / 0.5 = TGC 2
+        medido = self.crear_lote(27, 60, 8, medicion=(10, 27))
+        RegistroCondiciones.objects.bulk_create([
+            RegistroCondiciones(lote=medido, fecha=self.hoy - timedelta(days=dias), temp_agua_c=Decimal(10))
+            for dias in range(61)
+        ])
+        # Mismas mediciones pero pesado de nuevo hoy (sin registros: usa la temperatura de la granja)
+        pesado_hoy = self.crear_lote(30, 60, 8, medicion=(10, 27))
+        # Una sola medición (la de ingreso): TGC por defecto
+        sin_ajuste = self.crear_lote(27, 5, 20)
+
+        pronostico = calcular_pronostico(self.hoy)
+        self.assertEqual(pronostico.lote_ids, (medido.pk, pesado_hoy.pk, sin_ajuste.pk))
+        np.testing.assert_allclose(pronostico.tgc, [2, 2, 2])
+        self.assertEqual(list(pronostico.ajustado), [True, True, False])
+        np.testing.assert_allclose(pronostico.temperatura, [10, 10, 10])
+        # El primer lote se midió hace 10 días (100 grados-día): hoy ya pesa (3 + 0.2)³
+        np.testing.assert_allclose(pronostico.peso_gr[:, 0], [3.2 ** 3, 30, 27])
+        np.testing.assert_allclose(pronostico.peso_gr[0, 10], 3.4 ** 3)
+        # Días hasta 250 g: ((250^⅓ - raíz ancla) × 1000 / TGC - grados-día transcurridos) / 10
+        self.assertEqual(list(pronostico.dias_a_cosecha), [155, 160, 165])
+        self.assertEqual(pronostico.fecha_cosecha(0), self.hoy + timedelta(days=155))
+        np.testing.assert_array_equal(pronostico.peces[:, -1], [1000, 1000, 1000])
+
+
+class PredecirBatchTests(TestCase):
+    """predecir_batch debe dar lo mismo que predecir lote por lote con su último registro."""
+
+    def setUp(self):
+        aleatorio = np.random.default_rng(7)
+        x = np.column_stack([
+            aleatorio.uniform(3, 18, 200), aleatorio.uniform(6, 9, 200), aleatorio.uniform(3, 10, 200),
+            aleatorio.uniform(0, 0.3, 200), np.zeros((200, 3)),
+        ])
+        y = np.select([x[:, 0] < 6, x[:, 1] < 6.8, x[:, 2] < 5], ['Saprolegniasis', 'Columnaris', 'Estres_por_hipoxia'], 'Sano')
+        # Se evita leer los artefactos del repositorio: el modelo se entrena aquí
+        with mock.patch.object(DiagnosticoService, '_load_model'):
+            self.servicio = DiagnosticoService()
+        self.servicio.model = RandomForestClassifier(n_estimators=10, random_state=0).fit(x, y)
+        self.servicio.feature_columns = COLUMNAS_FEATURES
+
+    def test_coincide_con_predecir(self):
+        aleatorio = random.Random(11)
+        hoy = timezone.localdate()
+        lotes = []
+        for i in range(12):
+            lote = Lote.objects.create(etapa_actual='ENGORDE', cantidad_total_peces=100, peso_promedio_pez_gr=Decimal('50.00'))
+            lotes.append(lote)
+            if i % 4 == 3:
+                continue  # sin condiciones registradas
+            for dias in range(aleatorio.randint(1, 3)):
+                RegistroCondiciones.objects.create(
+                    lote=lote,
+                    fecha=hoy - timedelta(days=dias),
+                    temp_agua_c=Decimal(aleatorio.randint(300, 1800)) / 100,
+                    ph=Decimal(aleatorio.randint(600, 900)) / 100,
+                    oxigeno_mg_l=aleatorio.choice([None, Decimal(aleatorio.randint(300, 1000)) / 100]),
+                    amoniaco_mg_l=Decimal(aleatorio.randint(0, 30)) / 100,
+                )
+
+        with self.assertNumQueries(1):
+            resultados = self.servicio.predecir_batch(lotes)
+
+        esperados = [
+            self.servicio.predecir(lote, lote.registros_condiciones.order_by('-fecha').first())
+            for lote in lotes
+            if lote.registros_condiciones.exists()
+        ]
+        self.assertEqual(len(resultados), 9)
+        self.assertEqual(resultados, esperados)
+
+
+class ResumenCondicionesTests(TestCase):
+    """Reenviar una lectura la reemplaza: los resúmenes por hora y por día no la cuentan dos veces."""
+
+    def test_lectura_reenviada(self):
+        jaula = Jaula.objects.create(tipo='ENGORDE')
+        hora = timezone.localtime(timezone.now() - timedelta(hours=2)).replace(minute=0, second=0, microsecond=0)
+        registrar_lecturas([
+            LecturaSensor(unidad=jaula, momento=hora, temp_agua_c=10.0),
+            LecturaSensor(unidad=jaula, momento=hora + timedelta(minutes=20), temp_agua_c=12.0),
+        ])
+        # El sensor reenvía la segunda lectura corregida
+        registrar_lecturas([LecturaSensor(unidad=jaula, momento=hora + timedelta(minutes=20), temp_agua_c=14.0)])
+
+        content_type_id, object_id = clave_unidad(jaula)
+        resumenes = ResumenCondiciones.objects.filter(
+            content_type_id=content_type_id, object_id=object_id, variable='temp_agua_c',
+        )
+        self.assertEqual(LecturaSensor.objects.count(), 2)
+        for granularidad in ('HORA', 'DIA'):
+            resumen = resumenes.get(granularidad=granularidad)
+            self.assertEqual(resumen.conteo, 2, granularidad)
+            self.assertAlmostEqual(resumen.suma, 24.0)
+            self.assertEqual((resumen.minimo, resumen.maximo), (10.0, 14.0))
+
+
+class AlertasCondicionesTests(TestCase):
+    """Un incidente abierto no genera otra alerta y se cierra tras `minutos_despeje` sin disparos."""
+
+    def setUp(self):
+        ReglaAlerta.objects.update(activa=False)
+        self.regla = ReglaAlerta.objects.create(
+            nombre='Oxígeno bajo (prueba)', variable='oxigeno_mg_l', tipo='MINIMO', umbral=5, minutos_despeje=30,
+        )
+        # Las señales invalidan en on_commit, que no llega dentro de TestCase
+        invalidar_reglas()
+        self.jaula = Jaula.objects.create(tipo='ENGORDE')
+        self.lote = Lote.objects.create(etapa_actual='ENGORDE', cantidad_total_peces=100, jaula=self.jaula)
+        self.inicio = timezone.now().replace(microsecond=0) - timedelta(hours=5)
+
+    def tearDown(self):
+        invalidar_reglas()
+
+    def enviar(self, minutos, oxigeno):
+        registrar_lecturas([
+            LecturaSensor(unidad=self.jaula, momento=self.inicio + timedelta(minutes=m), oxigeno_mg_l=oxigeno(m))
+            for m in minutos
+        ])
+
+    def test_antirrebote_y_cierre(self):
+        # Oxígeno bajo de los 10 a los 25 minutos, repartido en dos envíos
+        bajo = lambda m: 4.0 if 10 <= m <= 25 or m >= 80 else 8.0
+        self.enviar(range(0, 20, 5), bajo)
+        self.enviar(range(20, 60, 5), bajo)
+
+        alerta = AlertaCondiciones.objects.get(regla=self.regla)
+        self.assertEqual(alerta.lote, self.lote)
+        self.assertEqual(alerta.inicio, self.inicio + timedelta(minutes=10))
+        self.assertEqual(alerta.ultimo_disparo, self.inicio + timedelta(minutes=25))
+        # Primera lectura normal con 30 minutos sin disparos
+        self.assertEqual(alerta.fin, self.inicio + timedelta(minutes=55))
+
+        # Una nueva caída después del cierre abre otro incidente, uno solo
+        self.enviar(range(60, 100, 5), bajo)
+        alertas = AlertaCondiciones.objects.filter(regla=self.regla).order_by('inicio')
+        self.assertEqual(alertas.count(), 2)
+        self.assertEqual(alertas[1].inicio, self.inicio + timedelta(minutes=80))
+        self.assertIsNone(alertas[1].fin)
+
+
+def crear_unidad(modelo, capacidad_kg, **campos):
+    """Artesa o jaula de 1 m de alto con la capacidad indicada (1 kg/m³)."""
+    return modelo.objects.create(
+        forma='RECTANGULAR', largo_m=capacidad_kg, ancho_m=1, alto_m=1, densidad_siembra_kg_m3=1, **campos,
+    )
+
+
+class SugerirUbicacionTests(TestCase):
+
+    def crear_lote(self, etapa, cantidad, peso, **ubicacion):
+        return Lote.objects.create(
+            etapa_actual=etapa, cantidad_total_peces=cantidad, peso_promedio_pez_gr=Decimal(peso), **ubicacion,
+        )
+
+    def test_mejor_ajuste(self):
+        crear_unidad(Jaula, 500, tipo='JUVENIL')
+        justa = crear_unidad(Jaula, 120, tipo='JUVENIL')
+        crear_unidad(Jaula, 90, tipo='JUVENIL')
+        lote = self.crear_lote('ALEVINES', 10000, 10)  # 100 kg
+        plan = sugerir_ubicacion([lote.pk])
+        self.assertEqual([(m['destino_id'], m['cantidad']) for m in plan['movimientos']], [(justa.pk, 10000)])
+        self.assertEqual(plan['capacidad_sobrante_kg'], 20)
+
+    def test_etapas_con_el_mismo_destino_comparten_capacidad(self):
+        jaula = crear_unidad(Jaula, 100, tipo='ENGORDE')
+        juveniles = self.crear_lote('JUVENILES', 600, 100)  # 60 kg
+        engorde = self.crear_lote('ENGORDE', 300, 200)  # 60 kg
+        plan = sugerir_ubicacion([juveniles.pk, engorde.pk])
+        recibido = sum(m['biomasa_kg'] for m in plan['movimientos'] if m['destino_id'] == jaula.pk)
+        self.assertLessEqual(recibido, 100)
+        self.assertTrue(plan['sin_ubicar'])
+
+    def test_unidad_que_se_vacia_cuenta_como_libre(self):
+        # La única jaula juvenil está ocupada por un lote de juveniles que pasa a engorde
+        juvenil = crear_unidad(Jaula, 100, tipo='JUVENIL')
+        engorde = crear_unidad(Jaula, 100, tipo='ENGORDE')
+        saliente = self.crear_lote('JUVENILES', 900, 100, jaula=juvenil)  # 90 kg
+        alevines = self.crear_lote('ALEVINES', 5000, 10, artesa=crear_unidad(Artesa, 100))  # 50 kg
+
+        plan = sugerir_ubicacion([alevines.pk, saliente.pk])
+        self.assertEqual(plan['sin_ubicar'], [])
+        movimientos = [(m['lote_id'], m['destino_id'], m['destino_ocupado']) for m in plan['movimientos']]
+        # Primero sale el lote de la jaula juvenil y luego llegan los alevines, a una jaula ya vacía
+        self.assertEqual(movimientos, [(saliente.pk, engorde.pk, False), (alevines.pk, juvenil.pk, False)])
+
+    def test_lote_saliente_sin_destino_no_libera_su_unidad(self):
+        # No hay jaulas de engorde: los juveniles se quedan y sólo caben 10 kg de alevines
+        juvenil = crear_unidad(Jaula, 100, tipo='JUVENIL')
+        saliente = self.crear_lote('JUVENILES', 900, 100, jaula=juvenil)  # 90 kg
+        alevines = self.crear_lote('ALEVINES', 5000, 10, artesa=crear_unidad(Artesa, 100))  # 50 kg
+
+        plan = sugerir_ubicacion([alevines.pk, saliente.pk])
+        [movimiento] = plan['movimientos']
+        self.assertEqual(
+            (movimiento['lote_id'], movimiento['destino_id'], movimiento['destino_ocupado']), (alevines.pk, juvenil.pk, True),
+        )
+        self.assertGreater(movimiento['cantidad'], 990)
+        self.assertLessEqual(movimiento['biomasa_kg'], 10)
+        self.assertEqual(
+            {f['lote_id']: f['cantidad'] for f in plan['sin_ubicar']},
+            {alevines.pk: 5000 - movimiento['cantidad'], saliente.pk: 900},
+        )
+        # El plan sugerido se puede aplicar tal cual
+        aplicado, resultados = aplicar_plan_movimientos(plan['movimientos'])
+        self.assertTrue(aplicado, resultados)
+
+
+class AplicarPlanMovimientosTests(TestCase):
+
+    def setUp(self):
+        # Un lote de juveniles deja la única jaula juvenil y los alevines llegan a ella
+        self.juvenil = crear_unidad(Jaula, 100, tipo='JUVENIL')
+        self.engorde = crear_unidad(Jaula, 100, tipo='ENGORDE')
+        self.juveniles = Lote.objects.create(
+            etapa_actual='JUVENILES', cantidad_total_peces=900, peso_promedio_pez_gr=Decimal(100), jaula=self.juvenil,
+        )  # 90 kg
+        self.alevines = Lote.objects.create(
+            etapa_actual='ALEVINES', cantidad_total_peces=5000, peso_promedio_pez_gr=Decimal(10),
+            artesa=crear_unidad(Artesa, 100),
+        )  # 50 kg
+
+    def movimiento(self, lote, jaula):
+        return {'lote_id': lote.pk, 'destino': 'jaula', 'destino_id': jaula.pk}
+
+    def comprobar_plan(self, plan):
+        aplicado, resultados = aplicar_plan_movimientos(plan)
+        self.assertTrue(aplicado, resultados)
+
+        self.assertEqual(Lote.objects.aggregate(total=Sum('cantidad_total_peces'))['total'], 5900)
+        juveniles = Lote.objects.get(pk=self.juveniles.pk)
+        self.assertEqual(
+            (juveniles.jaula_id, juveniles.etapa_actual, juveniles.cantidad_total_peces, juveniles.peso_promedio_pez_gr),
+            (self.engorde.pk, 'ENGORDE', 900, Decimal(100)),
+        )
+        alevines = Lote.objects.get(pk=self.alevines.pk)
+        self.assertEqual(
+            (alevines.jaula_id, alevines.etapa_actual, alevines.cantidad_total_peces, alevines.peso_promedio_pez_gr),
+            (self.juvenil.pk, 'JUVENILES', 5000, Decimal(10)),
+        )
+        # La biomasa de cada jaula es la que se validó contra su capacidad
+        self.juvenil.refresh_from_db()
+        self.engorde.refresh_from_db()
+        self.assertEqual((self.juvenil.biomasa_actual_kg, self.engorde.biomasa_actual_kg), (50, 90))
+
+    def test_llegada_antes_de_la_salida(self):
+        self.comprobar_plan([self.movimiento(self.alevines, self.juvenil), self.movimiento(self.juveniles, self.engorde)])
+
+    def test_salida_antes_de_la_llegada(self):
+        self.comprobar_plan([self.movimiento(self.juveniles, self.engorde), self.movimiento(self.alevines, self.juvenil)])
 
-# Create your tests here.
+    def test_todo_o_nada(self):
+        # Si sólo salen 300 juveniles (30 kg) los alevines no caben: no se mueve nada
+        parcial = dict(self.movimiento(self.juveniles, self.engorde), cantidad=300)
+        aplicado, resultados = aplicar_plan_movimientos([parcial, self.movimiento(self.alevines, self.juvenil)])
+        self.assertFalse(aplicado)
+        self.assertEqual([r['ok'] for r in resultados], [False, False])
+        self.assertIn('No se aplicó', resultados[0]['mensaje'])
+        self.assertIn('supera su capacidad', resultados[1]['mensaje'])
+        self.assertEqual(
+            list(Lote.objects.order_by('pk').values_list('pk', 'cantidad_total_peces', 'artesa_id', 'jaula_id')),
+            [(self.juveniles.pk, 900, None, self.juvenil.pk), (self.alevines.pk, 5000, self.alevines.artesa_id, None)],
+        )
+        self.assertFalse(HistorialMovimiento.objects.exists())
@@ -0,0 +1,281 @@
+from decimal import Decimal
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from .crecimiento import invalidar_pronostico
+from .models import Artesa, Bastidor, HistorialMovimiento, Jaula, Lote, actualizar_contadores_biomasa, generar_codigos
+from .notificaciones import SECCION_COMERCIALIZACION, SECCION_PRODUCCION, invalidar_notificaciones
+from .signals import publicar_cambios_unidades
+from .ubicacion import (
+    DESTINO_REASIGNACION, DESTINO_SIGUIENTE_ETAPA, PESO_ESTANDAR_ALEVIN_GR, UNIDAD_ARTESA, UNIDAD_JAULA,
+)
+
+# ================================================================
+# PLAN DE MOVIMIENTOS EN BLOQUE (DÍA DE CLASIFICACIÓN)
+# ================================================================
+# Aplica un plan completo (por ejemplo el de sugerir_ubicacion) en una sola
+# transacción: los lotes y las unidades se leen y bloquean de una vez, la
+# capacidad se valida para todo el plan y los cambios se escriben con
+# bulk_update / bulk_create. Si un movimiento no es válido no se aplica
+# ninguno. Cada movimiento sigue las mismas reglas que las vistas de a uno:
+# si la unidad ya tiene un lote se fusiona con él (promedios ponderados), si
+# no se mueve el lote completo o se crea uno nuevo con la parte que se mueve.
+
+# Talla con la que las ovas pasan a artesa (igual que mover_lote_a_artesa)
+TALLA_ESTANDAR_ALEVIN_CM = Decimal('2.61')
+MODELOS_UNIDAD = {UNIDAD_ARTESA: Artesa, UNIDAD_JAULA: Jaula}
+CAMPOS_LOTE = [
+    'etapa_actual', 'cantidad_inicial', 'peso_promedio_inicial_gr', 'cantidad_total_peces',
+    'talla_min_cm', 'talla_max_cm', 'peso_promedio_pez_gr', 'bastidor', 'artesa', 'jaula', 'fecha_ingreso_etapa',
+]
+
+
+def _leer_movimientos(datos):
+    """Normaliza cada movimiento a (lote_id, destino, destino_id, cantidad o None) o un mensaje de error."""
+    movimientos = []
+    for item in datos:
+        try:
+            destino = item['destino']
+            if destino not in MODELOS_UNIDAD:
+                raise ValueError
+            cantidad = item.get('cantidad')
+            movimientos.append((
+                int(item['lote_id']), destino, int(item['destino_id']),
+                int(cantidad) if cantidad not in (None, '') else None,
+            ))
+        except (KeyError, TypeError, ValueError):
+            movimientos.append("Cada movimiento necesita lote_id, destino ('artesa' o 'jaula'), destino_id y opcionalmente cantidad.")
+    return movimientos
+
+
+def _peso_pez(lote):
+    # Las ovas llegan a la artesa con el peso estándar de alevín
+    return Decimal(str(PESO_ESTANDAR_ALEVIN_GR)) if lote.etapa_actual == 'OVAS' else (lote.peso_promedio_pez_gr or Decimal(0))
+
+
+def _promedio(cantidad_a, valor_a, cantidad_b, valor_b):
+    if valor_a is None or valor_b is None:
+        return valor_a if valor_b is None else valor_b
+    return (cantidad_a * valor_a + cantidad_b * valor_b) / (cantidad_a + cantidad_b)
+
+
+def _etapa_destino(etapa, destino, unidad):
+    """Etapa con la que llega el lote: la siguiente si la unidad es la de esa etapa."""
+    siguiente = DESTINO_SIGUIENTE_ETAPA[etapa]
+    return siguiente[2] if (destino, getattr(unidad, 'tipo', None)) == siguiente[:2] else etapa
+
+
+def _unidad_de(lote):
+    if lote.artesa_id:
+        return (UNIDAD_ARTESA, lote.artesa_id)
+    if lote.jaula_id:
+        return (UNIDAD_JAULA, lote.jaula_id)
+    return None
+
+
+def aplicar_plan_movimientos(datos, usuario=None):
+    """
+    `datos` es una lista de {lote_id, destino, destino_id, cantidad}; sin
+    cantidad se mueve lo que quede del lote. Devuelve (aplicado, resultados),
+    con un resultado por movimiento en el mismo orden.
+    """
+    movimientos = _leer_movimientos(datos)
+    resultados = [
+        {'indice': i, 'ok': False, 'mensaje': m} if isinstance(m, str) else
+        {'indice': i, 'lote_id': m[0], 'destino': m[1], 'destino_id': m[2], 'ok': True, 'mensaje': ''}
+        for i, m in enumerate(movimientos)
+    ]
+    validos = [(i, m) for i, m in enumerate(movimientos) if not isinstance(m, str)]
+    if not validos:
+        return False, resultados
+
+    def error(i, mensaje):
+        resultados[i]['ok'] = False
+        resultados[i]['mensaje'] = mensaje
+
+    with transaction.atomic():
+        # --- Lectura y bloqueo de todo lo que toca el plan ---
+        lotes = Lote.objects.select_for_update().filter(activo=True).in_bulk({m[0] for _, m in validos})
+        unidades = {}
+        for tipo, modelo in MODELOS_UNIDAD.items():
+            ids = {m[2] for _, m in validos if m[1] == tipo}
+            for unidad in modelo.objects.select_for_update().filter(pk__in=ids).order_by('pk'):
+                unidades[(tipo, unidad.pk)] = unidad
+        # Lotes que ya están en las unidades de destino
+        ocupados = [
+            lotes.setdefault(lote.pk, lote)
+            for lote in Lote.objects.select_for_update().filter(activo=True).filter(
+                Q(artesa_id__in=[pk for tipo, pk in unidades if tipo == UNIDAD_ARTESA])
+                | Q(jaula_id__in=[pk for tipo, pk in unidades if tipo == UNIDAD_JAULA])
+            ).order_by('pk')
+        ]
+
+        # --- Validación de cada movimiento y de la capacidad de todo el plan ---
+        restantes = {pk: lote.cantidad_total_peces for pk, lote in lotes.items()}
+        cantidades = {}
+        variacion_kg = {}
+        for i, (lote_id, destino, destino_id, cantidad) in validos:
+            lote = lotes.get(lote_id)
+            unidad = unidades.get((destino, destino_id))
+            if lote is None:
+                error(i, 'El lote no existe o no está activo.')
+                continue
+            if unidad is None:
+                error(i, f'La {destino} de destino no existe.')
+                continue
+            clave = (destino, getattr(unidad, 'tipo', None))
+            permitidos = [d[:2] for d in (DESTINO_SIGUIENTE_ETAPA.get(lote.etapa_actual), DESTINO_REASIGNACION.get(lote.etapa_actual)) if d]
+            if clave not in permitidos:
+                error(i, f'Un lote en etapa {lote.get_etapa_actual_display()} no puede ir a {unidad}.')
+                continue
+            if _unidad_de(lote) == (destino, destino_id):
+                error(i, f'El lote {lote.codigo_lote} ya está en {unidad}.')
+                continue
+            cantidad = restantes[lote_id] if cantidad is None else cantidad
+            if cantidad <= 0 or cantidad > restantes[lote_id]:
+                error(i, f'La cantidad a mover del lote {lote.codigo_lote} es inválida.')
+                continue
+            restantes[lote_id] -= cantidad
+            cantidades[i] = cantidad
+            biomasa = Decimal(cantidad) * _peso_pez(lote) / 1000
+            variacion_kg[(destino, destino_id)] = variacion_kg.get((destino, destino_id), 0) + biomasa
+            # La biomasa que sale de una unidad deja lugar para el resto del plan
+            if lote.etapa_actual != 'OVAS' and _unidad_de(lote):
+                origen = _unidad_de(lote)
+                variacion_kg[origen] = variacion_kg.get(origen, 0) - Decimal(cantidad) * _peso_pez(lote) / 1000
+
+        for (tipo, pk), unidad in unidades.items():
+            final = unidad.biomasa_actual_kg + variacion_kg.get((tipo, pk), 0)
+            if final > unidad.capacidad_maxima_kg:
+                for i, m in validos:
+                    if resultados[i]['ok'] and (m[1], m[2]) == (tipo, pk):
+                        error(i, (
+                            f"La biomasa final de {unidad} ({final:.2f} kg) supera su capacidad máxima "
+                            f"({unidad.capacidad_maxima_kg:.2f} kg)."
+                        ))
+
+        if not all(resultado['ok'] for resultado in resultados):
+            for resultado in resultados:
+                if resultado['ok']:
+                    resultado['mensaje'] = 'No se aplicó porque otros movimientos del plan tienen errores.'
+                    resultado['ok'] = False
+            return False, resultados
+
+        # --- Aplicación en memoria ---
+        # Los peces viajan con los valores que tenía su lote antes del plan, y
+        # todas las salidas se descuentan antes de las llegadas: el resultado no
+        # depende del orden de los movimientos y coincide con lo validado.
+        hoy = timezone.localdate()
+        originales = {
+            pk: (lote.etapa_actual, lote.peso_promedio_pez_gr, lote.talla_min_cm, lote.talla_max_cm, _unidad_de(lote))
+            for pk, lote in lotes.items()
+        }
+        for i, (lote_id, _, _, _) in validos:
+            lotes[lote_id].cantidad_total_peces -= cantidades[i]
+        # Cada unidad se fusiona con el primer lote que se queda en ella (como las vistas)
+        ocupantes = {}
+        for lote in ocupados:
+            if lote.cantidad_total_peces:
+                ocupantes.setdefault(_unidad_de(lote), lote)
+
+        modificados, nuevos, historial = {}, [], []
+        unidades_afectadas = set()
+        bastidores_liberados = set()
+        reubicados = set()
+        for i, (lote_id, destino, destino_id, _) in validos:
+            lote, unidad, cantidad = lotes[lote_id], unidades[(destino, destino_id)], cantidades[i]
+            etapa_origen, peso, talla_min, talla_max, origen = originales[lote_id]
+            etapa = _etapa_destino(etapa_origen, destino, unidad)
+            unidades_afectadas.update([origen, (destino, destino_id)])
+            # Las ovas llegan a la artesa con el peso y la talla estándar de alevín
+            if etapa_origen == 'OVAS':
+                peso = Decimal(str(PESO_ESTANDAR_ALEVIN_GR))
+                talla_min = talla_max = TALLA_ESTANDAR_ALEVIN_CM
+
+            ocupante = ocupantes.get((destino, destino_id))
+            if ocupante is not None:
+                # Fusión con el lote que queda o ya llegó a la unidad
+                previos = ocupante.cantidad_total_peces
+                ocupante.peso_promedio_pez_gr = _promedio(previos, ocupante.peso_promedio_pez_gr, cantidad, peso)
+                ocupante.talla_min_cm = _promedio(previos, ocupante.talla_min_cm, cantidad, talla_min)
+                ocupante.talla_max_cm = _promedio(previos, ocupante.talla_max_cm, cantidad, talla_max)
+                ocupante.cantidad_total_peces = previos + cantidad
+                receptor, forma = ocupante, 'fusion'
+            elif lote.cantidad_total_peces == 0 and lote_id not in reubicados:
+                # El lote se va entero: conserva su código en la primera unidad vacía que recibe
+                if lote.bastidor_id:
+                    bastidores_liberados.add(lote.bastidor_id)
+                lote.bastidor = None
+                lote.artesa_id = destino_id if destino == UNIDAD_ARTESA else None
+                lote.jaula_id = destino_id if destino == UNIDAD_JAULA else None
+                lote.cantidad_total_peces = cantidad
+                lote.peso_promedio_pez_gr, lote.talla_min_cm, lote.talla_max_cm = peso, talla_min, talla_max
+                lote.fecha_ingreso_etapa = hoy
+                if etapa != etapa_origen:
+                    # Los valores iniciales son los del comienzo de la etapa actual
+                    lote.etapa_actual = etapa
+                    lote.cantidad_inicial = cantidad
+                    lote.peso_promedio_inicial_gr = peso or Decimal('0.00')
+                reubicados.add(lote_id)
+                receptor, forma = lote, 'completo'
+            else:
+                # Parte del lote a una unidad vacía: lote nuevo
+                receptor = Lote(
+                    etapa_actual=etapa,
+                    cantidad_inicial=cantidad,
+                    cantidad_total_peces=cantidad,
+                    peso_promedio_inicial_gr=peso or Decimal('0.00'),
+                    peso_promedio_pez_gr=peso,
+                    talla_min_cm=talla_min,
+                    talla_max_cm=talla_max,
+                    artesa_id=destino_id if destino == UNIDAD_ARTESA else None,
+                    jaula_id=destino_id if destino == UNIDAD_JAULA else None,
+                    fecha_ingreso_etapa=hoy,
+                )
+                nuevos.append(receptor)
+                forma = 'nuevo'
+            ocupantes[(destino, destino_id)] = receptor
+
+            modificados[lote.pk] = lote
+            if receptor.pk:
+                modificados[receptor.pk] = receptor
+            historial.append((i, lote.codigo_lote, unidad, receptor, forma, cantidad))
+
+        # --- Escritura en bloque ---
+        if nuevos:
+            codigos = generar_codigos(Lote, 'codigo_lote', 'L', 3, cantidad=len(nuevos))
+            for lote, codigo in zip(nuevos, codigos):
+                lote.codigo_lote = codigo
+            Lote.objects.bulk_create(nuevos)
+        vacios = [pk for pk, lote in modificados.items() if lote.cantidad_total_peces == 0]
+        bastidores_liberados.update(modificados[pk].bastidor_id for pk in vacios if modificados[pk].bastidor_id)
+        Lote.objects.bulk_update([lote for pk, lote in modificados.items() if pk not in vacios], CAMPOS_LOTE)
+        # Igual que en las vistas de a uno, el lote que queda sin peces se elimina
+        if vacios:
+            Lote.objects.filter(pk__in=vacios).delete()
+        if bastidores_liberados:
+            Bastidor.objects.filter(pk__in=bastidores_liberados).update(esta_disponible=True)
+        # Las descripciones se arman ahora que los lotes nuevos tienen código
+        autor = f" Registrado por: {usuario.username}" if usuario else ""
+        registros = []
+        for i, codigo, unidad, receptor, forma, cantidad in historial:
+            descripcion = f"{cantidad} peces movidos de {codigo} a {unidad}"
+            if forma == 'fusion':
+                descripcion += f" y fusionados con el lote {receptor.codigo_lote}"
+            elif forma == 'nuevo':
+                descripcion += f" como lote nuevo {receptor.codigo_lote}"
+            resultados[i].update({'cantidad': cantidad, 'mensaje': f"{descripcion}.", 'lote_resultante': receptor.codigo_lote})
+            if receptor.pk not in vacios:
+                registros.append(HistorialMovimiento(
+                    lote=receptor, tipo_movimiento='MOVIMIENTO', descripcion=f"{descripcion}.{autor}"[:255], cantidad_afectada=cantidad,
+                ))
+        HistorialMovimiento.objects.bulk_create(registros)
+
+        # bulk_update no dispara las señales de Lote: contadores y avisos se actualizan aquí
+        artesa_ids = [pk for tipo, pk in filter(None, unidades_afectadas) if tipo == UNIDAD_ARTESA]
+        jaula_ids = [pk for tipo, pk in filter(None, unidades_afectadas) if tipo == UNIDAD_JAULA]
+        actualizar_contadores_biomasa(artesa_ids=artesa_ids, jaula_ids=jaula_ids)
+        publicar_cambios_unidades(bastidor_ids=bastidores_liberados, artesa_ids=artesa_ids, jaula_ids=jaula_ids)
+        transaction.on_commit(lambda: invalidar_notificaciones(SECCION_PRODUCCION, SECCION_COMERCIALIZACION))
+        transaction.on_commit(invalidar_pronostico)
+    return True, resultados
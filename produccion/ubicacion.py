@@ -0,0 +1,279 @@
+import heapq
+from bisect import bisect_left, insort
+from dataclasses import dataclass, field
+from .models import Artesa, Jaula, Lote
+
+# ================================================================
+# PLAN DE UBICACIÓN DE LOTES EN ARTESAS Y JAULAS
+# ================================================================
+# Heurística best-fit decreasing con divisiones: los lotes se ubican de mayor
+# a menor biomasa en la unidad cuya capacidad libre mejor se ajusta (la más
+# chica en la que entra completo). Si ninguna alcanza, el lote se divide
+# llenando primero las unidades con más espacio libre, así se usan las menos
+# partes posibles. La capacidad libre es capacidad_maxima_kg (volumen ×
+# densidad de siembra) menos la biomasa actual; en las unidades que dejan los
+# lotes del plan se libera la biomasa de los peces que efectivamente salen, y
+# una unidad que se vacía cuenta como libre (los movimientos salen ordenados:
+# primero las salidas).
+
+PESO_ESTANDAR_ALEVIN_GR = 0.20
+
+UNIDAD_ARTESA = 'artesa'
+UNIDAD_JAULA = 'jaula'
+
+# Destino de cada etapa: (unidad, tipo de jaula, etapa al llegar)
+DESTINO_SIGUIENTE_ETAPA = {
+    'OVAS': (UNIDAD_ARTESA, None, 'ALEVINES'),
+    'ALEVINES': (UNIDAD_JAULA, 'JUVENIL', 'JUVENILES'),
+    'JUVENILES': (UNIDAD_JAULA, 'ENGORDE', 'ENGORDE'),
+    'ENGORDE': (UNIDAD_JAULA, 'ENGORDE', 'ENGORDE'),
+}
+DESTINO_REASIGNACION = {
+    'ALEVINES': (UNIDAD_ARTESA, None, 'ALEVINES'),
+    'JUVENILES': (UNIDAD_JAULA, 'JUVENIL', 'JUVENILES'),
+    'ENGORDE': (UNIDAD_JAULA, 'ENGORDE', 'ENGORDE'),
+}
+
+
+@dataclass
+class _Unidades:
+    """Unidades de un mismo tipo con su capacidad libre ordenada para búsquedas binarias."""
+    filas: list
+    libres: list = field(default_factory=list)
+
+    def __post_init__(self):
+        self.libres = sorted((fila['libre_kg'], i) for i, fila in enumerate(self.filas))
+
+    def liberar(self, unidad_id, biomasa):
+        for k, (libre, i) in enumerate(self.libres):
+            if self.filas[i]['id'] == unidad_id:
+                del self.libres[k]
+                self.filas[i]['libre_kg'] = libre + biomasa
+                insort(self.libres, (libre + biomasa, i))
+                return
+
+    def mejor_ajuste(self, biomasa, excluir):
+        """Posición de la unidad más chica con `biomasa` libre, o None."""
+        k = bisect_left(self.libres, (biomasa, -1))
+        while k < len(self.libres) and self.filas[self.libres[k][1]]['id'] == excluir:
+            k += 1
+        return k if k < len(self.libres) else None
+
+    def mayor(self, excluir):
+        k = len(self.libres) - 1
+        while k >= 0 and self.filas[self.libres[k][1]]['id'] == excluir:
+            k -= 1
+        return k if k >= 0 else None
+
+    def ocupar(self, k, biomasa):
+        libre, i = self.libres.pop(k)
+        self.filas[i]['libre_kg'] = libre - biomasa
+        insort(self.libres, (libre - biomasa, i))
+        return self.filas[i]
+
+
+def _filas_unidades(tipo_unidad, tipo_jaula):
+    if tipo_unidad == UNIDAD_ARTESA:
+        queryset = Artesa.objects.all()
+    else:
+        queryset = Jaula.objects.filter(tipo=tipo_jaula)
+    return [
+        {'id': pk, 'codigo': codigo, 'libre_kg': float(capacidad - biomasa), 'peces': peces}
+        for pk, codigo, capacidad, biomasa, peces in queryset.order_by('pk').values_list(
+            'pk', 'codigo', 'capacidad_maxima_kg', 'biomasa_actual_kg', 'cantidad_peces_actual'
+        )
+    ]
+
+
+def _biomasa(lote):
+    # Las ovas pasan a artesa con el peso estándar de alevín (igual que mover_lote_a_artesa)
+    peso = PESO_ESTANDAR_ALEVIN_GR if lote.etapa_actual == 'OVAS' else float(lote.peso_promedio_pez_gr or 0)
+    return lote.cantidad_total_peces * peso / 1000
+
+
+def _origen(lote):
+    if lote.artesa_id:
+        return (UNIDAD_ARTESA, lote.artesa_id)
+    if lote.jaula_id:
+        return (UNIDAD_JAULA, lote.jaula_id)
+    return None
+
+
+def _salidas_primero(movimientos):
+    """
+    Ordena los movimientos para que un lote salga de su unidad antes de que
+    otro llegue a ella (orden topológico). Si dos lotes se cambian de unidad
+    entre sí se respeta el orden original.
+    """
+    salidas = {}
+    for k, movimiento in enumerate(movimientos):
+        if movimiento['origen']:
+            salidas.setdefault(movimiento['origen'], []).append(k)
+    pendientes = [0] * len(movimientos)
+    siguientes = {}
+    for k, movimiento in enumerate(movimientos):
+        for j in salidas.get((movimiento['destino'], movimiento['destino_id']), []):
+            if movimientos[j]['lote_id'] != movimiento['lote_id']:
+                pendientes[k] += 1
+                siguientes.setdefault(j, []).append(k)
+
+    listos = [k for k, cantidad in enumerate(pendientes) if not cantidad]
+    heapq.heapify(listos)
+    hechos = [False] * len(movimientos)
+    orden = []
+    while len(orden) < len(movimientos):
+        k = heapq.heappop(listos) if listos else hechos.index(False)
+        if hechos[k]:
+            continue
+        hechos[k] = True
+        orden.append(movimientos[k])
+        for j in siguientes.get(k, []):
+            pendientes[j] -= 1
+            if not pendientes[j] and not hechos[j]:
+                heapq.heappush(listos, j)
+    return orden
+
+
+def _resolver(por_destino, salientes, salen, filas):
+    """
+    Ubica los lotes de `por_destino` liberando antes, en la unidad de cada
+    lote saliente, la biomasa de los `salen[lote.pk]` peces que dejan la
+    unidad. `filas` guarda las unidades ya leídas para no repetir consultas.
+    Devuelve (conjuntos, movimientos, sin_ubicar, divisiones).
+    """
+    # Etapas con el mismo tipo de destino comparten unidades (y su capacidad libre)
+    conjuntos = {}
+    movimientos = []
+    sin_ubicar = []
+    divisiones = 0
+    for (tipo_unidad, tipo_jaula, etapa_destino), grupo in por_destino.items():
+        unidades = conjuntos.get((tipo_unidad, tipo_jaula))
+        if unidades is None:
+            if (tipo_unidad, tipo_jaula) not in filas:
+                filas[(tipo_unidad, tipo_jaula)] = _filas_unidades(tipo_unidad, tipo_jaula)
+            unidades = conjuntos[(tipo_unidad, tipo_jaula)] = _Unidades(
+                [dict(fila) for fila in filas[(tipo_unidad, tipo_jaula)]]
+            )
+            for lote in salientes:
+                if _origen(lote)[0] == tipo_unidad:
+                    unidades.liberar(_origen(lote)[1], salen[lote.pk] * float(lote.peso_promedio_pez_gr) / 1000)
+
+        for lote in sorted(grupo, key=_biomasa, reverse=True):
+            biomasa = _biomasa(lote)
+            biomasa_pez = biomasa / lote.cantidad_total_peces
+            origen = _origen(lote)
+            actual = origen[1] if origen and origen[0] == tipo_unidad else None
+            restantes = lote.cantidad_total_peces
+            partes = []
+            while restantes:
+                k = unidades.mejor_ajuste(restantes * biomasa_pez, excluir=actual)
+                if k is not None:
+                    cantidad = restantes
+                else:
+                    # No entra completo: se llena la unidad con más espacio
+                    k = unidades.mayor(excluir=actual)
+                    cantidad = int(unidades.filas[unidades.libres[k][1]]['libre_kg'] // biomasa_pez) if k is not None else 0
+                    if cantidad <= 0:
+                        break
+                unidad = unidades.ocupar(k, cantidad * biomasa_pez)
+                partes.append({
+                    'lote_id': lote.pk,
+                    'codigo': lote.codigo_lote,
+                    'origen': origen,
+                    'destino': tipo_unidad,
+                    'destino_id': unidad['id'],
+                    'destino_codigo': unidad['codigo'],
+                    'etapa_destino': etapa_destino,
+                    'cantidad': cantidad,
+                    'biomasa_kg': round(cantidad * biomasa_pez, 2),
+                })
+                restantes -= cantidad
+
+            movimientos.extend(partes)
+            divisiones += max(len(partes) - 1, 0)
+            if restantes:
+                sin_ubicar.append({
+                    'lote_id': lote.pk,
+                    'codigo': lote.codigo_lote,
+                    'cantidad': restantes,
+                    'motivo': 'No hay capacidad disponible para el resto del lote.',
+                })
+    return conjuntos, movimientos, sin_ubicar, divisiones
+
+
+def sugerir_ubicacion(lote_ids, reasignar=False):
+    """
+    Propone destinos para los lotes indicados: su siguiente etapa o, con
+    `reasignar`, otra unidad de la misma etapa. Cada movimiento trae la
+    cantidad de peces que va a cada unidad; un lote dividido aparece en
+    varios. Los movimientos vienen ordenados para que los lotes dejen su
+    unidad antes de que otros lleguen a ella. No modifica nada.
+    """
+    destinos = DESTINO_REASIGNACION if reasignar else DESTINO_SIGUIENTE_ETAPA
+    lotes = list(Lote.objects.filter(pk__in=lote_ids, activo=True).order_by('pk'))
+    encontrados = {lote.pk for lote in lotes}
+    sin_ubicar = [
+        {'lote_id': lote_id, 'motivo': 'El lote no existe o no está activo.'}
+        for lote_id in lote_ids if lote_id not in encontrados
+    ]
+
+    por_destino = {}
+    for lote in lotes:
+        destino = destinos.get(lote.etapa_actual)
+        if destino is None:
+            sin_ubicar.append({'lote_id': lote.pk, 'codigo': lote.codigo_lote, 'motivo': 'La etapa no admite este movimiento.'})
+        elif lote.etapa_actual != 'OVAS' and not lote.peso_promedio_pez_gr:
+            sin_ubicar.append({'lote_id': lote.pk, 'codigo': lote.codigo_lote, 'motivo': 'El lote no tiene peso promedio.'})
+        elif lote.cantidad_total_peces <= 0:
+            sin_ubicar.append({'lote_id': lote.pk, 'codigo': lote.codigo_lote, 'motivo': 'El lote no tiene peces.'})
+        else:
+            por_destino.setdefault(destino, []).append(lote)
+    # Lotes que salen de una artesa o jaula: la capacidad de los peces que se
+    # van queda libre para el resto del plan. Primero se supone que salen
+    # todos; si alguno no se ubica (o se ubica en parte) se resuelve de nuevo
+    # liberando sólo lo que sí sale, hasta que lo liberado y lo movido coinciden.
+    salientes = [lote for grupo in por_destino.values() for lote in grupo if _origen(lote)]
+    salen = {lote.pk: lote.cantidad_total_peces for lote in salientes}
+    filas = {}
+    while True:
+        conjuntos, movimientos, pendientes, divisiones = _resolver(por_destino, salientes, salen, filas)
+        movidos = {}
+        for movimiento in movimientos:
+            movidos[movimiento['lote_id']] = movidos.get(movimiento['lote_id'], 0) + movimiento['cantidad']
+        ajustes = {pk: movidos.get(pk, 0) for pk, cantidad in salen.items() if movidos.get(pk, 0) < cantidad}
+        if not ajustes:
+            break
+        salen.update(ajustes)
+    sin_ubicar.extend(pendientes)
+
+    # Una unidad queda ocupada si conserva peces de lotes que no se van del todo
+    # o si ya recibió un movimiento anterior del plan
+    peces = {
+        (tipo_unidad, fila['id']): fila['peces']
+        for (tipo_unidad, _), unidades in conjuntos.items() for fila in unidades.filas
+    }
+    for lote in salientes:
+        if _origen(lote) in peces:
+            peces[_origen(lote)] -= salen[lote.pk]
+    ocupadas = {clave for clave, cantidad in peces.items() if cantidad > 0}
+    movimientos = _salidas_primero(movimientos)
+    for movimiento in movimientos:
+        clave = (movimiento['destino'], movimiento['destino_id'])
+        movimiento['destino_ocupado'] = clave in ocupadas
+        ocupadas.add(clave)
+        movimiento.pop('origen')
+
+    usadas = {(m['destino'], m['destino_id']) for m in movimientos}
+    sobrante = sum(
+        fila['libre_kg']
+        for (tipo_unidad, _), unidades in conjuntos.items() for fila in unidades.filas
+        if (tipo_unidad, fila['id']) in usadas
+    )
+    return {
+        'movimientos': movimientos,
+        'sin_ubicar': sin_ubicar,
+        'divisiones': divisiones,
+        'unidades_usadas': len(usadas),
+        # Capacidad que queda libre en las unidades que recibe el plan
+        'capacidad_sobrante_kg': round(sobrante, 2),
+    }
@@ -31,6 +31,7 @@ urlpatterns = [
     # API general
     path('api/unidad/<str:tipo_unidad>/<int:pk>/', views.unidad_detail_json, name='unidad-detail-json'),
     path('api/notifications/', views.get_notifications_json, name='get-notifications-json'),
+    path('eventos/', views.eventos_stream, name='eventos-stream'),
     
     # API Acciones comunes para Lotes
     path('api/lote/<int:pk>/definir_talla/', views.lote_definir_talla_json, name='lote-definir-talla'),
@@ -55,6 +56,8 @@ urlpatterns = [
     # API Lógica de Reasignación en Jaulas
     path('api/otras_jaulas_disponibles/<int:lote_id_origen>/', views.listar_otras_jaulas_disponibles_json, name='listar-otras-jaulas-disponibles'),
     path('api/lote/<int:lote_origen_id>/reasignar_engorde/', views.reasignar_engorde_json, name='reasignar-engorde'),
+    path('api/ubicacion/sugerir/', views.sugerir_plan_ubicacion_json, name='sugerir-plan-ubicacion'),
+    path('api/ubicacion/aplicar/', views.aplicar_plan_movimientos_json, name='aplicar-plan-movimientos'),
     
     # --- URLs de Reportes y Dashboards ---
     path('historial/', views.HistorialTrazabilidadView.as_view(), name='historial-trazabilidad'),
@@ -62,6 +65,8 @@ urlpatterns = [
     path('api/dashboard-data/', views.dashboard_data_json, name='dashboard-data-json'),
     path('analitico/', views.dashboard_analitico, name='dashboard-analitico'),
     path('reportes/exportar-lotes/', views.exportar_lotes_excel, name='exportar-lotes-excel'),
+    path('reportes/trabajos/<int:pk>/', views.estado_reporte, name='reporte-estado'),
+    path('reportes/trabajos/<int:pk>/descargar/', views.descargar_reporte, name='reporte-descargar'),
 
     # --- URLs Módulo de Salud y Predicción por IA (SECCIÓN CORREGIDA) ---
     
@@ -73,7 +78,13 @@ urlpatterns = [
     
     # 3. ¡EL NUEVO! El sistema de diagnóstico por lote con IA
     path('salud/diagnostico/', views.diagnostico_por_lote_view, name='prediccion_diagnostico'),
+
+    # 4. Tabla de riesgo de todos los lotes activos (diagnóstico masivo)
+    path('salud/riesgo/', views.riesgo_sanitario_view, name='riesgo-sanitario'),
     
     path('api/lote/<int:lote_id>/get_condiciones/', views.get_condiciones_json, name='get-condiciones-json'),
     path('api/lote/<int:lote_id>/save_condiciones/', views.save_condiciones_json, name='save-condiciones-json'),
+    path('api/unidad/<str:tipo>/<int:pk>/condiciones/', views.serie_condiciones_json, name='serie-condiciones-json'),
+    path('api/sensores/lecturas/', views.ingresar_lecturas_sensores, name='sensores-lecturas'),
+    path('api/pronostico/crecimiento/', views.pronostico_crecimiento_json, name='pronostico-crecimiento-json'),
 ]
\ No newline at end of file
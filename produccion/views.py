@@ -1,23 +1,40 @@
 from django.shortcuts import render, get_object_or_404, redirect
-from django.urls import reverse_lazy
+from django.urls import reverse, reverse_lazy
 from django.db.models import F, Q, Sum, Value, FloatField, ExpressionWrapper, fields
 from django.db.models.functions import Coalesce
-from django.http import JsonResponse, HttpResponseRedirect
+from django.http import JsonResponse, HttpResponseRedirect, StreamingHttpResponse
+from django.core.handlers.asgi import ASGIRequest
+from asgiref.sync import sync_to_async
+import asyncio
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin, PermissionRequiredMixin
 from django.views.generic import ListView, CreateView, UpdateView, DeleteView, View
 from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import quote_etag
 from django.db import transaction
-from datetime import time, timedelta
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
+import hmac
+import json
+from datetime import datetime, time, timedelta
+from django.utils.dateparse import parse_date, parse_datetime
 from django.http import HttpResponse
-import openpyxl
 from django.db.models.functions import TruncDay
 from django.contrib.contenttypes.models import ContentType
 from django.apps import apps
 from .forms import DiagnosticoForm
 from .models import Enfermedad
-from .models import Bastidor, Artesa, Jaula, Lote, RegistroDiario, RegistroMortalidad, HistorialMovimiento,RegistroUnidad
+from .models import Bastidor, Artesa, Jaula, Lote, RegistroDiario, RegistroMortalidad, HistorialMovimiento,RegistroUnidad, TrabajoReporte, generar_codigos
+from .reportes import parametros_periodo, respuesta_descarga, solicitar_reporte
+from .notificaciones import obtener_notificaciones, secciones_visibles
+from .condiciones_agua import FORMATO_CSV, FORMATO_NDJSON, ingresar_lecturas, serie_condiciones
+from .crecimiento import HORIZONTE_DIAS, PESO_COSECHA_GR, pronostico_crecimiento
+from .ubicacion import sugerir_ubicacion
+from .transiciones import aplicar_plan_movimientos
+from usuarios.roles import tiene_grupo
+from .eventos import formatear_sse, obtener_broker
 import joblib
 from .forms import DiagnosticoForm
 from .ia.predictores.diagnostico_experto import SistemaExpertoSalud
@@ -35,6 +52,8 @@ from .models import RegistroCondiciones
 from .forms import RegistroCondicionesForm
 from .forms import DiagnosticoManualForm
 from .ia.diagnostico_service import DiagnosticoService
+from .ia.base_conocimiento import KNOWLEDGE_BASE
+from .ia.diagnostico_lotes import diagnosticar_lotes, resumen_por_nivel
 from decimal import Decimal
 from django.db.models import Avg, DecimalField
 from .ia.diagnostico_service import DiagnosticoService
@@ -58,7 +77,7 @@ from .forms import (
 
 class ProduccionPermissionMixin(LoginRequiredMixin, UserPassesTestMixin):
     def test_func(self):
-        return self.request.user.is_staff or self.request.user.groups.filter(name='Produccion').exists()
+        return self.request.user.is_staff or tiene_grupo(self.request.user, 'Produccion')
 
 @login_required
 def welcome_view(request):
@@ -177,8 +196,8 @@ class BastidorCreateView(ProduccionPermissionMixin, CreateView):
         cantidad = form.cleaned_data.get('cantidad_a_crear', 1)
         capacidad = form.cleaned_data['capacidad_maxima_unidades']
         with transaction.atomic():
-            for i in range(cantidad):
-                Bastidor.objects.create(capacidad_maxima_unidades=capacidad)
+            codigos = generar_codigos(Bastidor, 'codigo', 'B', 2, cantidad)
+            Bastidor.objects.bulk_create([Bastidor(codigo=codigo, capacidad_maxima_unidades=capacidad) for codigo in codigos])
         messages.success(self.request, f"{cantidad} bastidor(es) han sido creados con éxito.")
         return redirect(self.success_url)
 
@@ -218,8 +237,10 @@ class ArtesaCreateView(ProduccionPermissionMixin, CreateView):
     def form_valid(self, form):
         cantidad = form.cleaned_data.get('cantidad_a_crear', 1)
         with transaction.atomic():
-            for i in range(cantidad):
-                Artesa.objects.create(
+            artesas = []
+            for codigo in generar_codigos(Artesa, 'codigo', 'A', 2, cantidad):
+                artesa = Artesa(
+                    codigo=codigo,
                     forma=form.cleaned_data['forma'],
                     largo_m=form.cleaned_data.get('largo_m'),
                     ancho_m=form.cleaned_data.get('ancho_m'),
@@ -227,6 +248,9 @@ class ArtesaCreateView(ProduccionPermissionMixin, CreateView):
                     alto_m=form.cleaned_data.get('alto_m'),
                     densidad_siembra_kg_m3=form.cleaned_data['densidad_siembra_kg_m3'],
                 )
+                artesa.calcular_dimensiones()
+                artesas.append(artesa)
+            Artesa.objects.bulk_create(artesas)
         messages.success(self.request, f"{cantidad} artesa(s) han sido creadas con éxito.")
         return redirect(self.success_url)
 
@@ -283,8 +307,10 @@ class JaulaCreateView(ProduccionPermissionMixin, CreateView):
     def form_valid(self, form):
         cantidad = form.cleaned_data.get('cantidad_a_crear', 1)
         with transaction.atomic():
-            for i in range(cantidad):
-                Jaula.objects.create(
+            jaulas = []
+            for codigo in generar_codigos(Jaula, 'codigo', 'J', 2, cantidad):
+                jaula = Jaula(
+                    codigo=codigo,
                     tipo=form.cleaned_data['tipo'],
                     forma=form.cleaned_data['forma'],
                     largo_m=form.cleaned_data.get('largo_m'),
@@ -293,6 +319,9 @@ class JaulaCreateView(ProduccionPermissionMixin, CreateView):
                     alto_m=form.cleaned_data.get('alto_m'),
                     densidad_siembra_kg_m3=form.cleaned_data['densidad_siembra_kg_m3'],
                 )
+                jaula.calcular_dimensiones()
+                jaulas.append(jaula)
+            Jaula.objects.bulk_create(jaulas)
         messages.success(self.request, f"{cantidad} jaula(s) han sido creadas con éxito.")
         
         if form.cleaned_data['tipo'] == 'JUVENIL':
@@ -488,13 +517,11 @@ def listar_artesas_disponibles_json(request, lote_id_origen):
     else:
         biomasa_a_mover = float(lote_origen.biomasa_kg)
     artesas = Artesa.objects.annotate(
-        biomasa_actual_kg=Coalesce(Sum(F('lotes__cantidad_total_peces') * F('lotes__peso_promedio_pez_gr') / 1000.0), Value(0.0), output_field=FloatField())
-    ).annotate(
         biomasa_disponible_kg=ExpressionWrapper(F('capacidad_maxima_kg') - F('biomasa_actual_kg'), output_field=FloatField())
     ).filter(biomasa_disponible_kg__gte=biomasa_a_mover)
     if lote_origen.artesa:
         artesas = artesas.exclude(pk=lote_origen.artesa.pk)
-    data = [{'id': artesa.id, 'codigo': str(artesa), 'capacidad_maxima_kg': float(artesa.capacidad_maxima_kg), 'biomasa_actual_kg': round(artesa.biomasa_actual_kg, 2), 'biomasa_disponible_kg': round(artesa.biomasa_disponible_kg, 2)} for artesa in artesas]
+    data = [{'id': artesa.id, 'codigo': str(artesa), 'capacidad_maxima_kg': float(artesa.capacidad_maxima_kg), 'biomasa_actual_kg': float(artesa.biomasa_actual_kg), 'biomasa_disponible_kg': round(artesa.biomasa_disponible_kg, 2)} for artesa in artesas]
     return JsonResponse({'artesas': data, 'biomasa_a_mover': round(biomasa_a_mover, 2)}, safe=False)
 
 
@@ -542,6 +569,13 @@ def lote_definir_peso_json(request, pk):
         form = LotePesoForm(request.POST, instance=lote)
         if form.is_valid():
             form.save()
+            # Cada medición queda en el historial para el pronóstico de crecimiento
+            HistorialMovimiento.objects.create(
+                lote=lote,
+                tipo_movimiento='MEDICION',
+                descripcion=f"Peso promedio medido: {lote.peso_promedio_pez_gr} g. Registrado por: {request.user.username}",
+                peso_promedio_gr=lote.peso_promedio_pez_gr,
+            )
             lote.refresh_from_db()
             return JsonResponse({'success': True, 'nuevo_alimento': float(lote.alimento_diario_kg)})
         else:
@@ -554,14 +588,12 @@ def listar_jaulas_disponibles_json(request, lote_id):
     lote = get_object_or_404(Lote, pk=lote_id)
     lote_biomasa = float(lote.biomasa_kg)
     jaulas_qs = Jaula.objects.annotate(
-        biomasa_actual_kg=Coalesce(Sum(F('lotes__cantidad_total_peces') * F('lotes__peso_promedio_pez_gr') / 1000.0), Value(0.0), output_field=FloatField())
-    ).annotate(
         biomasa_disponible_kg=ExpressionWrapper(F('capacidad_maxima_kg') - F('biomasa_actual_kg'), output_field=FloatField())
     ).filter(
         tipo='JUVENIL',
         biomasa_disponible_kg__gte=lote_biomasa
     )
-    data = [{'id': jaula.id, 'codigo': str(jaula), 'capacidad_maxima_kg': float(jaula.capacidad_maxima_kg), 'biomasa_actual_kg': round(jaula.biomasa_actual_kg, 2), 'biomasa_disponible_kg': round(jaula.biomasa_disponible_kg, 2)} for jaula in jaulas_qs]
+    data = [{'id': jaula.id, 'codigo': str(jaula), 'capacidad_maxima_kg': float(jaula.capacidad_maxima_kg), 'biomasa_actual_kg': float(jaula.biomasa_actual_kg), 'biomasa_disponible_kg': round(jaula.biomasa_disponible_kg, 2)} for jaula in jaulas_qs]
     return JsonResponse({'jaulas': data, 'biomasa_a_mover': round(lote_biomasa, 2)}, safe=False)
 
 
@@ -571,8 +603,6 @@ def listar_jaulas_disponibles_engorde_json(request, lote_id):
     lote_biomasa = float(lote.biomasa_kg)
 
     jaulas_qs = Jaula.objects.annotate(
-        biomasa_actual_kg=Coalesce(Sum(F('lotes__cantidad_total_peces') * F('lotes__peso_promedio_pez_gr') / 1000.0), Value(0.0), output_field=FloatField())
-    ).annotate(
         biomasa_disponible_kg=ExpressionWrapper(F('capacidad_maxima_kg') - F('biomasa_actual_kg'), output_field=FloatField())
     ).filter(
         tipo='ENGORDE',
@@ -585,7 +615,7 @@ def listar_jaulas_disponibles_engorde_json(request, lote_id):
         'id': jaula.id, 
         'codigo': str(jaula),
         'capacidad_maxima_kg': float(jaula.capacidad_maxima_kg),
-        'biomasa_actual_kg': round(jaula.biomasa_actual_kg, 2),
+        'biomasa_actual_kg': float(jaula.biomasa_actual_kg),
         'biomasa_disponible_kg': round(jaula.biomasa_disponible_kg, 2)
     } for jaula in jaulas_qs]
     
@@ -601,7 +631,7 @@ def mover_lote_a_jaula(request, lote_id):
     if request.method == 'POST':
         lote_origen = get_object_or_404(Lote, pk=lote_id)
         jaula_destino_id = request.POST.get('jaula_destino') 
-        jaula_destino = get_object_or_404(Jaula, pk=jaula_destino_id)
+        jaula_destino = get_object_or_404(Jaula.objects.select_for_update(), pk=jaula_destino_id)
         
         lote_destino = jaula_destino.lotes.first() # Lote en la jaula de destino, si existe
         
@@ -682,7 +712,7 @@ def reasignar_alevines_json(request, lote_origen_id):
     if request.method == 'POST':
         lote_origen = get_object_or_404(Lote, pk=lote_origen_id)
         artesa_destino_id = request.POST.get('artesa_destino')
-        artesa_destino = get_object_or_404(Artesa, pk=artesa_destino_id)
+        artesa_destino = get_object_or_404(Artesa.objects.select_for_update(), pk=artesa_destino_id)
 
         # Buscar si ya existe un lote en la artesa de destino
         lote_destino = artesa_destino.lotes.first()
@@ -765,19 +795,53 @@ def listar_otras_jaulas_disponibles_json(request, lote_id_origen):
     lote_biomasa = float(lote_origen.biomasa_kg)
     
     queryset = Jaula.objects.annotate(
-        biomasa_actual_kg=Coalesce(Sum(F('lotes__cantidad_total_peces') * F('lotes__peso_promedio_pez_gr') / 1000.0), Value(0.0), output_field=FloatField())
-    ).annotate(
         biomasa_disponible_kg=ExpressionWrapper(F('capacidad_maxima_kg') - F('biomasa_actual_kg'), output_field=FloatField())
     )
 
     if lote_origen.jaula:
         queryset = queryset.exclude(pk=lote_origen.jaula.pk)
         
-    jaulas = [{'id': jaula.id, 'codigo': str(jaula), 'capacidad_maxima_kg': float(jaula.capacidad_maxima_kg), 'biomasa_actual_kg': round(jaula.biomasa_actual_kg, 2), 'biomasa_disponible_kg': round(jaula.biomasa_disponible_kg, 2)} for jaula in queryset]
+    jaulas = [{'id': jaula.id, 'codigo': str(jaula), 'capacidad_maxima_kg': float(jaula.capacidad_maxima_kg), 'biomasa_actual_kg': float(jaula.biomasa_actual_kg), 'biomasa_disponible_kg': round(jaula.biomasa_disponible_kg, 2)} for jaula in queryset]
     
     return JsonResponse({'jaulas': jaulas, 'biomasa_a_mover': round(lote_biomasa, 2)}, safe=False)
 
 
+@login_required
+def sugerir_plan_ubicacion_json(request):
+    """
+    Plan sugerido para mover varios lotes (?lotes=1,2,3): a su siguiente
+    etapa o, con ?reasignar=1, a otra unidad de la misma etapa. Respeta la
+    capacidad libre de cada unidad y divide los lotes solo si no entran.
+    """
+    try:
+        lote_ids = [int(pk) for pk in request.GET.get('lotes', '').split(',') if pk.strip()]
+    except ValueError:
+        return JsonResponse({'error': 'Los lotes deben ser ids separados por comas.'}, status=400)
+    if not lote_ids:
+        return JsonResponse({'error': 'Indique al menos un lote.'}, status=400)
+    return JsonResponse(sugerir_ubicacion(lote_ids, reasignar=request.GET.get('reasignar') == '1'))
+
+
+@login_required
+@require_POST
+def aplicar_plan_movimientos_json(request):
+    """
+    Aplica un plan de movimientos enviado como JSON: {"movimientos": [{lote_id,
+    destino, destino_id, cantidad}, ...]}. Se aplica todo o nada y se devuelve
+    el resultado de cada movimiento.
+    """
+    try:
+        movimientos = json.loads(request.body or b'{}').get('movimientos')
+    except (ValueError, AttributeError):
+        movimientos = None
+    if not isinstance(movimientos, list) or not movimientos:
+        return JsonResponse({'error': 'Envíe un JSON con la lista de movimientos.'}, status=400)
+    aplicado, resultados = aplicar_plan_movimientos(movimientos, usuario=request.user)
+    if not aplicado:
+        return JsonResponse({'error': 'El plan no se aplicó.', 'resultados': resultados}, status=400)
+    return JsonResponse({'success': True, 'resultados': resultados})
+
+
 @login_required
 @transaction.atomic
 def reasignar_engorde_json(request, lote_origen_id):
@@ -787,7 +851,7 @@ def reasignar_engorde_json(request, lote_origen_id):
     if request.method == 'POST':
         lote_origen = get_object_or_404(Lote, pk=lote_origen_id)
         jaula_destino_id = request.POST.get('jaula_destino')
-        jaula_destino = get_object_or_404(Jaula, pk=jaula_destino_id)
+        jaula_destino = get_object_or_404(Jaula.objects.select_for_update(), pk=jaula_destino_id)
         
         # Asumiendo que una jaula solo puede tener un lote
         lote_destino = jaula_destino.lotes.first()
@@ -921,78 +985,68 @@ def reasignar_engorde_json(request, lote_origen_id):
 
 @login_required
 def get_notifications_json(request):
-    notifications = []
-    now = timezone.now()
-    
-    # --- Notificaciones de Producción (Tu código original) ---
-    if request.user.groups.filter(name='Produccion').exists() or request.user.is_staff:
-        
-        lotes_ovas_vencidos = Lote.objects.filter(
-            etapa_actual='OVAS',
-            fecha_ingreso_etapa__lte=now.date() - timedelta(days=15)
-        )
-        for lote in lotes_ovas_vencidos:
-            notifications.append({
-                'area': 'Producción',
-                'message': f"El lote {lote.codigo_lote} en {lote.bastidor} debe ser movido a artesa.",
-                'url': reverse_lazy('bastidor-list')
-            })
-
-        alevines_para_juvenil = Lote.objects.filter(
-            etapa_actual='ALEVINES',
-            talla_max_cm__gte=8
-        )
-        for lote in alevines_para_juvenil:
-            notifications.append({
-                'area': 'Producción',
-                'message': f"El lote {lote.codigo_lote} en {lote.artesa} está listo para mover a jaula de juveniles.",
-                'url': reverse_lazy('artesa-list')
-            })
-
-        juveniles_para_engorde = Lote.objects.filter(
-            etapa_actual='JUVENILES',
-            talla_max_cm__gte=15
-        )
-        for lote in juveniles_para_engorde:
-            notifications.append({
-                'area': 'Producción',
-                'message': f"El lote {lote.codigo_lote} en {lote.jaula} está listo para mover a jaula de engorde.",
-                'url': reverse_lazy('juvenil-list')
-            })
+    """
+    Notificaciones del usuario según sus grupos. El feed sale de la caché
+    (ver produccion.notificaciones) y se responde 304 si no cambió desde la
+    última consulta del navegador (ETag / If-None-Match).
+    """
+    notifications, etag = obtener_notificaciones(secciones_visibles(request.user))
+    etag = quote_etag(etag)
+
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = JsonResponse(notifications, safe=False)
+    response['ETag'] = etag
+    # El navegador guarda la respuesta pero la revalida en cada consulta
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
 
-    # --- Notificaciones de Comercialización (Tu código original) ---
-    if request.user.groups.filter(name__in=['Comercializacion', 'Produccion']).exists() or request.user.is_staff:
-        lotes_para_venta = Lote.objects.filter(
-            etapa_actual='ENGORDE',
-            talla_max_cm__gte=25
-        )
-        for lote in lotes_para_venta:
-            notifications.append({
-                'area': 'Comercialización',
-                'message': f"El lote {lote.codigo_lote} en {lote.jaula} está listo para la venta.",
-                'url': reverse_lazy('engorde-list')
-            })
+async def eventos_stream(request):
+    """
+    Canal de server-sent events: envía el feed de notificaciones cuando
+    cambia y los cambios de unidades y tareas a medida que ocurren, en lugar
+    de que cada pestaña consulte periódicamente. Requiere un servidor ASGI
+    (p. ej. `uvicorn sierra_nevada.asgi:application`); con WSGI responde 204
+    y el navegador sigue consultando get_notifications_json.
+    """
+    user = await request.auser()
+    if not user.is_authenticated:
+        return HttpResponse(status=401)
+    if not isinstance(request, ASGIRequest):
+        return HttpResponse(status=204)
+
+    secciones = await sync_to_async(secciones_visibles)(user)
+    response = StreamingHttpResponse(_flujo_eventos(secciones), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # nginx no debe acumular el flujo
+    return response
 
-    # ==========================================================
-    # INICIO DE LA MODIFICACIÓN (Añadir Alertas de Logística)
-    # ==========================================================
-    if (request.user.groups.filter(name='Logistica').exists() or request.user.is_staff) and Insumo is not None:
-        
-        # Buscar insumos con stock por debajo del mínimo
-        # (Usamos F para comparar dos campos del modelo)
-        alertas_stock = Insumo.objects.filter(stock_actual__lt=F('stock_minimo'))
-        
-        for insumo in alertas_stock:
-            notifications.append({
-                'area': 'Logística',
-                'message': f"¡Stock bajo! {insumo.nombre} (Actual: {insumo.stock_actual})",
-                'url': reverse_lazy('inventario-list') # URL del inventario de logística
-            })
-    # ==========================================================
-    # FIN DE LA MODIFICACIÓN
-    # ==========================================================
 
-    return JsonResponse(notifications, safe=False)
+async def _flujo_eventos(secciones):
+    broker = obtener_broker()
+    cola = broker.suscribir()
+    try:
+        notifications, etag = await sync_to_async(obtener_notificaciones)(secciones)
+        yield formatear_sse('notificaciones', notifications, etag)
+        while True:
+            try:
+                evento = await asyncio.wait_for(cola.get(), timeout=settings.EVENTOS_KEEPALIVE_SEGUNDOS)
+            except asyncio.TimeoutError:
+                yield ": ping\n\n"  # comentario SSE para que los proxies no corten la conexión
+                continue
+
+            if evento['tipo'] == 'notificaciones':
+                if not set(evento['datos']['secciones']) & set(secciones):
+                    continue
+                # El feed recalculado queda en caché y lo comparten todas las conexiones
+                notifications, nuevo_etag = await sync_to_async(obtener_notificaciones)(secciones)
+                if nuevo_etag != etag:
+                    etag = nuevo_etag
+                    yield formatear_sse('notificaciones', notifications, etag)
+            else:
+                yield formatear_sse(evento['tipo'], evento['datos'])
+    finally:
+        broker.desuscribir(cola)
 
 @login_required
 @transaction.atomic
@@ -1003,7 +1057,7 @@ def mover_lote_a_jaula_engorde(request, lote_id):
     if request.method == 'POST':
         lote_origen = get_object_or_404(Lote, pk=lote_id)
         jaula_destino_id = request.POST.get('jaula_destino')
-        jaula_destino = get_object_or_404(Jaula, pk=jaula_destino_id)
+        jaula_destino = get_object_or_404(Jaula.objects.select_for_update(), pk=jaula_destino_id)
         
         cantidad_str = request.POST.get('cantidad')
         if not cantidad_str:
@@ -1056,7 +1110,7 @@ class HistorialTrazabilidadView(ProduccionPermissionMixin, ListView):
         # La consulta base solo filtra los lotes
         queryset = Lote.objects.filter(
             etapa_actual__in=['ALEVINES', 'JUVENILES', 'ENGORDE']
-        ).prefetch_related('registros_mortalidad').order_by('-fecha_ingreso_etapa')
+        ).with_kpis().order_by('-fecha_ingreso_etapa')
         
         year = self.request.GET.get('year')
         month = self.request.GET.get('month')
@@ -1071,18 +1125,13 @@ class HistorialTrazabilidadView(ProduccionPermissionMixin, ListView):
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         
-        # --- LÓGICA DE CÁLCULO MEJORADA ---
-        # Preparamos una lista con todos los datos ya calculados en Python
+        # Los KPIs ya vienen anotados por with_kpis() en la misma consulta
         lotes_procesados = []
         for lote in context['lotes_data']:
-            peces_muertos = lote.registros_mortalidad.aggregate(total=Coalesce(Sum('cantidad'), 0))['total']
-            cantidad_inicial = lote.cantidad_total_peces + peces_muertos
-            porc_mort = (peces_muertos / cantidad_inicial) * 100 if cantidad_inicial > 0 else 0
-            
             lotes_procesados.append({
                 'lote': lote,
-                'peces_muertos': peces_muertos,
-                'porc_mort': round(porc_mort, 2)
+                'peces_muertos': lote.kpi_peces_muertos,
+                'porc_mort': lote.kpi_porcentaje_mortalidad
             })
         
         context['lotes_data'] = lotes_procesados # Reemplazamos la lista original por la procesada
@@ -1102,39 +1151,7 @@ class HistorialTrazabilidadView(ProduccionPermissionMixin, ListView):
 
 @login_required
 def exportar_historial_excel(request):
-    queryset = HistorialMovimiento.objects.select_related('lote')
-    year = request.GET.get('year')
-    month = request.GET.get('month')
-    if year:
-        queryset = queryset.filter(fecha__year=year)
-    if month:
-        queryset = queryset.filter(fecha__month=month)
-
-    workbook = openpyxl.Workbook()
-    sheet = workbook.active
-    sheet.title = "Historial de Trazabilidad"
-
-    headers = ["Fecha", "Lote", "Tipo de Movimiento", "Descripción", "Cantidad Afectada"]
-    sheet.append(headers)
-
-    for item in queryset:
-        # --- LÍNEA CORREGIDA ---
-        # Hacemos que la fecha sea "naive" (sin zona horaria) antes de guardarla
-        fecha_sin_tz = timezone.make_naive(item.fecha)
-        
-        sheet.append([
-            fecha_sin_tz, # <-- Se usa la nueva variable
-            item.lote.codigo_lote,
-            item.get_tipo_movimiento_display(),
-            item.descripcion,
-            item.cantidad_afectada
-        ])
-
-    response = HttpResponse(content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
-    response['Content-Disposition'] = 'attachment; filename="historial_trazabilidad.xlsx"'
-    workbook.save(response)
-
-    return response
+    return solicitar_reporte(request, 'historial', parametros_periodo(request))
 
 def dashboard_data_json(request):
     # 1. Obtener el año y mes de la petición. Usar los actuales si no se proveen.
@@ -1149,17 +1166,15 @@ def dashboard_data_json(request):
     # --- Preparamos los datos para cada gráfico ---
     
     # 1. Datos para Progreso de Biomasa (Lotes activos en el mes/año)
-    lotes_activos = Lote.objects.filter(activo=True, fecha_ingreso_etapa__year__lte=year, fecha_ingreso_etapa__month__lte=month)
+    lotes_activos = Lote.objects.filter(activo=True, fecha_ingreso_etapa__year__lte=year, fecha_ingreso_etapa__month__lte=month).with_kpis()
     biomasa_progreso_data = []
     for lote in lotes_activos:
-        dias_en_etapa = (timezone.now().date() - lote.fecha_ingreso_etapa).days
-        biomasa_kg = (lote.peso_promedio_pez_gr * lote.cantidad_total_peces) / 1000 if lote.peso_promedio_pez_gr and lote.cantidad_total_peces else 0
         biomasa_progreso_data.append({
             'lote': lote.codigo_lote,
             'etapa': lote.etapa_actual,
-            'dias': dias_en_etapa,
+            'dias': lote.kpi_dias_en_etapa,
             'peso_gr': lote.peso_promedio_pez_gr or 0,
-            'biomasa_kg': biomasa_kg,
+            'biomasa_kg': lote.kpi_biomasa_kg,
         })
 
     # 2. Datos para Consumo de Alimento (Filtrado por mes y año)
@@ -1209,66 +1224,7 @@ def dashboard_analitico(request):
 
 @login_required
 def exportar_lotes_excel(request):
-    year = request.GET.get('year')
-    month = request.GET.get('month')
-    
-    # Filtramos los lotes activos que no sean ovas
-    lotes = Lote.objects.filter(etapa_actual__in=['ALEVINES', 'JUVENILES', 'ENGORDE'])
-    if year:
-        lotes = lotes.filter(fecha_ingreso_etapa__year=year)
-    if month:
-        lotes = lotes.filter(fecha_ingreso_etapa__month=month)
-
-    workbook = openpyxl.Workbook()
-    sheet = workbook.active
-    sheet.title = "Reporte de Lotes"
-
-    headers = [
-        "LOTE", "ETAPA", "FECHA", "BIOMASA (Kg)", "PROMEDIO (gr/Kg)", "PESO UNITARIO (Gr)", "TALLA UNITARIA (Cm)",
-        "NUMERO TOTAL DE PECES", "% DE RAC. ALI", "CONSUMO ALIMENTO (Kg)",
-        "CONV. ALIM (FCR)", "GANANCIA EN PESO (Gr)", "% MORT", "PECES MUERTOS (Unid)",
-        "TIPO DE DIETA"
-    ]
-    sheet.append(headers)
-
-    for lote in lotes:
-        # --- LÓGICA DE MORTALIDAD CORREGIDA ---
-        # Sumamos todos los registros de mortalidad para obtener el total real de bajas
-        peces_muertos = lote.registros_mortalidad.aggregate(total=Coalesce(Sum('cantidad'), 0))['total']
-        
-        # La cantidad inicial ahora es la actual más los que murieron
-        cantidad_inicial_calculada = lote.cantidad_total_peces + peces_muertos
-        
-        porc_mort = (peces_muertos / cantidad_inicial_calculada) * 100 if cantidad_inicial_calculada > 0 else 0
-        
-        # --- OTROS CÁLCULOS ---
-        biomasa_kg = float(lote.biomasa_kg)
-        peso_unitario_gr = float(lote.peso_promedio_pez_gr or 0)
-        promedio_gr_kg = (peso_unitario_gr * 1000) / biomasa_kg if biomasa_kg > 0 else 0
-        
-        sheet.append([
-            lote.codigo_lote,
-            lote.get_etapa_actual_display(),
-            lote.fecha_ingreso_etapa,
-            biomasa_kg,
-            round(promedio_gr_kg, 2),
-            peso_unitario_gr,
-            float(lote.talla_max_cm or 0),
-            lote.cantidad_total_peces,
-            float(lote.racion_alimentaria_porcentaje),
-            float(lote.alimento_diario_kg),
-            float(lote.conversion_alimenticia),
-            float(lote.ganancia_en_peso_gr),
-            round(porc_mort, 2), # <-- TASA DE MORTALIDAD AÑADIDA
-            peces_muertos,       # <-- PECES MUERTOS CORREGIDO
-            lote.tipo_alimento,
-        ])
-
-    response = HttpResponse(content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
-    response['Content-Disposition'] = 'attachment; filename="reporte_lotes.xlsx"'
-    workbook.save(response)
-
-    return response
+    return solicitar_reporte(request, 'lotes', parametros_periodo(request))
 
 class DashboardAnaliticoView(LoginRequiredMixin, PermissionRequiredMixin, View):
     permission_required = 'produccion.view_dashboard' # Crea este permiso si no existe
@@ -1282,24 +1238,18 @@ class DashboardAnaliticoView(LoginRequiredMixin, PermissionRequiredMixin, View):
         lotes_activos = Lote.objects.filter(
             etapa_actual__in=['ALEVINES', 'JUVENILES', 'ENGORDE'], # O tus criterios para lotes "activos"
             cantidad_total_peces__gt=0
-        ).annotate(
-            dias_en_etapa=F('fecha_ingreso_etapa__date') - timezone.now().date()
-        ).values(
-            'codigo_lote', 'etapa_actual', 'peso_promedio_pez_gr', 'cantidad_total_peces', 'fecha_ingreso_etapa'
+        ).with_kpis().values(
+            'codigo_lote', 'etapa_actual', 'peso_promedio_pez_gr', 'cantidad_total_peces', 'kpi_dias_en_etapa', 'kpi_biomasa_kg'
         )
 
         biomasa_progreso_data = []
         for lote in lotes_activos:
-            # Calcular días en etapa (abs() para asegurar positivo si la fecha_ingreso_etapa es en el futuro por error)
-            delta_dias = (timezone.now().date() - lote['fecha_ingreso_etapa']).days
-            dias_en_etapa = max(0, delta_dias) # Asegura que no sea negativo
-
             biomasa_progreso_data.append({
                 'codigo': lote['codigo_lote'],
                 'etapa': lote['etapa_actual'],
-                'dias_en_etapa': dias_en_etapa,
-                'peso_promedio_gr': float(lote['peso_promedio_pez_gr']),
-                'biomasa_kg': float((lote['cantidad_total_peces'] * lote['peso_promedio_pez_gr']) / Decimal(1000)),
+                'dias_en_etapa': max(0, lote['kpi_dias_en_etapa']), # Asegura que no sea negativo
+                'peso_promedio_gr': float(lote['peso_promedio_pez_gr'] or 0),
+                'biomasa_kg': float(lote['kpi_biomasa_kg']),
                 'cantidad_peces': lote['cantidad_total_peces']
             })
         context['biomasa_progreso_data'] = biomasa_progreso_data
@@ -1308,32 +1258,26 @@ class DashboardAnaliticoView(LoginRequiredMixin, PermissionRequiredMixin, View):
         hoy = timezone.now().date()
         ayer = hoy - timedelta(days=1)
 
-        # Agrupar consumo por tipo de alimento para hoy
-        consumo_hoy = RegistroDiario.objects.filter(
-            fecha=hoy,
-            lote__cantidad_total_peces__gt=0 # Solo lotes con peces
-        ).annotate(
-            alimento_diario_lote=F('lote__alimento_diario_kg'),
-            tipo_alimento_lote=F('lote__tipo_alimento')
-        ).values('tipo_alimento_lote').annotate(
-            total_kg=Coalesce(Sum('alimento_diario_lote'), Decimal(0.00), output_field=DecimalField())
-        ).order_by('tipo_alimento_lote')
+        # Agrupar consumo por tipo de alimento para hoy (lotes con registro diario ese día)
+        consumo_hoy = Lote.objects.filter(
+            registros_diarios__fecha=hoy,
+            cantidad_total_peces__gt=0 # Solo lotes con peces
+        ).with_kpis().values('kpi_tipo_alimento').annotate(
+            total_kg=Coalesce(Sum('kpi_alimento_diario_kg'), Decimal(0.00), output_field=DecimalField())
+        ).order_by('kpi_tipo_alimento')
         
         # Agrupar consumo por tipo de alimento para ayer
-        consumo_ayer = RegistroDiario.objects.filter(
-            fecha=ayer,
-            lote__cantidad_total_peces__gt=0
-        ).annotate(
-            alimento_diario_lote=F('lote__alimento_diario_kg'),
-            tipo_alimento_lote=F('lote__tipo_alimento')
-        ).values('tipo_alimento_lote').annotate(
-            total_kg=Coalesce(Sum('alimento_diario_lote'), Decimal(0.00), output_field=DecimalField())
-        ).order_by('tipo_alimento_lote')
+        consumo_ayer = Lote.objects.filter(
+            registros_diarios__fecha=ayer,
+            cantidad_total_peces__gt=0
+        ).with_kpis().values('kpi_tipo_alimento').annotate(
+            total_kg=Coalesce(Sum('kpi_alimento_diario_kg'), Decimal(0.00), output_field=DecimalField())
+        ).order_by('kpi_tipo_alimento')
 
         # Formatear para el gráfico
-        tipos_alimento = sorted(list(set([c['tipo_alimento_lote'] for c in consumo_hoy] + [c['tipo_alimento_lote'] for c in consumo_ayer])))
-        consumo_hoy_map = {c['tipo_alimento_lote']: float(c['total_kg']) for c in consumo_hoy}
-        consumo_ayer_map = {c['tipo_alimento_lote']: float(c['total_kg']) for c in consumo_ayer}
+        consumo_hoy_map = {c['kpi_tipo_alimento']: float(c['total_kg']) for c in consumo_hoy}
+        consumo_ayer_map = {c['kpi_tipo_alimento']: float(c['total_kg']) for c in consumo_ayer}
+        tipos_alimento = sorted(set(consumo_hoy_map) | set(consumo_ayer_map))
 
         context['consumo_alimento_data'] = {
             'labels': tipos_alimento,
@@ -1389,9 +1333,10 @@ class DashboardAnaliticoView(LoginRequiredMixin, PermissionRequiredMixin, View):
         # un FCR global exacto sin datos más detallados de alimentación histórica.
         fcr_promedio = Lote.objects.filter(
             cantidad_total_peces__gt=0, # Lotes activos
-            conversion_alimenticia__gt=0 # Solo lotes con FCR calculable
+        ).with_kpis().filter(
+            kpi_conversion_alimenticia__gt=0 # Solo lotes con FCR calculable
         ).aggregate(
-            avg_fcr=Coalesce(Avg('conversion_alimenticia'), Decimal(0.00))
+            avg_fcr=Coalesce(Avg('kpi_conversion_alimenticia'), Decimal(0.00), output_field=DecimalField())
         )['avg_fcr']
 
         context['total_biomasa_produccion'] = total_biomasa_produccion
@@ -1433,21 +1378,16 @@ def prediccion_salud_view(request):
             lote = form.cleaned_data['lote']
 
             try:
-                # service = DiagnosticoService() # COMENTAR O ELIMINAR
-                # Buscar el último registro de condiciones para el lote
-                registro_condiciones = RegistroCondiciones.objects.filter(lote=lote).order_by('-fecha').first()
-                
-                if not registro_condiciones:
-                    # Si no hay datos, lanzamos una excepción para ser capturada
+                # predecir_batch lee las últimas condiciones con ultimas_condiciones,
+                # la misma consulta que el diagnóstico masivo
+                resultados = DiagnosticoService().predecir_batch([lote])
+                if not resultados:
                     raise ValueError("No existen registros de condiciones para este lote. Por favor, ingrese los datos primero.")
-                
-                # Realizar el diagnóstico usando el servicio
-                # resultado = service.predecir(lote, registro_condiciones) # COMENTAR O ELIMINAR
-                
+                resultado = resultados[0]
             except ValueError as e:
                 error_message = str(e)
-            # except FileNotFoundError: # COMENTAR O ELIMINAR
-            #     error_message = "El modelo de predicción no está disponible. Por favor, entrene el modelo." # COMENTAR O ELIMINAR
+            except FileNotFoundError:
+                error_message = "El modelo de predicción no está disponible. Por favor, entrene el modelo."
             except Exception as e:
                 error_message = f"Ocurrió un error inesperado al predecir: {e}"
 
@@ -1457,13 +1397,6 @@ def prediccion_salud_view(request):
         'resultado': resultado,
         'error_message': error_message,
     })
-# --- Definimos las rutas a los archivos ---
-MODEL_PATH = os.path.join(settings.BASE_DIR, 'produccion', 'ia', 'predictores', 'diagnostico_model.joblib')
-COLUMNS_PATH = os.path.join(settings.BASE_DIR, 'produccion', 'ia', 'predictores', 'diagnostico_features.joblib')
-
-# --- Dejamos las variables del modelo como None inicialmente ---
-DIAGNOSTICO_MODEL = None
-FEATURE_COLUMNS = None
 
 # Diccionario de explicaciones (simulado)
 EXPLICACIONES = {
@@ -1474,25 +1407,8 @@ EXPLICACIONES = {
 }
 
 def prediccion_diagnostico_view(request):
-    global DIAGNOSTICO_MODEL, FEATURE_COLUMNS # Usaremos las variables globales
-
-    # --- Lazy Loading: Cargamos el modelo solo si no ha sido cargado antes ---
-    # if DIAGNOSTICO_MODEL is None: # COMENTAR O ELIMINAR
-    #     try: # COMENTAR O ELIMINAR
-    #         DIAGNOSTICO_MODEL = joblib.load(MODEL_PATH) # COMENTAR O ELIMINAR
-    #         FEATURE_COLUMNS = joblib.load(COLUMNS_PATH) # COMENTAR O ELIMINAR
-    #     except FileNotFoundError: # COMENTAR O ELIMINAR
-    #         # Si el archivo no existe, no podemos hacer predicciones. # COMENTAR O ELIMINAR
-    #         # Esto es normal si el modelo aún no se ha entrenado. # COMENTAR O ELIMINAR
-    #         pass # COMENTAR O ELIMINAR
-
     context = {}
     if request.method == 'POST':
-        # Asegurarnos de que el modelo esté cargado antes de intentar predecir
-        # if DIAGNOSTICO_MODEL is None: # COMENTAR O ELIMINAR
-        #    context['error'] = "El modelo de diagnóstico aún no ha sido entrenado. Por favor, ejecute el comando 'entrenar_modelo_diagnostico' desde la terminal." # COMENTAR O ELIMINAR
-        #    return render(request, 'produccion/prediccion_diagnostico.html', context) # COMENTAR O ELIMINAR
-            
         try:
             # 1. Recolectar datos del formulario
             input_data = {
@@ -1532,55 +1448,6 @@ def prediccion_diagnostico_view(request):
     return render(request, 'produccion/prediccion_diagnostico.html', context)
 
 
-# --- Cargar el modelo y las columnas ---
-# COMENTAR O ELIMINAR LAS SIGUIENTES 3 LÍNEAS
-# MODEL_PATH = os.path.join(settings.BASE_DIR, 'produccion', 'ia', 'predictores', 'diagnostico_model.joblib')
-# COLUMNS_PATH = os.path.join(settings.BASE_DIR, 'produccion', 'ia', 'predictores', 'diagnostico_features.joblib')
-# DIAGNOSTICO_MODEL = None
-
-# --- Base de Conocimiento Ampliada con Enfermedades Típicas de Trucha ---
-KNOWLEDGE_BASE = {
-    "Sano": {
-        "explicacion": "La simulación de los parámetros del agua y la ausencia de síntomas indican que el lote se encuentra en condiciones óptimas y sin riesgo aparente.",
-        "plan_de_accion": [
-            "**Acción Inmediata:** No se requiere ninguna acción correctiva.",
-            "**Control Ambiental:** Continuar con las buenas prácticas de manejo y monitoreo de rutina.",
-            "**Monitoreo:** Mantener la frecuencia de medición de parámetros y observación del comportamiento."
-        ]
-    },
-    "Saprolegniasis": { # Hongo
-        "explicacion": "La simulación arrojó una combinación de baja temperatura y estrés (posiblemente por un pico de amoniaco), condiciones ideales para brotes de hongos como Saprolegniasis.",
-        "plan_de_accion": [
-            "**Acción Inmediata:** Realizar baños terapéuticos con sal (NaCl) al 2-3% durante 30 minutos.",
-            "**Control Ambiental:** Aumentar ligeramente la temperatura del agua si es posible y reducir la alimentación para bajar los niveles de amoniaco.",
-            "**Monitoreo:** Vigilar de cerca la aparición de lesiones algodonosas en otros peces del lote."
-        ]
-    },
-    "Punto Blanco (Ich)": { # Parásito
-        "explicacion": "El comportamiento anormal (frotamiento) y el estrés ambiental simulado sugieren una posible infestación por Ichthyophthirius multifiliis, el parásito causante del punto blanco.",
-        "plan_de_accion": [
-            "**Acción Inmediata:** Consultar a un especialista para aplicar un tratamiento antiparasitario (ej: formalina o verde de malaquita).",
-            "**Control Ambiental:** Aumentar gradualmente la temperatura del agua a 15-18°C por unos días para acelerar el ciclo de vida del parásito y hacerlo vulnerable al tratamiento.",
-            "**Monitoreo:** Observar la aparición de pequeños puntos blancos (como granos de sal) en la piel y aletas."
-        ]
-    },
-    "Columnaris": { # Bacteria
-        "explicacion": "Un evento de estrés simulado (como falta de limpieza) pudo haber elevado el amoniaco, favoreciendo una infección bacteriana por Flavobacterium columnare, que afecta piel y branquias.",
-        "plan_de_accion": [
-            "**Acción Inmediata:** Aplicar un tratamiento antibacteriano en el agua o alimento según recomendación experta (ej: Oxitetraciclina).",
-            "**Control Ambiental:** Realizar una limpieza profunda y un recambio de agua parcial para reducir la carga bacteriana.",
-            "**Monitoreo:** Buscar síntomas como aletas deshilachadas, lesiones de aspecto pálido en la piel o dificultad para respirar."
-        ]
-    },
-    "Estres_por_hipoxia": {
-        "explicacion": "La simulación generó un escenario de bajo oxígeno disuelto, crítico en piscigranjas de altura. Esto no es una enfermedad, sino una condición ambiental peligrosa.",
-        "plan_de_accion": [
-            "**¡ACCIÓN URGENTE!:** Incrementar la aireación inmediatamente. Activar aireadores de emergencia si están disponibles.",
-            "**Control Ambiental:** Reducir o detener la alimentación por completo hasta que los niveles de oxígeno se estabilicen (> 7 mg/L).",
-            "**Monitoreo:** Medir el oxígeno cada hora hasta que la situación se normalice."
-        ]
-    }
-}
 def simular_parametros_actuales(lote):
     """
     SIMULACIÓN AVANZADA:
@@ -1640,15 +1507,6 @@ def simular_parametros_actuales(lote):
 
 @login_required
 def diagnostico_por_lote_view(request):
-    # Ya no es necesario cargar el modelo global
-    # global DIAGNOSTICO_MODEL, FEATURE_COLUMNS
-    # if DIAGNOSTICO_MODEL is None:
-    #     try:
-    #         DIAGNOSTICO_MODEL = joblib.load(MODEL_PATH)
-    #         FEATURE_COLUMNS = joblib.load(COLUMNS_PATH)
-    #     except FileNotFoundError:
-    #         pass
-
     lotes = Lote.objects.filter(activo=True).order_by('-fecha_ingreso_etapa')
     context = {'lotes': lotes}
 
@@ -1661,26 +1519,14 @@ def diagnostico_por_lote_view(request):
         selected_lote = get_object_or_404(Lote, id=lote_id)
         context['selected_lote'] = selected_lote
 
-        # Reemplazamos la lógica de predicción del modelo de ML con un sistema experto
-        registro_condiciones = RegistroCondiciones.objects.filter(lote=selected_lote).order_by('-fecha').first()
-        
-        if not registro_condiciones:
+        # Mismas reglas que el diagnóstico masivo (produccion/ia/diagnostico_lotes.py)
+        fila = diagnosticar_lotes(Lote.objects.filter(pk=selected_lote.pk))[0]
+
+        if fila['nivel_riesgo'] == 'SIN_DATOS':
             context['error_message'] = "No existen registros de condiciones para este lote. Por favor, ingrese los datos primero."
             return render(request, 'produccion/diagnostico_por_lote.html', context)
 
-        # Lógica del sistema experto simplificado
-        diagnostico_principal = "Sano"
-        
-        # Ejemplo de reglas:
-        if registro_condiciones.temp_agua_c is not None and registro_condiciones.temp_agua_c < 6.0:
-            diagnostico_principal = "Saprolegniasis" # Posible hongo por baja temperatura
-        elif registro_condiciones.ph is not None and (registro_condiciones.ph < 6.8 or registro_condiciones.ph > 8.0):
-            diagnostico_principal = "Columnaris" # Posible infección bacteriana por estrés de pH
-        elif registro_condiciones.oxigeno_mg_l is not None and registro_condiciones.oxigeno_mg_l < 5.0:
-            diagnostico_principal = "Estres_por_hipoxia" # Bajo oxígeno
-
-        # Aquí podrías añadir más reglas o combinar los datos con observaciones manuales si existieran
-        
+        diagnostico_principal = fila['diagnostico']
         context['resultado'] = {
             'lote': selected_lote,
             'nivel_riesgo': diagnostico_principal,
@@ -1692,6 +1538,25 @@ def diagnostico_por_lote_view(request):
     return render(request, 'produccion/diagnostico_por_lote.html', context)
 
 
+@login_required
+def riesgo_sanitario_view(request):
+    """
+    Tabla de riesgo sanitario de todos los lotes activos en una sola petición.
+    Con ?formato=json devuelve la misma tabla para otras integraciones.
+    """
+    tabla = diagnosticar_lotes()
+    resumen = resumen_por_nivel(tabla)
+
+    if request.GET.get('formato') == 'json':
+        return JsonResponse({'fecha': timezone.localdate(), 'resumen': resumen, 'lotes': tabla})
+
+    return render(request, 'produccion/riesgo_sanitario.html', {
+        'tabla': tabla,
+        'resumen': resumen,
+        'fecha': timezone.localdate(),
+    })
+
+
 @login_required
 def get_condiciones_json(request, lote_id):
     """
@@ -1739,4 +1604,155 @@ def save_condiciones_json(request, lote_id):
         except Exception as e:
             return JsonResponse({'success': False, 'error': f"Error al guardar: {e}"}, status=400)
     
-    return JsonResponse({'error': 'Método no permitido.'}, status=405)
\ No newline at end of file
+    return JsonResponse({'error': 'Método no permitido.'}, status=405)
+
+
+# Unidades que pueden tener sensores, por el nombre que se usa en la URL
+UNIDADES_CON_SENSORES = {'bastidor': Bastidor, 'artesa': Artesa, 'jaula': Jaula}
+
+
+def _parametro_momento(valor, por_defecto):
+    # Acepta fecha (YYYY-MM-DD) o fecha y hora ISO; sin zona horaria se toma la local
+    if not valor:
+        return por_defecto
+    momento = parse_datetime(valor)
+    if momento is None:
+        fecha = parse_date(valor)
+        if fecha is None:
+            raise ValueError(f"Fecha inválida: {valor}")
+        momento = datetime.combine(fecha, time.min)
+    return timezone.make_aware(momento) if timezone.is_naive(momento) else momento
+
+
+@login_required
+def serie_condiciones_json(request, tipo, pk):
+    """
+    Serie de tiempo de una variable del agua para una unidad
+    (?variable=&desde=&hasta=&intervalo=minutos). Por defecto, los últimos 7 días.
+    """
+    if tipo not in UNIDADES_CON_SENSORES:
+        return JsonResponse({'error': 'Tipo de unidad desconocido.'}, status=404)
+    unidad = get_object_or_404(UNIDADES_CON_SENSORES[tipo], pk=pk)
+
+    try:
+        hasta = _parametro_momento(request.GET.get('hasta'), timezone.now())
+        desde = _parametro_momento(request.GET.get('desde'), hasta - timedelta(days=7))
+        minutos = request.GET.get('intervalo', '')
+        intervalo = timedelta(minutes=int(minutos)) if minutos else None
+        if desde >= hasta or (intervalo is not None and intervalo <= timedelta(0)):
+            raise ValueError("El rango o el intervalo no son válidos.")
+        serie = serie_condiciones(unidad, request.GET.get('variable', 'temp_agua_c'), desde, hasta, intervalo)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    serie.update({'unidad': str(unidad), 'desde': desde, 'hasta': hasta})
+    return JsonResponse(serie)
+
+
+@login_required
+def pronostico_crecimiento_json(request):
+    """
+    Pronóstico de la granja (?dias=, hasta HORIZONTE_DIAS): biomasa y peces
+    totales por día y, por lote, el peso cada 30 días y la fecha de cosecha.
+    """
+    try:
+        dias = int(request.GET.get('dias', HORIZONTE_DIAS))
+    except ValueError:
+        dias = 0
+    if not 1 <= dias <= HORIZONTE_DIAS:
+        return JsonResponse({'error': f"dias debe estar entre 1 y {HORIZONTE_DIAS}."}, status=400)
+
+    pronostico = pronostico_crecimiento()
+    biomasa = pronostico.biomasa_kg[:, :dias + 1]
+    hitos = list(range(30, dias + 1, 30)) or [dias]
+    lotes = [
+        {
+            'id': lote_id,
+            'codigo': pronostico.codigos[i],
+            'etapa': pronostico.etapas[i],
+            'tgc': round(float(pronostico.tgc[i]), 3),
+            'tgc_ajustado': bool(pronostico.ajustado[i]),
+            'temperatura_c': round(float(pronostico.temperatura[i]), 2),
+            'peso_gr': {dia: round(float(pronostico.peso_gr[i, dia]), 1) for dia in [0, *hitos]},
+            'biomasa_kg': {dia: round(float(biomasa[i, dia]), 1) for dia in [0, *hitos]},
+            'fecha_cosecha': pronostico.fecha_cosecha(i),
+        }
+        for i, lote_id in enumerate(pronostico.lote_ids)
+    ]
+    return JsonResponse({
+        'fecha': pronostico.fecha,
+        'peso_cosecha_gr': PESO_COSECHA_GR,
+        'granja': {
+            'fechas': pronostico.fechas[:dias + 1],
+            'biomasa_kg': np.round(biomasa.sum(axis=0), 1).tolist(),
+            'peces': pronostico.peces[:, :dias + 1].sum(axis=0).astype(int).tolist(),
+        },
+        'lotes': lotes,
+    })
+
+
+def _token_sensores_valido(request):
+    esperado = settings.SENSORES_API_TOKEN
+    tipo, _, token = request.headers.get('Authorization', '').partition(' ')
+    return bool(esperado) and tipo == 'Token' and hmac.compare_digest(token.strip(), esperado)
+
+
+@csrf_exempt
+@require_POST
+def ingresar_lecturas_sensores(request):
+    """
+    Ingesta masiva de lecturas para los equipos de la granja. El cuerpo es
+    NDJSON (application/x-ndjson) o CSV (text/csv) con las columnas unidad
+    (o lote), momento y las variables del agua. Se autentica con
+    "Authorization: Token <SENSORES_API_TOKEN>" en lugar de la sesión.
+    """
+    if not _token_sensores_valido(request):
+        return JsonResponse({'error': 'Token inválido.'}, status=401)
+
+    tipo_contenido = request.content_type
+    if tipo_contenido == 'text/csv':
+        formato = FORMATO_CSV
+    elif tipo_contenido in ('application/x-ndjson', 'application/jsonl', 'application/json'):
+        formato = FORMATO_NDJSON
+    else:
+        return JsonResponse({'error': 'Use application/x-ndjson o text/csv.'}, status=415)
+
+    try:
+        resultado = ingresar_lecturas(request.body, formato)
+    except ValueError as e:
+        return JsonResponse({'error': f"No se pudo leer el envío: {e}"}, status=400)
+    return JsonResponse(resultado, status=200 if resultado['aceptadas'] else 400)
+
+
+# ================================================================
+# REPORTES EN SEGUNDO PLANO
+# ================================================================
+
+def _obtener_trabajo(request, pk):
+    # Cada usuario solo ve sus propios reportes (el staff ve todos)
+    trabajos = TrabajoReporte.objects.all()
+    if not request.user.is_staff:
+        trabajos = trabajos.filter(usuario=request.user)
+    return get_object_or_404(trabajos, pk=pk)
+
+
+@login_required
+def estado_reporte(request, pk):
+    """Página de espera; con ?formato=json devuelve el estado para el sondeo."""
+    trabajo = _obtener_trabajo(request, pk)
+    if request.GET.get('formato') == 'json':
+        return JsonResponse({
+            'estado': trabajo.estado,
+            'error': trabajo.error,
+            'url_descarga': reverse('reporte-descargar', args=[trabajo.pk]) if trabajo.estado == 'COMPLETADO' else None,
+        })
+    return render(request, 'produccion/reporte_estado.html', {'trabajo': trabajo})
+
+
+@login_required
+def descargar_reporte(request, pk):
+    trabajo = _obtener_trabajo(request, pk)
+    if trabajo.estado != 'COMPLETADO' or not trabajo.archivo_disponible:
+        messages.warning(request, "El reporte todavía no está disponible.")
+        return redirect('reporte-estado', pk=trabajo.pk)
+    return respuesta_descarga(trabajo)
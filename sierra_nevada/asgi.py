@@ -5,6 +5,14 @@ It exposes the ASGI callable as a module-level variable named ``application``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
+
+El canal de eventos en vivo (/produccion/eventos/, server-sent events) solo
+funciona servido por ASGI, por ejemplo:
+
+    uvicorn sierra_nevada.asgi:application
+
+Con el broker en memoria (settings.EVENTOS_BROKER) debe correr un solo
+proceso ASGI para que todas las conexiones reciban los eventos.
 """
 
 import os
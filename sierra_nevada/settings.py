@@ -120,13 +120,72 @@ STATICFILES_DIRS = [
 
 STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 
+# Archivos generados por la aplicación (reportes exportados)
+MEDIA_URL = 'media/'
+MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+
+# Minutos durante los que se reutiliza un reporte ya generado con los mismos filtros
+REPORTES_CACHE_MINUTOS = 30
+
+# --- Caché ---
+# Con varios procesos (gunicorn, celery) la caché debe ser compartida para que
+# las invalidaciones lleguen a todos: definir REDIS_CACHE_URL en producción
+CACHE_COMPARTIDA = bool(os.environ.get('REDIS_CACHE_URL'))
+if CACHE_COMPARTIDA:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['REDIS_CACHE_URL'],
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+# Vigencia máxima del feed de notificaciones; las señales lo invalidan antes si cambia algo.
+# Sin caché compartida la invalidación (p. ej. desde una tarea de Celery) no llega
+# a los demás procesos: el feed y su ETag se recalculan a los pocos segundos
+NOTIFICACIONES_CACHE_SEGUNDOS = 300 if CACHE_COMPARTIDA else 5
+
+# Grupos (roles) de cada usuario; usuarios/signals.py los invalida al cambiar.
+# Con la caché local la invalidación solo llega al proceso que guardó el cambio:
+# los demás deben volver a leer pronto
+GRUPOS_CACHE_SEGUNDOS = 60 * 60 if CACHE_COMPARTIDA else 30
+
+# Pronóstico de crecimiento (produccion/crecimiento.py): se calcula una vez por día
+# y los cambios de lotes o condiciones lo invalidan; sin caché compartida los
+# demás procesos no ven la invalidación y lo recalculan cada minuto
+PRONOSTICO_CACHE_SEGUNDOS = 60 * 60 * 24 if CACHE_COMPARTIDA else 60
+
+# Las reglas de alerta compiladas se releen cada tanto si la caché no es
+# compartida (ver produccion/alertas.py); con Redis basta la invalidación
+REGLAS_ALERTA_SEGUNDOS = None if CACHE_COMPARTIDA else 30
+
+# Canal de eventos en vivo (SSE). El broker en memoria solo reparte dentro del
+# proceso ASGI; con varios procesos hace falta uno compartido con la misma interfaz
+EVENTOS_BROKER = 'produccion.eventos.BrokerMemoria'
+EVENTOS_KEEPALIVE_SEGUNDOS = 25
+
+# Cargar los modelos de IA al iniciar cada worker (ver produccion/ia/registro_modelos.py)
+IA_PRECARGAR_MODELOS = os.environ.get('IA_PRECARGAR_MODELOS') == '1'
+
+# Ingesta de lecturas de sensores (api/sensores/lecturas/). Los equipos envían
+# "Authorization: Token <SENSORES_API_TOKEN>"; sin token la API queda desactivada
+SENSORES_API_TOKEN = os.environ.get('SENSORES_API_TOKEN', '')
+
 
 
 
 
 # --- Configuración de Celery ---
-CELERY_BROKER_URL = 'redis://localhost:6379/0'
-CELERY_RESULT_BACKEND = 'redis://localhost:6379/0'
+# Para pruebas locales sin Redis: CELERY_TASK_ALWAYS_EAGER=1 ejecuta las tareas
+# en el mismo proceso y usa un broker en memoria
+CELERY_TASK_ALWAYS_EAGER = os.environ.get('CELERY_TASK_ALWAYS_EAGER') == '1'
+CELERY_BROKER_URL = os.environ.get('CELERY_BROKER_URL', 'memory://' if CELERY_TASK_ALWAYS_EAGER else 'redis://localhost:6379/0')
+CELERY_RESULT_BACKEND = os.environ.get('CELERY_RESULT_BACKEND', 'cache+memory://' if CELERY_TASK_ALWAYS_EAGER else 'redis://localhost:6379/0')
 CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
@@ -140,4 +199,16 @@ CELERY_BEAT_SCHEDULE = {
         # from celery.schedules import crontab
         # 'schedule': crontab(hour=1, minute=5),
     },
+    'cerrar-periodo-inventario': {
+        'task': 'logistica.tasks.cerrar_periodo_inventario',
+        'schedule': timedelta(days=1), # Arrastra los saldos de inventario al mes actual
+    },
+    'diagnosticar-lotes-activos': {
+        'task': 'produccion.tasks.diagnosticar_lotes_activos',
+        'schedule': timedelta(days=1), # Tabla de riesgo sanitario para la revisión de la mañana
+    },
+    'planificar-reposicion-insumos': {
+        'task': 'logistica.tasks.planificar_reposicion_insumos',
+        'schedule': timedelta(days=1), # Órdenes de compra en borrador según el consumo
+    },
 } 
\ No newline at end of file
@@ -0,0 +1,40 @@
+from django.conf import settings
+from django.core.cache import cache
+
+# ================================================================
+# GRUPOS (ROLES) DEL USUARIO EN CACHÉ
+# ================================================================
+# Los grupos se leen con una sola consulta y se guardan en el propio objeto
+# user (dura lo que la petición) y en la caché (entre peticiones).
+# usuarios/signals.py borra la entrada cuando cambia la pertenencia; sin caché
+# compartida GRUPOS_CACHE_SEGUNDOS es corto para que los demás procesos no
+# sigan usando roles quitados.
+
+ATRIBUTO_GRUPOS = '_grupos_cache'
+
+
+def _clave(user_id):
+    return f"usuarios:grupos:{user_id}"
+
+
+def grupos_usuario(user):
+    """Nombres de los grupos del usuario como frozenset."""
+    if not user.is_authenticated:
+        return frozenset()
+    grupos = getattr(user, ATRIBUTO_GRUPOS, None)
+    if grupos is None:
+        grupos = cache.get(_clave(user.pk))
+        if grupos is None:
+            grupos = frozenset(user.groups.values_list('name', flat=True))
+            cache.set(_clave(user.pk), grupos, settings.GRUPOS_CACHE_SEGUNDOS)
+        setattr(user, ATRIBUTO_GRUPOS, grupos)
+    return grupos
+
+
+def tiene_grupo(user, *nombres):
+    """True si el usuario pertenece a alguno de los grupos indicados."""
+    return not grupos_usuario(user).isdisjoint(nombres)
+
+
+def invalidar_grupos(user_ids):
+    cache.delete_many([_clave(user_id) for user_id in user_ids])
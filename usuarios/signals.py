@@ -0,0 +1,32 @@
+from django.contrib.auth.models import Group
+from django.db.models.signals import m2m_changed, post_save, pre_delete
+from django.dispatch import receiver
+from .models import CustomUser
+from .roles import ATRIBUTO_GRUPOS, invalidar_grupos
+
+@receiver(m2m_changed, sender=CustomUser.groups.through)
+def invalidar_grupos_on_change(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    Descarta los grupos en caché cuando cambia la pertenencia, tanto desde el
+    usuario (user.groups.set) como desde el grupo (group.customuser_set.add).
+    """
+    if action == 'pre_clear' and reverse:
+        # Después del clear ya no se sabe qué usuarios tenía el grupo
+        instance._usuarios_previos = list(instance.customuser_set.values_list('pk', flat=True))
+        return
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+
+    if reverse:
+        user_ids = pk_set if action != 'post_clear' else getattr(instance, '_usuarios_previos', [])
+    else:
+        user_ids = [instance.pk]
+        instance.__dict__.pop(ATRIBUTO_GRUPOS, None)
+    invalidar_grupos(user_ids or [])
+
+@receiver(post_save, sender=Group)
+@receiver(pre_delete, sender=Group)
+def invalidar_grupos_de_miembros(sender, instance, **kwargs):
+    """Un grupo renombrado o eliminado cambia los roles de todos sus miembros."""
+    if instance.pk:
+        invalidar_grupos(instance.customuser_set.values_list('pk', flat=True))
@@ -1,8 +1,9 @@
 from django import template
+from usuarios.roles import tiene_grupo
 
 register = template.Library()
 
 @register.filter(name='has_group')
 def has_group(user, group_name):
-    """Verifica si un usuario pertenece a un grupo específico."""
-    return user.groups.filter(name=group_name).exists()
\ No newline at end of file
+    """Verifica si un usuario pertenece a un grupo específico (sin consultar cada vez)."""
+    return tiene_grupo(user, group_name)
\ No newline at end of file